@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""Microbenchmark: per-pattern `choose_category` vs the compiled `KeywordClassifier`.
+
+Usage:
+  python bench/bench_classify.py [--keywords config/keywords.yaml] [--size 200000] [--docs 20]
+"""
+import argparse, os, random, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import yaml
+from grants_harvester.util.classify import choose_category, KeywordClassifier
+
+FILLER = ("本事業は地域における取組を支援するものです。申請書類は所定の様式により提出してください。"
+          "詳細は募集要項をご確認ください。お問い合わせは担当課までお願いします。")
+WORDS = ["医療", "介護", "DX", "補助金", "働き方", "ICT", "看護", "研修", "人材", "生産性"]
+
+def make_docs(n: int, size: int, seed: int = 0):
+    rnd = random.Random(seed)
+    docs = []
+    for _ in range(n):
+        parts, length = [], 0
+        while length < size:
+            chunk = FILLER if rnd.random() < 0.97 else rnd.choice(WORDS)
+            parts.append(chunk)
+            length += len(chunk)
+        docs.append("".join(parts))
+    return docs
+
+def timed(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--keywords", default="config/keywords.yaml")
+    ap.add_argument("--size", type=int, default=200_000, help="characters per document")
+    ap.add_argument("--docs", type=int, default=20)
+    args = ap.parse_args()
+
+    with open(args.keywords, "r", encoding="utf-8") as f:
+        cats = yaml.safe_load(f).get("categories", {})
+    docs = make_docs(args.docs, args.size)
+
+    t_old, old = timed(lambda: [choose_category(d, cats) for d in docs])
+    t_build, clf = timed(lambda: KeywordClassifier(cats))
+    t_new, new = timed(lambda: [clf(d) for d in docs])
+    t_batch, batch = timed(lambda: clf.classify_many(docs))
+    assert old == new == batch, "classifier results differ"
+
+    mb = sum(len(d) for d in docs) / 1e6
+    print(f"docs={len(docs)} chars={mb:.1f}M")
+    print(f"choose_category          {t_old:8.3f}s")
+    print(f"KeywordClassifier build  {t_build * 1000:8.3f}ms")
+    print(f"KeywordClassifier        {t_new:8.3f}s  x{t_old / t_new:.1f}")
+    print(f"classify_many            {t_batch:8.3f}s  x{t_old / t_batch:.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""Synthetic corpora and a local fixture HTTP server for the benchmarks.
+
+Everything is generated deterministically from a seed, so two runs of the suite
+serve byte-identical content and their timings can be compared.
+"""
+import gzip, hashlib, random, threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+MUNICIPALITIES = ["札幌市", "仙台市", "千代田区", "横浜市", "川崎市", "名古屋市", "京都市", "大阪市", "神戸市", "福岡市"]
+TOPICS = ["医療DX推進", "介護ロボット導入支援", "訪問看護ICT化", "地域医療連携", "介護人材確保",
+          "中小企業デジタル化", "働き方改革推進", "省エネ設備導入", "商店街活性化", "子育て支援"]
+FILLER = ("本事業は地域における取組を支援するものです。申請書類は所定の様式により提出してください。"
+          "詳細は募集要項をご確認ください。お問い合わせは担当課までお願いします。")
+
+def _title(rnd: random.Random, i: int) -> str:
+    return f"令和7年度{rnd.choice(MUNICIPALITIES)}{rnd.choice(TOPICS)}補助金のお知らせ（第{i}号）"
+
+def _period(rnd: random.Random) -> str:
+    m = rnd.randint(1, 10)
+    return f"募集期間：令和7年{m}月{rnd.randint(1, 28)}日～令和7年{m + 2}月{rnd.randint(1, 28)}日"
+
+def _lastmod(i: int) -> str:
+    return f"2025-{1 + i % 12:02d}-{1 + i % 28:02d}"
+
+def make_pdf(pages: List[List[str]]) -> bytes:
+    """Minimal multi-page PDF writer (Helvetica, Latin-1 text) so no PDF library is needed."""
+    objs: List[bytes] = []
+
+    def add(b: bytes) -> int:
+        objs.append(b)
+        return len(objs)
+
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    pages_id = len(objs) + 1 + 2 * len(pages)
+    page_ids = []
+    for lines in pages:
+        stream = b"BT /F1 12 Tf 72 720 Td 14 TL " + b" ".join(
+            b"(" + l.encode("latin-1") + b") '" for l in lines) + b" ET"
+        c = add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        page_ids.append(add(b"<< /Type /Page /Parent %d 0 R /Resources << /Font << /F1 %d 0 R >> >> "
+                            b"/MediaBox [0 0 612 792] /Contents %d 0 R >>" % (pages_id, font, c)))
+    add(b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % i for i in page_ids)
+        + b"] /Count %d >>" % len(page_ids))
+    cat = add(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, o in enumerate(objs, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % i + o + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objs) + 1)
+    out += b"".join(b"%010d 00000 n \n" % o for o in offsets)
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objs) + 1, cat, xref)
+    return bytes(out)
+
+class Corpus:
+    """Path -> (body, content type). Sizes scale linearly with `scale` (1 = default)."""
+    def __init__(self, scale: float = 1.0, seed: int = 0):
+        self.scale = scale
+        self.seed = seed
+        self.files: Dict[str, Tuple[bytes, str]] = {}
+        self._build()
+
+    def n(self, base: int) -> int:
+        return max(1, int(base * self.scale))
+
+    def _put(self, path: str, body, ctype: str):
+        self.files[path] = (body.encode("utf-8") if isinstance(body, str) else body, ctype)
+
+    def _build(self):
+        rnd = random.Random(self.seed)
+        self._build_sitemaps(rnd)
+        self._build_rss(rnd)
+        self._build_html(rnd)
+        self._build_pdfs(rnd)
+
+    def _build_sitemaps(self, rnd: random.Random):
+        # index -> 子インデックス -> .xml.gz のサイトマップ、の3階層
+        ns = 'xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"'
+        children = []
+        url_no = 0
+        for i in range(self.n(4)):
+            maps = []
+            for j in range(self.n(5)):
+                urls = []
+                for _ in range(self.n(500)):
+                    section = "kenko/hojo" if url_no % 3 == 0 else "kurashi/info"
+                    urls.append(f"<url><loc>{{base}}/{section}/{url_no}.html</loc>"
+                                f"<lastmod>{_lastmod(url_no)}</lastmod></url>")
+                    url_no += 1
+                path = f"/sitemaps/sm_{i}_{j}.xml.gz"
+                body = f'<?xml version="1.0" encoding="UTF-8"?><urlset {ns}>{"".join(urls)}</urlset>'
+                self._put(path, gzip.compress(body.encode("utf-8"), mtime=0), "application/x-gzip")
+                maps.append(f"<sitemap><loc>{{base}}{path}</loc><lastmod>{_lastmod(i + j)}</lastmod></sitemap>")
+            path = f"/sitemaps/index_{i}.xml"
+            self._put(path, f'<?xml version="1.0" encoding="UTF-8"?><sitemapindex {ns}>{"".join(maps)}</sitemapindex>',
+                      "application/xml")
+            children.append(f"<sitemap><loc>{{base}}{path}</loc></sitemap>")
+        self._put("/sitemap.xml", f'<?xml version="1.0" encoding="UTF-8"?><sitemapindex {ns}>{"".join(children)}</sitemapindex>',
+                  "application/xml")
+        self.sitemap_urls = url_no
+
+    def _build_rss(self, rnd: random.Random):
+        items = []
+        for i in range(self.n(5000)):
+            items.append(f"<item><title>{_title(rnd, i)}</title><link>{{base}}/news/{i}.html</link>"
+                         f"<description>{FILLER}{_period(rnd)}</description>"
+                         f"<pubDate>Tue, 01 Apr 2025 09:00:00 +0900</pubDate></item>")
+        self._put("/rss.xml", f'<?xml version="1.0" encoding="UTF-8"?><rss version="2.0"><channel>'
+                              f'<title>新着情報</title>{"".join(items)}</channel></rss>', "application/rss+xml")
+
+    def _build_html(self, rnd: random.Random):
+        # 自治体の「お知らせ一覧」風: ナビ・script・大量のリンクを含む長いページ
+        self.listing_paths = []
+        nav = "".join(f'<li><a href="/menu/{k}.html">メニュー{k}</a></li>' for k in range(200))
+        for p in range(self.n(5)):
+            rows = []
+            for i in range(self.n(3000)):
+                no = p * 100000 + i
+                rows.append(f'<li><span class="date">令和7年{1 + i % 12}月{1 + i % 28}日</span>'
+                            f'<a href="/detail/{no}.html">{_title(rnd, no)}</a></li>')
+            body = (f"<!DOCTYPE html><html><head><title>お知らせ一覧 {p}</title>"
+                    f"<script>var tracking = '<a href=x>';</script><style>li {{ margin: 0 }}</style></head>"
+                    f"<body><nav><ul>{nav}</ul></nav><h1>補助金・助成金のお知らせ</h1>"
+                    f"<p>{FILLER * 5}</p><ul class='news'>{''.join(rows)}</ul><!-- footer --></body></html>")
+            path = f"/list/{p}.html"
+            self._put(path, body, "text/html; charset=utf-8")
+            self.listing_paths.append(path)
+
+    def _build_pdfs(self, rnd: random.Random):
+        self.pdf_paths = []
+        for d in range(self.n(4)):
+            pages = [[f"Grant programme {d} page {k}", "Application period 2025/4/1 - 2025/5/31",
+                      "Maximum 10,000,000 yen, subsidy rate 2/3 or 50%", "Lorem ipsum " * 8]
+                     for k in range(self.n(20))]
+            path = f"/docs/koubo_{d}.pdf"
+            self._put(path, make_pdf(pages), "application/pdf")
+            self.pdf_paths.append(path)
+
+    def detail_page(self, path: str) -> Optional[Tuple[bytes, str]]:
+        # 一覧・サイトマップから辿られる詳細ページはその場で生成する（URLから決定的に）
+        if not path.endswith(".html"):
+            return None
+        rnd = random.Random(path)
+        body = (f"<html><head><title>{_title(rnd, 0)}</title></head><body><h1>詳細</h1>"
+                f"<p>{FILLER}</p><p>{_period(rnd)}</p><p>補助上限額 最大{rnd.randint(1, 50) * 100}万円 "
+                f"補助率 {rnd.choice(['1/2', '2/3', '3/4'])}</p></body></html>")
+        return body.encode("utf-8"), "text/html; charset=utf-8"
+
+    def lookup(self, path: str) -> Optional[Tuple[bytes, str]]:
+        return self.files.get(path) or self.detail_page(path)
+
+class FixtureServer:
+    """Serves a Corpus on 127.0.0.1 with strong ETags (If-None-Match -> 304), counting
+    requests per status so a benchmark can check that a warm run was all 304s."""
+    def __init__(self, corpus: Corpus, port: int = 0):
+        self.corpus = corpus
+        self.hits: Counter = Counter()
+        self._lock = threading.Lock()
+        self._etags: Dict[str, str] = {}
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                path = self.path.split("?", 1)[0]
+                found = server.corpus.lookup(path)
+                if found is None:
+                    server._count(404)
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                body, ctype = found
+                etag = server._etag(path, body)
+                if self.headers.get("If-None-Match") == etag:
+                    server._count(304)
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                server._count(200)
+                self.send_response(200)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self._httpd.daemon_threads = True
+        self.base = f"http://127.0.0.1:{self._httpd.server_address[1]}"
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        # サイトマップ・RSS 内の {base} を実際のアドレスに置き換える
+        for path, (body, ctype) in list(corpus.files.items()):
+            if body[:2] == b"\x1f\x8b":
+                text = gzip.decompress(body).decode("utf-8")
+                if "{base}" in text:
+                    corpus.files[path] = (gzip.compress(text.replace("{base}", self.base).encode("utf-8"), mtime=0), ctype)
+            elif b"{base}" in body:
+                corpus.files[path] = (body.replace(b"{base}", self.base.encode()), ctype)
+
+    def _etag(self, path: str, body: bytes) -> str:
+        with self._lock:
+            tag = self._etags.get(path)
+            if tag is None:
+                tag = self._etags[path] = '"%s"' % hashlib.md5(body).hexdigest()
+            return tag
+
+    def _count(self, status: int):
+        with self._lock:
+            self.hits[status] += 1
+
+    def take_hits(self) -> Dict[int, int]:
+        with self._lock:
+            hits = dict(self.hits)
+            self.hits.clear()
+        return hits
+
+    def url(self, path: str) -> str:
+        return self.base + path
+
+    def __enter__(self) -> "FixtureServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._httpd.shutdown()
+        self._httpd.server_close()
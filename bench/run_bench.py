@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""Offline benchmark suite: harvesters, classifier, text extractors, HTML parsers and
+run_pipeline end to end, against a local fixture server with synthetic corpora.
+
+Usage:
+  python bench/run_bench.py [--scale 1.0] [--repeat 3] [--only harvest,pipeline] [--out bench/results.json]
+  python bench/run_bench.py --compare bench/baseline.json [--threshold 1.25]
+
+Results are written as JSON ({"meta": ..., "results": {name: {...}}}); with --compare
+each timing is printed next to the baseline and the exit status is 1 if any case got
+slower than `threshold` times its baseline.
+"""
+import argparse, contextlib, io, json, os, platform, shutil, subprocess, sys, tempfile, time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, "..")
+sys.path.insert(0, ROOT)
+
+from fixtures import Corpus, FixtureServer
+from bench_classify import make_docs
+
+GROUPS = ("harvest", "classify", "text", "html", "pipeline")
+
+def timed(fn: Callable[[], Any], repeat: int, setup: Callable[[], None] = None) -> Dict[str, Any]:
+    runs: List[float] = []
+    out = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        t0 = time.perf_counter()
+        out = fn()
+        runs.append(time.perf_counter() - t0)
+    return {"seconds": min(runs), "runs": [round(r, 6) for r in runs], "output": out}
+
+@contextlib.contextmanager
+def quiet(verbose: bool):
+    # ハーベスタ・パイプラインの [INFO] ログは計測結果の表示を埋もれさせるので捨てる
+    if verbose:
+        yield
+        return
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+class Suite:
+    def __init__(self, args, workdir: str):
+        self.args = args
+        self.workdir = workdir
+        self.results: Dict[str, Dict[str, Any]] = {}
+        self.corpus = Corpus(scale=args.scale)
+
+    def add(self, name: str, res: Dict[str, Any], **extra):
+        res = dict(res)
+        res.pop("output", None)
+        res.update(extra)
+        self.results[name] = res
+        detail = " ".join(f"{k}={v}" for k, v in extra.items())
+        print(f"{name:36s} {res['seconds']:9.4f}s  {detail}")
+
+    # --- harvesters -------------------------------------------------------------
+    def harvester_configs(self, srv: FixtureServer) -> Dict[str, Dict[str, Any]]:
+        c = self.corpus
+        return {
+            "rss": {"url": srv.url("/rss.xml"), "include_patterns": ["(医療|介護|補助金)"]},
+            "sitemap": {"url": srv.url("/sitemap.xml"), "include_patterns": ["kenko"]},
+            "html": {"urls": [srv.url(p) for p in c.listing_paths],
+                     "include_patterns": ["(医療|介護|看護)"], "exclude_patterns": ["子育て"]},
+            "pdf": {"urls": [srv.url(p) for p in c.pdf_paths]},
+        }
+
+    def bench_harvest(self, srv: FixtureServer):
+        from grants_harvester.pipeline import HARVESTER_REGISTRY, make_classifier, load_yaml
+        from grants_harvester.util.cache import BodyCache
+        from grants_harvester.util.fetch import HttpFetcher
+        from grants_harvester.util.state import FetchStateStore
+        from grants_harvester.util import pdftext
+
+        classifier = make_classifier(load_yaml(self.args.keywords).get("categories", {}))
+        configs = self.harvester_configs(srv)
+        for typ, Harv in HARVESTER_REGISTRY.items():
+            conf = configs.get(typ)
+            if conf is None:
+                print(f"[WARN] no fixture for harvester type: {typ}")
+                continue
+            conf = dict(conf, type=typ, name=f"bench-{typ}", issuer_name="ベンチ市")
+            cache = os.path.join(self.workdir, f"harvest-{typ}")
+
+            def run(warm: bool):
+                if not warm:
+                    shutil.rmtree(cache, ignore_errors=True)
+                pdftext.configure(cache_dir=os.path.join(cache, "pdftext"))
+                fetcher = HttpFetcher(min_interval_sec=0, max_concurrency=8, per_host_concurrency=8,
+                                      respect_robots=False, body_cache=BodyCache(os.path.join(cache, "bodies")),
+                                      state=FetchStateStore(os.path.join(cache, "state.sqlite")))
+                try:
+                    with quiet(self.args.verbose):
+                        return sum(1 for _ in Harv(fetcher, classifier, conf).harvest())
+                finally:
+                    fetcher.close()
+
+            for mode in ("cold", "warm"):
+                if mode == "warm":
+                    run(False)  # 計測前にキャッシュを温める
+                srv.take_hits()
+                res = timed(lambda: run(mode == "warm"), self.args.repeat)
+                hits = srv.take_hits()
+                self.add(f"harvest.{typ}.{mode}", res, records=res["output"],
+                         requests_per_run={str(k): v // self.args.repeat for k, v in sorted(hits.items())})
+        pdftext.default_extractor().close()
+
+    # --- classifier ---------------------------------------------------------------
+    def bench_classify(self):
+        import yaml
+        from grants_harvester.util.classify import choose_category, KeywordClassifier
+        with open(self.args.keywords, "r", encoding="utf-8") as f:
+            cats = yaml.safe_load(f).get("categories", {})
+        docs = make_docs(max(1, int(20 * self.args.scale)), 50_000)
+        chars = sum(len(d) for d in docs)
+        clf = KeywordClassifier(cats)
+        self.add("classify.choose_category", timed(lambda: [choose_category(d, cats) for d in docs],
+                                                   self.args.repeat), chars=chars)
+        self.add("classify.build", timed(lambda: KeywordClassifier(cats), self.args.repeat))
+        self.add("classify.KeywordClassifier", timed(lambda: [clf(d) for d in docs], self.args.repeat), chars=chars)
+        self.add("classify.classify_many", timed(lambda: clf.classify_many(docs), self.args.repeat), chars=chars)
+
+    # --- util/text.py ---------------------------------------------------------------
+    def bench_text(self):
+        from grants_harvester.util.text import extract_fields, parse_date_range, extract_money, extract_rate
+        tail = "募集期間：令和7年4月1日～令和7年5月31日 補助上限額 最大１，０００万円 補助率 ２/３"
+        docs = make_docs(max(1, int(50 * self.args.scale)), 20_000, seed=1)
+        cases = {"no_match": docs, "match_end": [d + tail for d in docs], "match_start": [tail + d for d in docs]}
+        for label, texts in cases.items():
+            self.add(f"text.extract_fields.{label}",
+                     timed(lambda: [extract_fields(t, first_only=True).period for t in texts], self.args.repeat),
+                     docs=len(texts))
+            self.add(f"text.wrappers.{label}",
+                     timed(lambda: [(parse_date_range(t), extract_money(t), extract_rate(t)) for t in texts],
+                           self.args.repeat), docs=len(texts))
+
+    # --- util/htmlparse.py ------------------------------------------------------------
+    def bench_html(self):
+        import importlib.util
+        from grants_harvester.util.htmlparse import BACKENDS, parse_html
+        pages = [self.corpus.files[p][0].decode("utf-8") for p in self.corpus.listing_paths]
+        for name, (module, _) in BACKENDS.items():
+            if importlib.util.find_spec(module) is None:
+                continue
+            res = timed(lambda: sum(len(parse_html(h, name).links) for h in pages), self.args.repeat)
+            self.add(f"html.parse.{name}", res, pages=len(pages), links=res["output"])
+
+    # --- run_pipeline end to end --------------------------------------------------------
+    def bench_pipeline(self, srv: FixtureServer):
+        import yaml
+        from grants_harvester.pipeline import run_pipeline
+        configs = self.harvester_configs(srv)
+        sources = [dict(conf, type=typ, name=f"bench-{typ}", issuer_name="ベンチ市")
+                   for typ, conf in configs.items()]
+        cfg_path = os.path.join(self.workdir, "sources.yaml")
+        with open(cfg_path, "w", encoding="utf-8") as f:
+            yaml.safe_dump({"min_interval_sec": 0, "max_concurrency": 8, "per_host_concurrency": 8,
+                            "throttle": {"respect_robots": False},
+                            # 2回目以降も全ソースを取得して 304 の経路を測る
+                            "refresh": {"enabled": False},
+                            "sources": sources}, f, allow_unicode=True)
+        out_dir = os.path.join(self.workdir, "out")
+        cache = os.environ["GRANTS_CACHE_DIR"]
+
+        def run():
+            with quiet(self.args.verbose):
+                path = run_pipeline(cfg_path, self.args.keywords, out_dir)
+            with open(path, "r", encoding="utf-8") as f:
+                return sum(1 for _ in f)
+
+        def reset():
+            # キャッシュ・レコードストアを空にして初回実行を再現する（ディレクトリ自体は残す）
+            for name in os.listdir(cache):
+                p = os.path.join(cache, name)
+                shutil.rmtree(p) if os.path.isdir(p) else os.remove(p)
+            shutil.rmtree(out_dir, ignore_errors=True)
+
+        srv.take_hits()
+        res = timed(run, self.args.repeat, setup=reset)
+        hits = srv.take_hits()
+        self.add("pipeline.cold", res, records=res["output"],
+                 requests_per_run={str(k): v // self.args.repeat for k, v in sorted(hits.items())})
+        res = timed(run, self.args.repeat)
+        hits = srv.take_hits()
+        self.add("pipeline.warm", res, records=res["output"],
+                 requests_per_run={str(k): v // self.args.repeat for k, v in sorted(hits.items())})
+
+    def run(self, groups: List[str]) -> Dict[str, Any]:
+        with FixtureServer(self.corpus) as srv:
+            for g in groups:
+                if g in ("harvest", "pipeline"):
+                    getattr(self, f"bench_{g}")(srv)
+                else:
+                    getattr(self, f"bench_{g}")()
+        return self.results
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+def compare(results: Dict[str, Dict[str, Any]], baseline_path: str, threshold: float) -> int:
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        base = json.load(f).get("results", {})
+    worse = 0
+    print(f"\n{'case':36s} {'baseline':>10s} {'now':>10s} {'ratio':>7s}")
+    for name, res in results.items():
+        if name not in base:
+            continue
+        ratio = res["seconds"] / base[name]["seconds"] if base[name]["seconds"] else float("inf")
+        flag = "  REGRESSION" if ratio > threshold else ""
+        worse += bool(flag)
+        print(f"{name:36s} {base[name]['seconds']:10.4f} {res['seconds']:10.4f} {ratio:7.2f}{flag}")
+    return 1 if worse else 0
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--keywords", default=os.path.join(ROOT, "config", "keywords.yaml"))
+    ap.add_argument("--scale", type=float, default=1.0, help="corpus size multiplier")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--only", default=",".join(GROUPS), help=f"comma-separated subset of {','.join(GROUPS)}")
+    ap.add_argument("--out", default=None, help="JSON results path (default bench/results_<ts>.json)")
+    ap.add_argument("--compare", default=None, help="baseline JSON to compare against")
+    ap.add_argument("--threshold", type=float, default=1.25, help="slowdown ratio reported as a regression")
+    ap.add_argument("--verbose", action="store_true", help="show harvester/pipeline logs")
+    args = ap.parse_args()
+
+    groups = [g for g in args.only.split(",") if g]
+    unknown = set(groups) - set(GROUPS)
+    if unknown:
+        ap.error(f"unknown group(s): {', '.join(sorted(unknown))}")
+
+    workdir = tempfile.mkdtemp(prefix="grants-bench-")
+    # 取得状態・レコードストアは一時ディレクトリに置き、実運用の .cache を汚さない
+    os.environ["GRANTS_CACHE_DIR"] = os.path.join(workdir, "cache")
+    os.makedirs(os.environ["GRANTS_CACHE_DIR"], exist_ok=True)
+    try:
+        suite = Suite(args, workdir)
+        t0 = time.perf_counter()
+        results = suite.run(groups)
+        total = time.perf_counter() - t0
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    ts = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    doc = {
+        "meta": {"timestamp": ts, "git": git_revision(), "python": platform.python_version(),
+                 "platform": platform.platform(), "cpus": os.cpu_count(), "scale": args.scale,
+                 "repeat": args.repeat, "groups": groups, "total_seconds": round(total, 3)},
+        "results": results,
+    }
+    out = args.out or os.path.join(HERE, f"results_{ts}.json")
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(doc, f, ensure_ascii=False, indent=2)
+    print(f"Wrote: {out}")
+    if args.compare:
+        sys.exit(compare(results, args.compare, args.threshold))
+
+if __name__ == "__main__":
+    main()
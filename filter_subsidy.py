@@ -1,24 +1,77 @@
 # -*- coding: utf-8 -*-
 """
-Filter subsidy/grant records from a CSV and emit a filtered CSV (full columns)
-and a JA-shaped CSV for BI.
+Filter subsidy/grant records from a CSV, JSONL or Parquet file and emit a filtered
+CSV (full columns) and a JA-shaped CSV for BI.
+
+The input is processed in bounded-size chunks, so memory does not grow with the
+file size; the encoding of CSV input is detected once from the first bytes.
 Usage:
   python filter_subsidy.py --in input.csv --out filtered.csv --out-ja filtered_ja.csv
+  python filter_subsidy.py --in out/grants_latest.jsonl --out filtered.csv --out-ja filtered_ja.csv
 """
 import re
+import codecs
 import argparse
 import pandas as pd
 from pathlib import Path
+from typing import Iterator, Optional
 
-def read_csv_robust(path: str) -> pd.DataFrame:
-    """Tries to read a CSV with multiple common Japanese encodings."""
-    for enc in ["utf-8", "utf-8-sig", "cp932", "shift_jis"]:
+CANDIDATE_ENCODINGS = ["utf-8", "cp932", "shift_jis"]
+SNIFF_BYTES = 64 * 1024
+
+# Define filtering patterns
+SUBSIDY_PAT = re.compile(r"(?:補助金|助成金|助成|支援金|交付金|給付金|補助事業|支援事業|補助制度|助成制度|奨励金)")
+EXCLUDE_PAT = re.compile(r"(?:審査結果|結果公表|交付決定|終了|募集終了|中止|完了|取消|停止)")
+
+JA_COLUMNS = ["補助金名", "補助金上限額", "補助率", "対象地域", "従業員数の上限", "募集期間", "詳細URL"]
+
+def sniff_encoding(path, nbytes: int = SNIFF_BYTES) -> str:
+    """Guesses the encoding from the first `nbytes` only (BOM, then strict decoding)."""
+    with open(path, "rb") as f:
+        head = f.read(nbytes)
+    if head.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    for enc in CANDIDATE_ENCODINGS:
+        # 途中で切れた多バイト文字でエラーにならないよう、インクリメンタルに final=False で試す
         try:
-            return pd.read_csv(path, encoding=enc)
-        except Exception:
+            codecs.getincrementaldecoder(enc)().decode(head, final=False)
+            return enc
+        except UnicodeDecodeError:
             continue
-    # Fallback with error ignoring
-    return pd.read_csv(path, encoding="utf-8", errors="ignore")
+    return "utf-8"
+
+def detect_format(path, fmt: str = "auto") -> str:
+    if fmt != "auto":
+        return fmt
+    suffixes = [s.lower() for s in Path(path).suffixes]
+    if ".parquet" in suffixes or ".pq" in suffixes:
+        return "parquet"
+    if ".jsonl" in suffixes or ".ndjson" in suffixes:
+        return "jsonl"
+    return "csv"
+
+def iter_chunks(path, fmt: str = "auto", chunksize: int = 50_000) -> Iterator[pd.DataFrame]:
+    """Yields the input as DataFrames of at most `chunksize` rows."""
+    fmt = detect_format(path, fmt)
+    if fmt == "csv":
+        # 判定に失敗した文字は置換し、最後まで読み切る（従来の errors="ignore" 相当）
+        yield from pd.read_csv(path, encoding=sniff_encoding(path), encoding_errors="replace",
+                               chunksize=chunksize)
+    elif fmt == "jsonl":
+        yield from pd.read_json(path, lines=True, chunksize=chunksize, dtype=False)
+    elif fmt == "parquet":
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("Error: Parquet input requires pyarrow (pip install pyarrow).")
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+    else:
+        raise ValueError(f"unknown input format: {fmt}")
+
+def read_csv_robust(path: str) -> pd.DataFrame:
+    """Reads a whole CSV, detecting common Japanese encodings from the first bytes."""
+    return pd.concat(list(iter_chunks(path, "csv")), ignore_index=True)
 
 def find_column(df: pd.DataFrame, candidates: list[str]) -> str | None:
     """Finds the first matching column name from a list of candidates."""
@@ -32,11 +85,66 @@ def combine_period(s, e) -> str:
         return f"{s_str} ～ {e_str}"
     return s_str or e_str
 
+def _date_part(df: pd.DataFrame, col: Optional[str]) -> pd.Series:
+    if not col or col not in df.columns:
+        return pd.Series("", index=df.index, dtype=object)
+    v = df[col]
+    return v.where(v.notna(), "").astype(str).str.split("T", n=1).str[0]
+
+def combine_period_columns(df: pd.DataFrame, start_col: Optional[str], end_col: Optional[str]) -> pd.Series:
+    """Vectorized `combine_period` over whole columns."""
+    s = _date_part(df, start_col)
+    e = _date_part(df, end_col)
+    both = (s != "") & (e != "")
+    return (s + " ～ " + e).where(both, s + e)
+
+class ColumnMap:
+    """Column names resolved once from the first chunk (CSV: harvester or JA headers)."""
+    def __init__(self, df: pd.DataFrame):
+        self.columns = list(df.columns)
+        self.title = find_column(df, ["title", "補助金名", "名称", "件名", "Title"])
+        self.summary = find_column(df, ["summary", "概要", "説明", "description"])
+        self.url = find_column(df, ["url", "詳細URL"])
+        self.issuer = find_column(df, ["issuer_name", "対象地域"])
+        self.amount = find_column(df, ["amount", "補助金上限額"])
+        self.rate = find_column(df, ["subsidy_rate", "補助率"])
+        self.start = find_column(df, ["application_start"])
+        self.end = find_column(df, ["application_end"])
+
+def filter_chunk(df: pd.DataFrame, cols: ColumnMap) -> pd.DataFrame:
+    # Combine title and summary for searching. This is more efficient than iterating row by row.
+    text_to_search = df[cols.title].astype(str)
+    if cols.summary and cols.summary in df.columns:
+        # .fillna('') handles cases where the summary column has empty values.
+        text_to_search = text_to_search + " " + df[cols.summary].fillna('').astype(str)
+
+    # Use vectorized string operations which are significantly faster than df.apply().
+    is_subsidy_mask = text_to_search.str.contains(SUBSIDY_PAT, regex=True, na=False)
+    is_excluded_mask = text_to_search.str.contains(EXCLUDE_PAT, regex=True, na=False)
+    return df[is_subsidy_mask & ~is_excluded_mask]
+
+def to_ja(df_sub: pd.DataFrame, cols: ColumnMap) -> pd.DataFrame:
+    def col(name: Optional[str]):
+        return df_sub[name] if name and name in df_sub.columns else ""
+
+    return pd.DataFrame({
+        "補助金名": df_sub[cols.title],  # title column is guaranteed to exist (checked on the first chunk)
+        "補助金上限額": col(cols.amount),
+        "補助率": col(cols.rate),
+        "対象地域": col(cols.issuer),
+        "従業員数の上限": "",  # Placeholder as in the original script
+        "募集期間": combine_period_columns(df_sub, cols.start, cols.end),
+        "詳細URL": col(cols.url),
+    }, index=df_sub.index, columns=JA_COLUMNS)
+
 def main():
-    ap = argparse.ArgumentParser(description="Filters a CSV of grants/subsidies.")
-    ap.add_argument("--in", dest="in_path", required=True, help="Path to the input CSV file.")
+    ap = argparse.ArgumentParser(description="Filters a CSV/JSONL/Parquet file of grants/subsidies.")
+    ap.add_argument("--in", dest="in_path", required=True, help="Path to the input CSV, JSONL or Parquet file.")
     ap.add_argument("--out", dest="out_path", required=True, help="Path for the filtered full-column CSV.")
     ap.add_argument("--out-ja", dest="out_ja_path", required=True, help="Path for the BI-friendly JA-shaped CSV.")
+    ap.add_argument("--format", choices=["auto", "csv", "jsonl", "parquet"], default="auto",
+                    help="Input format (default: from the file extension).")
+    ap.add_argument("--chunksize", type=int, default=50_000, help="Rows processed at a time.")
     args = ap.parse_args()
 
     in_path = Path(args.in_path)
@@ -44,67 +152,41 @@ def main():
         print(f"Error: Input file not found at {in_path}")
         return
 
-    df = read_csv_robust(in_path)
-
-    # Define filtering patterns
-    subsidy_pat = re.compile(r"(補助金|助成金|助成|支援金|交付金|給付金|補助事業|支援事業|補助制度|助成制度|奨励金)")
-    exclude_pat = re.compile(r"(審査結果|結果公表|交付決定|終了|募集終了|中止|完了|取消|停止)")
-
-    # Find relevant columns dynamically
-    title_col = find_column(df, ["title", "補助金名", "名称", "件名", "Title"])
-    if not title_col:
-        print("エラー: 'title'に相当する列（例: 「補助金名」「名称」）が見つかりませんでした。入力CSVファイルを確認してください。")
-        return
-    summary_col = find_column(df, ["summary", "概要", "説明", "description"])
-
-    # --- Filtering ---
-    # Combine title and summary for searching. This is more efficient than iterating row by row.
-    text_to_search = df[title_col].astype(str)
-    if summary_col:
-        # .fillna('') handles cases where the summary column has empty values.
-        text_to_search += " " + df[summary_col].fillna('').astype(str)
-
-    # Use vectorized string operations which are significantly faster than df.apply().
-    is_subsidy_mask = text_to_search.str.contains(subsidy_pat, regex=True, na=False)
-    is_excluded_mask = text_to_search.str.contains(exclude_pat, regex=True, na=False)
-
-    df_sub = df[is_subsidy_mask & ~is_excluded_mask].copy()
-    print(f"Found {len(df_sub)} subsidy/grant records.")
-
-    if df_sub.empty:
-        print("No records left after filtering. Output files will be empty.")
-    
-    # --- Create the BI-friendly JA DataFrame ---
-    
-    # Find columns for the JA dataframe
-    url_col = find_column(df_sub, ["url", "詳細URL"])
-    issuer_col = find_column(df_sub, ["issuer_name", "対象地域"])
-    amount_col = find_column(df_sub, ["amount", "補助金上限額"])
-    rate_col = find_column(df_sub, ["subsidy_rate", "補助率"])
-    start_col = find_column(df_sub, ["application_start"])
-    end_col = find_column(df_sub, ["application_end"])
-
-    # Build the new DataFrame in a pandas-idiomatic way
-    df_ja = pd.DataFrame({
-        "補助金名": df_sub[title_col],  # title_col is guaranteed to exist due to the check above
-        "補助金上限額": df_sub[amount_col] if amount_col and amount_col in df_sub.columns else "",
-        "補助率": df_sub[rate_col] if rate_col and rate_col in df_sub.columns else "",
-        "対象地域": df_sub[issuer_col] if issuer_col and issuer_col in df_sub.columns else "",
-        "従業員数の上限": "",  # Placeholder as in the original script
-        "募集期間": df_sub.apply(lambda row: combine_period(row.get(start_col), row.get(end_col)), axis=1),
-        "詳細URL": df_sub[url_col] if url_col and url_col in df_sub.columns else ""
-    })
-
-    # Save the output files
     out_path = Path(args.out_path)
     out_ja_path = Path(args.out_ja_path)
     out_path.parent.mkdir(parents=True, exist_ok=True)
-
-    df_sub.to_csv(out_path, index=False, encoding="utf-8-sig")
-    df_ja.to_csv(out_ja_path, index=False, encoding="utf-8-sig")
-
+    out_ja_path.parent.mkdir(parents=True, exist_ok=True)
+
+    cols: Optional[ColumnMap] = None
+    total = kept = 0
+    # BOM は open 時に1回だけ書かれ、ヘッダは最初のチャンクでだけ書く
+    with open(out_path, "w", encoding="utf-8-sig", newline="") as f_out, \
+            open(out_ja_path, "w", encoding="utf-8-sig", newline="") as f_ja:
+        for df in iter_chunks(in_path, args.format, args.chunksize):
+            first = cols is None
+            if first:
+                cols = ColumnMap(df)
+                if not cols.title:
+                    print("エラー: 'title'に相当する列（例: 「補助金名」「名称」）が見つかりませんでした。入力CSVファイルを確認してください。")
+                    return
+            else:
+                # JSONL はチャンクごとに列が揃わないことがあるため、最初のチャンクの列に合わせる
+                df = df.reindex(columns=cols.columns)
+            total += len(df)
+            df_sub = filter_chunk(df, cols)
+            kept += len(df_sub)
+            df_sub.to_csv(f_out, index=False, header=first)
+            to_ja(df_sub, cols).to_csv(f_ja, index=False, header=first)
+
+        if cols is None:
+            # 空の入力: ヘッダだけの出力にする
+            pd.DataFrame(columns=JA_COLUMNS).to_csv(f_ja, index=False)
+
+    print(f"Found {kept} subsidy/grant records (of {total}).")
+    if not kept:
+        print("No records left after filtering. Output files will be empty.")
     print(f"Successfully wrote filtered full data to: {out_path}")
     print(f"Successfully wrote BI-friendly data to: {out_ja_path}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
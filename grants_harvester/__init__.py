@@ -1 +1,8 @@
-from .pipeline import run_pipeline
+__all__ = ["run_pipeline"]
+
+def __getattr__(name):
+    # `import grants_harvester` だけでは pipeline（と依存パッケージ）を読み込まない
+    if name == "run_pipeline":
+        from .pipeline import run_pipeline
+        return run_pipeline
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,218 @@
+
+import re, hashlib, sqlite3
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from .schema import GrantOpportunity
+from .util.text import normalize_text
+
+# 計測・広告用のクエリパラメータ（内容を変えないので正規化時に落とす）
+TRACKING_PARAMS = frozenset({
+    "fbclid", "gclid", "dclid", "gbraid", "wbraid", "yclid", "msclkid", "mc_cid", "mc_eid",
+    "_ga", "_gl", "igshid", "ref", "ref_src", "spm",
+})
+TRACKING_PREFIXES = ("utm_",)
+_INDEX_FILE = re.compile(r"/(?:index|default)\.(?:s?html?|php|aspx?|jsp|cgi)$", re.I)
+
+def canonical_url(url: str) -> str:
+    """Record key: the same page under http/https, with or without `index.html`, a
+    default port, a fragment or tracking parameters maps to one key. Scheme and host
+    are lower-cased and the remaining query parameters are sorted."""
+    if not url:
+        return ""
+    try:
+        parts = urlsplit(url.strip())
+        port = parts.port
+    except ValueError:
+        # 閉じていない IPv6 の角括弧や数字でないポート。正規化せずそのままキーにする
+        return url.strip()
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if ":" in host:
+        host = f"[{host}]"  # hostname は IPv6 アドレスの角括弧を外して返す
+    if port and not ((scheme == "http" and port == 80) or (scheme == "https" and port == 443)):
+        host = f"{host}:{port}"
+    if scheme == "http":
+        scheme = "https"  # 同じページが http / https の両方で案内されることが多い
+    path = _INDEX_FILE.sub("/", parts.path or "/")
+    query = parts.query
+    if query:
+        params = [(k, v) for k, v in parse_qsl(query, keep_blank_values=True)
+                  if k.lower() not in TRACKING_PARAMS and not k.lower().startswith(TRACKING_PREFIXES)]
+        query = urlencode(sorted(params))
+    return urlunsplit((scheme, host, path, query, ""))
+
+# --- SimHash ---
+
+# 「〇〇について」「〇〇のお知らせ」などの定型句や括弧書きのラベルは類似度に効かないので除く
+_BOILERPLATE = re.compile(r"【[^】]*】|について|のお知らせ|お知らせ|のご案内|ご案内|のページ|[（(]終了[）)]")
+_NOISE = re.compile(r"[\W_]+")
+_DIGITS = re.compile(r"\d+")
+MIN_TITLE_CHARS = 8
+BANDS = 4
+_BAND_BITS = 64 // BANDS
+_MASK64 = (1 << 64) - 1
+_char_hashes: Dict[str, Tuple[int, int, int]] = {}
+
+def normalize_title(title: str) -> str:
+    return _NOISE.sub("", _BOILERPLATE.sub("", normalize_text(title or "").lower()))
+
+def _char_hash(ch: str) -> Tuple[int, int, int]:
+    # 文字ごとの 64bit 乱数（実行をまたいで同じ値）と、その 21/42 ビット回転。3-gram の値はその XOR
+    t = _char_hashes.get(ch)
+    if t is None:
+        v = int.from_bytes(hashlib.blake2b(ch.encode("utf-8"), digest_size=8).digest(), "big")
+        t = _char_hashes[ch] = (v, ((v << 21) | (v >> 43)) & _MASK64, ((v << 42) | (v >> 22)) & _MASK64)
+    return t
+
+def simhash(text: str) -> int:
+    """64-bit SimHash over the distinct character 3-grams of `text` (unweighted)."""
+    hs = [_char_hash(ch) for ch in text] + [(0, 0, 0)] * max(0, 3 - len(text))
+    grams = {hs[i][0] ^ hs[i + 1][1] ^ hs[i + 2][2] for i in range(len(hs) - 2)}
+    # 64本のビットごとの出現数を、桁ごとのビットスライス（planes[k] = 各カウンタの 2^k の位）で数える
+    planes: List[int] = []
+    for carry in grams:
+        for i, p in enumerate(planes):
+            planes[i] = p ^ carry
+            carry &= p
+            if not carry:
+                break
+        if carry:
+            planes.append(carry)
+    # 出現数が半数を超えるビットを立てる（定数との大小比較を上の桁から）
+    t = len(grams) // 2
+    gt, eq = 0, _MASK64
+    for i in range(max(len(planes), t.bit_length()) - 1, -1, -1):
+        p = planes[i] if i < len(planes) else 0
+        if t >> i & 1:
+            eq &= p
+        else:
+            gt |= eq & p
+            eq &= ~p
+    return gt
+
+@lru_cache(maxsize=4096)
+def title_signature(title: str) -> Optional[Tuple[int, str]]:
+    """(SimHash, digits) of a title, or None when the title is too uninformative to match on."""
+    if title.startswith("(ページ候補)"):
+        return None  # タイトルがURLから作った仮のもの
+    norm = normalize_title(title)
+    if len(norm) < MIN_TITLE_CHARS:
+        return None  # 「お知らせ」のような短いタイトルは誤判定が多い
+    return simhash(norm), "-".join(_DIGITS.findall(norm))
+
+def _signed(v: int) -> int:
+    # SQLite の INTEGER は符号付き 64bit
+    return v - (1 << 64) if v >= 1 << 63 else v
+
+@lru_cache(maxsize=4096)
+def _buckets(h: int, digits: str) -> Tuple[int, ...]:
+    # 数字列（年度・号数・回次）が違うタイトルは別の公募なので、同じバケットに入れない
+    out = []
+    for band in range(BANDS):
+        value = (h >> (band * _BAND_BITS)) & ((1 << _BAND_BITS) - 1)
+        d = hashlib.blake2b(f"{band}:{value}:{digits}".encode("utf-8"), digest_size=8).digest()
+        out.append(_signed(int.from_bytes(d, "big")))
+    return tuple(out)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS near_dup (
+    key      TEXT PRIMARY KEY,
+    simhash  INTEGER NOT NULL,
+    digits   TEXT NOT NULL,
+    deadline TEXT
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS near_dup_buckets (
+    bucket INTEGER NOT NULL,
+    key    TEXT NOT NULL,
+    PRIMARY KEY (bucket, key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS url_alias (
+    alias TEXT PRIMARY KEY,
+    key   TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+class NearDupIndex:
+    """Finds records that announce the same grant under a different URL (a prefecture
+    RSS item, a municipal page and a sitemap candidate for one 公募).
+
+    Titles are normalized and hashed with a 64-bit SimHash; the hash is split into
+    `BANDS` bands and each band (together with the digits of the title) is a bucket
+    in SQLite, so a lookup only compares against records sharing a bucket and any two
+    titles at most `max_distance` (< BANDS) bits apart share at least one. A match must
+    also come from another source, carry the same digits and not have a different
+    application deadline. Matches are remembered as URL aliases, so later runs map
+    the duplicate URL straight to its record without hashing.
+
+    Shares the record store's connection (and transaction).
+    """
+    def __init__(self, conn: sqlite3.Connection, max_distance: int = 3,
+                 max_candidates: int = 64):
+        if not 0 <= max_distance < BANDS:
+            raise ValueError(f"max_distance must be between 0 and {BANDS - 1}")
+        self._conn = conn
+        self.max_distance = max_distance
+        self.max_candidates = max_candidates
+        self._conn.executescript(_SCHEMA)
+        self.stats: Dict[str, int] = {"merged": 0, "indexed": 0}
+
+    @staticmethod
+    def signature(opp: GrantOpportunity) -> Optional[Tuple[int, str]]:
+        return title_signature(opp.title or "")
+
+    def alias(self, url_key: str) -> Optional[str]:
+        row = self._conn.execute("SELECT key FROM url_alias WHERE alias = ?", (url_key,)).fetchone()
+        return row[0] if row else None
+
+    def find(self, opp: GrantOpportunity, source: Optional[str]) -> Optional[str]:
+        """Key of a live record from another source that `opp` duplicates, or None."""
+        sig = self.signature(opp)
+        if sig is None:
+            return None
+        h, digits = sig
+        buckets = _buckets(h, digits)
+        rows = self._conn.execute(
+            "SELECT DISTINCT n.key, n.simhash, n.deadline, r.source FROM near_dup_buckets b "
+            "JOIN near_dup n ON n.key = b.key JOIN records r ON r.key = n.key "
+            f"WHERE b.bucket IN ({', '.join('?' * len(buckets))}) AND n.digits = ? "
+            "AND r.expired_at IS NULL LIMIT ?",
+            (*buckets, digits, self.max_candidates)).fetchall()
+        best, best_d = None, self.max_distance + 1
+        for key, other, deadline, other_source in rows:
+            if other_source == source:
+                continue  # 同じソース内の似たタイトルは別の公募として扱う
+            if deadline and opp.application_end and deadline != opp.application_end:
+                continue
+            d = bin(h ^ (other & _MASK64)).count("1")
+            if d < best_d:
+                best, best_d = key, d
+        return best
+
+    def add_alias(self, url_key: str, key: str):
+        self._conn.execute("INSERT OR REPLACE INTO url_alias (alias, key) VALUES (?, ?)", (url_key, key))
+        self.stats["merged"] += 1
+
+    def index(self, key: str, opp: GrantOpportunity, only_missing: bool = False):
+        """(Re)indexes the record stored under `key`; with `only_missing`, only if it
+        is not indexed yet (records stored before near-duplicate detection was on)."""
+        old = self._conn.execute("SELECT simhash, digits FROM near_dup WHERE key = ?", (key,)).fetchone()
+        if only_missing and old is not None:
+            return
+        sig = self.signature(opp)
+        if old is not None:
+            old_h = old[0] & _MASK64
+            if sig == (old_h, old[1]):
+                return
+            self._conn.executemany("DELETE FROM near_dup_buckets WHERE bucket = ? AND key = ?",
+                                   [(b, key) for b in _buckets(old_h, old[1])])
+        if sig is None:
+            self._conn.execute("DELETE FROM near_dup WHERE key = ?", (key,))
+            return
+        h, digits = sig
+        self._conn.execute("INSERT OR REPLACE INTO near_dup (key, simhash, digits, deadline) VALUES (?, ?, ?, ?)",
+                           (key, _signed(h), digits, opp.application_end))
+        self._conn.executemany("INSERT OR IGNORE INTO near_dup_buckets (bucket, key) VALUES (?, ?)",
+                               [(b, key) for b in _buckets(h, digits)])
+        self.stats["indexed"] += 1
@@ -0,0 +1,186 @@
+
+import heapq, itertools
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from .schema import GrantOpportunity
+from .store import canonical_url
+from .harvesters.sitemap import parse_lastmod
+from .util import metrics, pdftext
+from .util.htmlparse import parse_html
+from .util.text import extract_fields
+
+CANDIDATE_PREFIX = "(ページ候補)"
+
+def is_candidate(opp: GrantOpportunity) -> bool:
+    """Link-only records worth fetching: sitemap page candidates and links found on
+    HTML listing pages, as long as nothing has filled in their details yet."""
+    if opp.summary or not opp.url or (opp.raw or {}).get("enriched"):
+        return False
+    if opp.source_type == "SITEMAP":
+        return (opp.title or "").startswith(CANDIDATE_PREFIX)
+    return opp.source_type == "HTML" and bool((opp.raw or {}).get("from"))
+
+def _freshness(opp: GrantOpportunity, now: datetime, half_life_days: float) -> float:
+    # 1.0（今日更新）から半減期ごとに半分になる。日付が無ければ 0
+    dt = parse_lastmod((opp.raw or {}).get("lastmod")) or parse_lastmod(opp.published_at)
+    if dt is None:
+        return 0.0
+    age = max(0.0, (now - dt).total_seconds() / 86400.0)
+    return 0.5 ** (age / half_life_days)
+
+class Enricher:
+    """Enrichment stage: fetches the detail pages behind candidate records and fills in
+    summary, application period, amount and rate with the `util/text.py` extractors.
+
+    Candidates are kept in a bounded heap (at most `max_requests`) ranked by classifier
+    score plus a freshness bonus; lower-ranked ones pass straight through unchanged.
+    `drain()` then fetches the kept pages concurrently via `HttpFetcher.get_many`
+    (conditional requests, so unchanged pages are replayed from the body cache)
+    until the request or byte budget runs out. Only freshly downloaded bytes count
+    against `max_bytes`. A page larger than `max_page_bytes` (default: the PDF
+    extractor's size limit) is not read and the candidate is left as it is.
+    """
+    def __init__(self, fetcher, classifier, max_requests: int = 200, max_bytes: int = 50 * 1024 * 1024,
+                 freshness_weight: float = 2.0, half_life_days: float = 30.0,
+                 html_parser: Optional[str] = None, skip_sources: Iterable[str] = (),
+                 max_page_bytes: Optional[int] = None):
+        self.fetcher = fetcher
+        self.classifier = classifier
+        self.max_requests = max_requests
+        self.max_bytes = max_bytes
+        self.max_page_bytes = max_page_bytes
+        self.freshness_weight = freshness_weight
+        self.half_life_days = half_life_days
+        self.html_parser = html_parser
+        self.skip_sources: Set[str] = set(skip_sources)
+        self.now = datetime.now(timezone.utc)
+        # (priority, seq, canonical url, source key, record) の最小ヒープ
+        self._heap: List[Tuple[float, int, str, str, GrantOpportunity]] = []
+        self._keys: Set[str] = set()
+        self._seq = itertools.count()
+        self.stats: Dict[str, int] = {"candidates": 0, "requests": 0, "bytes": 0, "cached": 0,
+                                      "enriched": 0, "failed": 0, "too_large": 0, "over_budget": 0}
+
+    def priority(self, opp: GrantOpportunity) -> float:
+        text = opp.title or ""
+        if text.startswith(CANDIDATE_PREFIX):
+            text = text[len(CANDIDATE_PREFIX):]
+        scores = self.classifier.scores(text) if hasattr(self.classifier, "scores") else {}
+        return max(scores.values(), default=0.0) \
+            + self.freshness_weight * _freshness(opp, self.now, self.half_life_days)
+
+    def offer(self, source: str, opp: GrantOpportunity) -> Iterator[Tuple[str, GrantOpportunity]]:
+        """Takes one harvested record; yields whatever should go downstream now
+        (the record itself, or a lower-ranked candidate it pushed out of the heap)."""
+        if self.max_requests <= 0 or source in self.skip_sources or not is_candidate(opp):
+            yield source, opp
+            return
+        key = canonical_url(opp.url)
+        if key in self._keys:
+            yield source, opp  # 同じURLの候補は1件だけ取得する
+            return
+        self.stats["candidates"] += 1
+        entry = (self.priority(opp), next(self._seq), key, source, opp)
+        if len(self._heap) < self.max_requests:
+            heapq.heappush(self._heap, entry)
+            self._keys.add(key)
+        elif entry[:2] > self._heap[0][:2]:
+            evicted = heapq.heapreplace(self._heap, entry)
+            self._keys.discard(evicted[2])
+            self._keys.add(key)
+            yield evicted[3], evicted[4]
+        else:
+            yield source, opp
+
+    def drain(self, skip: Optional[Callable[[GrantOpportunity], bool]] = None,
+              window: int = 32) -> Iterator[Tuple[str, GrantOpportunity]]:
+        """Fetches the kept candidates, best first, and yields every one of them
+        (enriched when the fetch succeeded and the budget allowed). `skip` lets the
+        caller drop candidates that already have a richer record this run."""
+        entries = sorted(self._heap, key=lambda e: (-e[0], e[1]))
+        self._heap, self._keys = [], set()
+        todo = []
+        for e in entries:
+            if skip is not None and skip(e[4]):
+                yield e[3], e[4]
+            else:
+                todo.append(e)
+
+        def urls():
+            for e in todo:
+                if self.stats["requests"] >= self.max_requests or self.stats["bytes"] >= self.max_bytes:
+                    return
+                self.stats["requests"] += 1
+                yield e[4].url
+
+        done = 0
+        pending = deque()  # (source, record, page title, text or PDF future, response)
+        extractor = pdftext.default_extractor()
+        # 巨大なページを丸ごとメモリに読み込まない
+        max_page_bytes = self.max_page_bytes or extractor.max_bytes
+        for u, resp in self.fetcher.get_many(urls(), return_exceptions=True, max_bytes=max_page_bytes):
+            _, _, _, source, opp = todo[done]
+            done += 1
+            if isinstance(resp, Exception) or resp.status_code != 200:
+                self.stats["failed"] += 1
+                pending.append((source, opp, None, None, None))
+            elif getattr(resp, "skipped", None):
+                self.stats["too_large"] += 1
+                pending.append((source, opp, None, None, None))
+            else:
+                if getattr(resp, "from_cache", False):
+                    self.stats["cached"] += 1
+                else:
+                    self.stats["bytes"] += len(resp.content)
+                ctype = (resp.headers.get("Content-Type") or "").lower()
+                if "pdf" in ctype or resp.content[:5] == b"%PDF-":
+                    pending.append((source, opp, None, extractor.submit(resp.content, label=u), resp))
+                else:
+                    with metrics.timer("parse"):
+                        page = parse_html(resp.text, self.html_parser)
+                    pending.append((source, opp, page.title, page.text, resp))
+            # PDF の抽出待ちが先頭に無い限り、取得順にそのまま流す
+            while pending and (len(pending) > window or not hasattr(pending[0][3], "result")
+                               or pending[0][3].done()):
+                yield self._finish(*pending.popleft())
+        while pending:
+            yield self._finish(*pending.popleft())
+
+        self.stats["over_budget"] += len(todo) - done
+        for e in todo[done:]:
+            yield e[3], e[4]
+
+    def _finish(self, source: str, opp: GrantOpportunity, title: Optional[str], text, resp):
+        if hasattr(text, "result"):
+            text = text.result()
+        if resp is None:
+            return source, opp
+        self._apply(opp, title, text or "", resp)
+        self.stats["enriched"] += 1
+        return source, opp
+
+    def _apply(self, opp: GrantOpportunity, title: Optional[str], text: str, resp):
+        if title and (opp.title or "").startswith(CANDIDATE_PREFIX):
+            opp.title = title
+        if text:
+            opp.summary = (text[:500] + "…") if len(text) > 500 else text
+            fields = extract_fields(text, first_only=True)
+            opp.application_start, opp.application_end = fields.period
+            opp.amount = fields.amount
+            opp.subsidy_rate = fields.rate
+        if not opp.published_at and resp.headers.get("Last-Modified"):
+            try:
+                opp.published_at = parsedate_to_datetime(resp.headers["Last-Modified"]).isoformat()
+            except Exception:
+                pass
+        opp.raw = dict(opp.raw or {}, enriched=True)
+        opp.category = self.classifier(opp.title + " " + (opp.summary or ""))
+
+    def summary(self) -> str:
+        s = self.stats
+        return (f"{s['enriched']}/{s['candidates']} candidates enriched, {s['requests']} requests "
+                f"({s['cached']} unchanged), {s['bytes'] / 1024 / 1024:.1f} MB, "
+                f"{s['failed']} failed, {s['too_large']} too large, {s['over_budget']} over budget")
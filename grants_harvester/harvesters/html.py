@@ -1,32 +1,35 @@
 
-import re
 from urllib.parse import urljoin
 from datetime import datetime, timezone
 from typing import Iterable
 from email.utils import parsedate_to_datetime
-from bs4 import BeautifulSoup
 from .base import Harvester
+from ..util.filters import PatternFilter
+from ..util.htmlparse import parse_html
+from ..util import metrics
 from ..schema import GrantOpportunity
-from ..util.text import normalize_whitespace, parse_date_range, extract_money, extract_rate
+from ..util.text import normalize_whitespace, extract_fields
 
 class HtmlHarvester(Harvester):
     def harvest(self) -> Iterable[GrantOpportunity]:
         urls = self.config["urls"]
-        incl = self.config.get("include_patterns", [])
-        excl = self.config.get("exclude_patterns", [])
-        for base_url in urls:
-            resp = self.fetcher.get(base_url)
+        flt = PatternFilter.from_config(self.config)
+        backend = self.config.get("html_parser")  # 未指定なら全体設定（auto）
+        for base_url, resp in self.fetcher.get_many(urls):
             if resp.status_code == 304:
                 continue
             resp.raise_for_status()
             html = resp.text
-            soup = BeautifulSoup(html, 'html.parser')
-            page_title = self._extract_title(soup) or base_url
-            text = self._extract_text(soup)
+            # タイトル・本文・リンクを1回の走査でまとめて取り出す
+            with metrics.timer("parse"):
+                page = parse_html(html, backend)
+            page_title = page.title or base_url
+            text = page.text
 
             # 1) Emit page itself if it matches
-            if self._matches(text + " " + page_title, incl, excl):
-                start, end = parse_date_range(text)
+            if flt.matches(text + " " + page_title):
+                fields = extract_fields(text, first_only=True)  # 期間・金額・補助率を1回の走査で
+                start, end = fields.period
 
                 published_at = None
                 if resp.headers.get("Last-Modified"):
@@ -45,8 +48,8 @@ class HtmlHarvester(Harvester):
                     summary=(text[:500] + "…") if len(text) > 500 else text,
                     application_start=start,
                     application_end=end,
-                    amount=extract_money(text),
-                    subsidy_rate=extract_rate(text),
+                    amount=fields.amount,
+                    subsidy_rate=fields.rate,
                     source_type="HTML",
                     published_at=published_at,
                     fetched_at=datetime.now(timezone.utc).isoformat(),
@@ -56,11 +59,12 @@ class HtmlHarvester(Harvester):
                 yield opp
 
             # 2) Extract <a> links whose text matches include_patterns
-            for (href, anchor_text) in self._extract_links(soup):
-                if not href:
-                    continue
-                full = urljoin(base_url, href)
-                if not self._matches(anchor_text, incl, excl):
+            links = flt.filter(page.links, key=lambda l: l[1])
+            for (href, anchor_text) in links:
+                try:
+                    full = urljoin(base_url, href)
+                except ValueError as e:  # 閉じていない IPv6 の角括弧など
+                    print(f"[WARN] Skipping malformed link on {base_url}: {href!r}: {e}")
                     continue
                 opp = GrantOpportunity(
                     title=normalize_whitespace(anchor_text) or full,
@@ -80,33 +84,3 @@ class HtmlHarvester(Harvester):
                 )
                 opp.category = self.classifier(opp.title)
                 yield opp
-
-    def _matches(self, text: str, incl, excl):
-        if incl:
-            ok = any(re.search(p, text) for p in incl)
-            if not ok: return False
-        if excl and any(re.search(p, text) for p in excl):
-            return False
-        return True
-
-    def _extract_title(self, soup: BeautifulSoup):
-        if soup.title and soup.title.string:
-            return normalize_whitespace(soup.title.string)
-        h1 = soup.find('h1')
-        if h1:
-            return normalize_whitespace(h1.get_text())
-        return None
-
-    def _extract_text(self, soup: BeautifulSoup):
-        for script_or_style in soup(["script", "style"]):
-            script_or_style.decompose()
-        return normalize_whitespace(soup.get_text())
-
-    def _extract_links(self, soup: BeautifulSoup):
-        cleaned = []
-        for a in soup.find_all('a', href=True):
-            href = a['href']
-            text = normalize_whitespace(a.get_text())
-            if href:
-                cleaned.append((href, text))
-        return cleaned
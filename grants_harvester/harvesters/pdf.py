@@ -1,44 +1,96 @@
 
+from collections import deque
 from datetime import datetime, timezone
-from typing import Iterable
+from typing import Iterable, Optional
 from .base import Harvester
 from ..schema import GrantOpportunity
-from ..util.text import normalize_whitespace, parse_date_range, extract_money, extract_rate
+from ..util import metrics
+from ..util.pdftext import default_extractor
+from ..util.text import normalize_whitespace, extract_fields
+
+# 抽出結果を待たずに先へ進める文書数の上限（一時ファイルと抽出待ちの数を抑える）
+PENDING_WINDOW = 32
 
 class PdfHarvester(Harvester):
     def harvest(self) -> Iterable[GrantOpportunity]:
-        # This is a lightweight placeholder. For real extraction, install pdfminer.six / pdfplumber.
+        # テキスト抽出は別プロセスで並行に行う（pdfminer.six が必要。無ければ本文なしで出力）
+        extractor = default_extractor()
+        opts = {}
+        if self.config.get("max_pages") is not None:
+            opts["max_pages"] = int(self.config["max_pages"])
+        if self.config.get("timeout_sec") is not None:
+            opts["timeout_sec"] = float(self.config["timeout_sec"])
+
         urls = self.config["urls"]
-        for u in urls:
-            resp = self.fetcher.get(u)
-            if resp.status_code == 304:
-                continue
-            resp.raise_for_status()
-            text = None
-            try:
-                import io
-                from pdfminer.high_level import extract_text
-                text = extract_text(io.BytesIO(resp.content))
-            except Exception:
-                text = None
+        pending = deque()
+        # 本文はメモリに載せずファイルに書き出し、抽出プロセスがパスから読む（pdf.max_mb を超えるものは取得しない）
+        downloads = self.fetcher.download_many(urls, return_exceptions=True, max_bytes=extractor.max_bytes,
+                                               precheck=bool(self.config.get("precheck", False)))
+        failed = 0
+        try:
+            # 取得しながら抽出を投入し、抽出の済んだものから URL の順に流す
+            for u, dl in downloads:
+                # 1件の 404/5xx や接続エラーではソース全体を止めず、そのURLだけ出力しない
+                try:
+                    if isinstance(dl, Exception):
+                        raise dl
+                    dl.raise_for_status()
+                except Exception as e:
+                    if not isinstance(dl, Exception):
+                        dl.close()
+                    failed += 1
+                    metrics.incr("failed_urls")
+                    print(f"[WARN] Failed to download PDF {u}: {e}")
+                    continue
+                pending.append((u, dl, None))
+                if dl.skipped:
+                    print(f"[WARN] PDF too large ({dl.size} bytes), skipped: {u}")
+                else:
+                    pending[-1] = (u, dl, extractor.submit(dl.path, label=u, content_hash=dl.content_hash, **opts))
+                # 抽出待ちが溜まりすぎたら先頭の完了を待つ（取得は download_many の窓の分だけ先に進む）
+                while pending and (len(pending) > PENDING_WINDOW or pending[0][2] is None
+                                   or pending[0][2].done()):
+                    yield self._next(pending)
+            if urls and failed == len(urls):
+                # すべて失敗したときはソースの失敗として扱う（前回のレコードを期限切れにしない）
+                raise RuntimeError(f"all {failed} PDF downloads failed")
+
+            while pending:
+                yield self._next(pending)
+        finally:
+            downloads.close()
+            for _, dl, fut in pending:
+                if fut is not None:
+                    fut.add_done_callback(lambda _, dl=dl: dl.close())
+                else:
+                    dl.close()
+
+    def _next(self, pending: deque) -> GrantOpportunity:
+        u, dl, fut = pending[0]
+        text = fut.result() if fut is not None else None
+        pending.popleft()
+        dl.close()
+        return self._make_opportunity(u, text)
 
-            summary = normalize_whitespace((text or "")) if text else None
-            start, end = parse_date_range(summary or "") # 全文テキストから期間を抽出
-            opp = GrantOpportunity(
-                title=self.config.get("title_hint") or "(PDF) " + u.split("/")[-1],
-                url=u,
-                issuer_name=self.config.get("issuer_name"),
-                issuer_level=self.config.get("issuer_level"),
-                region_code=self.config.get("region_code"),
-                category=None,
-                summary=(summary[:500] + "…") if summary and len(summary) > 500 else summary, # 要約は切り詰める
-                application_start=start,
-                application_end=end,
-                amount=extract_money(summary or ""),
-                subsidy_rate=extract_rate(summary or ""),
-                source_type="PDF",
-                fetched_at=datetime.now(timezone.utc).isoformat(),
-                raw={"parsed": bool(summary)},
-            )
-            opp.category = self.classifier((opp.title or "") + " " + (opp.summary or ""))
-            yield opp
+    def _make_opportunity(self, u: str, text: Optional[str]) -> GrantOpportunity:
+        summary = normalize_whitespace((text or "")) if text else None
+        fields = extract_fields(summary or "", first_only=True) # 全文テキストから期間・金額・補助率を抽出
+        start, end = fields.period
+        opp = GrantOpportunity(
+            title=self.config.get("title_hint") or "(PDF) " + u.split("/")[-1],
+            url=u,
+            issuer_name=self.config.get("issuer_name"),
+            issuer_level=self.config.get("issuer_level"),
+            region_code=self.config.get("region_code"),
+            category=None,
+            summary=(summary[:500] + "…") if summary and len(summary) > 500 else summary, # 要約は切り詰める
+            application_start=start,
+            application_end=end,
+            amount=fields.amount,
+            subsidy_rate=fields.rate,
+            source_type="PDF",
+            fetched_at=datetime.now(timezone.utc).isoformat(),
+            raw={"parsed": bool(summary)},
+        )
+        opp.category = self.classifier((opp.title or "") + " " + (opp.summary or ""))
+        return opp
@@ -1,10 +1,11 @@
 
 import xml.etree.ElementTree as ET
-import re
 from datetime import datetime, timezone
 from typing import Iterable
 from email.utils import parsedate_to_datetime
 from .base import Harvester
+from ..util.filters import PatternFilter
+from ..util import metrics
 from ..schema import GrantOpportunity
 from ..util.text import normalize_whitespace
 
@@ -15,11 +16,11 @@ class RssHarvester(Harvester):
         if resp.status_code == 304:
             return []
         resp.raise_for_status()
-        xml = ET.fromstring(resp.content)
+        with metrics.timer("parse"):
+            xml = ET.fromstring(resp.content)
         channel = xml.find("channel")
         items = channel.findall("item") if channel is not None else xml.findall(".//item")
-        include_patterns = self.config.get("include_patterns", [])
-        exclude_patterns = self.config.get("exclude_patterns", [])
+        flt = PatternFilter.from_config(self.config)
         for it in items:
             title = (it.findtext("title") or "").strip()
             link = (it.findtext("link") or "").strip()
@@ -28,9 +29,7 @@ class RssHarvester(Harvester):
             
             # キーワードフィルタリング (タイトルとdescriptionの両方を対象)
             text_to_check = title + " " + desc
-            if include_patterns and not any(re.search(p, text_to_check) for p in include_patterns):
-                continue
-            if exclude_patterns and any(re.search(p, text_to_check) for p in exclude_patterns):
+            if not flt.matches(text_to_check):
                 continue
 
             published_at_str = it.findtext("pubDate") or it.findtext("{http://purl.org/dc/elements/1.1/}date")
@@ -1,24 +1,81 @@
 
-import re, xml.etree.ElementTree as ET
+import io, gzip, xml.etree.ElementTree as ET
 from datetime import datetime, timezone
-from typing import Iterable, List
+from typing import Iterable, Iterator, List, Optional, Tuple, BinaryIO, Union
 from .base import Harvester
+from ..util.filters import PatternFilter
+from ..util import metrics
 from ..schema import GrantOpportunity
 
+GZIP_MAGIC = b"\x1f\x8b"
+# 1ファイルの上限（プロトコル上は非圧縮で 50MB まで。超えるものは取得しない）
+DEFAULT_MAX_MB = 100
+
+def parse_lastmod(value: Optional[str]) -> Optional[datetime]:
+    """W3C datetime ('2025-04-01', '2025-04-01T09:00:00+09:00') -> aware UTC datetime."""
+    if not value:
+        return None
+    v = value.strip()
+    if v.endswith("Z"):
+        v = v[:-1] + "+00:00"
+    try:
+        dt = datetime.fromisoformat(v)
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
+def open_sitemap_stream(content: Union[bytes, str]) -> BinaryIO:
+    """A binary stream over a sitemap given as bytes or as a file path (e.g. from
+    `HttpFetcher.download`), gunzipped on the fly if needed. Close it when done."""
+    # .xml.gz はサーバが Content-Encoding を付けずに返すことが多いので、先頭バイトで判定する
+    if isinstance(content, str):
+        with open(content, "rb") as f:
+            magic = f.read(2)
+        return gzip.open(content, "rb") if magic == GZIP_MAGIC else open(content, "rb")
+    stream = io.BytesIO(content)
+    if content[:2] == GZIP_MAGIC:
+        return gzip.GzipFile(fileobj=stream)
+    return stream
+
+def iter_sitemap_entries(stream: BinaryIO) -> Iterator[Tuple[str, str, Optional[str]]]:
+    """Streams (kind, loc, lastmod) from a sitemap or sitemap index, where kind is
+    'sitemap' or 'url'. Parsed elements are cleared as we go so memory stays flat."""
+    root = None
+    for event, elem in ET.iterparse(stream, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = elem
+            continue
+        tag = elem.tag.rsplit("}", 1)[-1]
+        if tag in ("url", "sitemap"):
+            loc = lastmod = None
+            for child in elem:
+                ctag = child.tag.rsplit("}", 1)[-1]
+                if ctag == "loc":
+                    loc = (child.text or "").strip()
+                elif ctag == "lastmod":
+                    lastmod = (child.text or "").strip() or None
+            if loc:
+                yield tag, loc, lastmod
+            root.clear()
+
 class SitemapHarvester(Harvester):
     def harvest(self) -> Iterable[GrantOpportunity]:
         initial_sitemap_url = self.config["url"]
-        locs = self._get_all_page_urls([initial_sitemap_url])
+        flt = PatternFilter.from_config(self.config)
 
-        inc = self.config.get("include_patterns", [])
-        exc = self.config.get("exclude_patterns", [])
-
-        for loc in locs:
-            if inc and not any(re.search(p, loc) for p in inc): 
-                continue
-            if exc and any(re.search(p, loc) for p in exc): 
-                continue
+        # incremental: true のとき、前回までに見た最新の <lastmod> より新しいURLだけを出す
+        state = getattr(self.fetcher, "state", None)
+        wm_key = f"sitemap:{self.config.get('name') or initial_sitemap_url}"
+        since = None
+        if self.config.get("incremental") and state is not None:
+            since = parse_lastmod(state.get_watermark(wm_key))
+        progress = {"newest": since, "failed": False}
 
+        entries = self._iter_page_urls([initial_sitemap_url], since, progress)
+        for loc, lastmod in flt.ifilter(entries, key=lambda e: e[0]):
             opp = GrantOpportunity(
                 title="(ページ候補) " + loc,
                 url=loc,
@@ -29,41 +86,66 @@ class SitemapHarvester(Harvester):
                 summary=None,
                 source_type="SITEMAP",
                 fetched_at=datetime.now(timezone.utc).isoformat(),
-                raw={},
+                raw={"lastmod": lastmod} if lastmod else {},
             )
             opp.category = self.classifier(opp.title)
             yield opp
 
-    def _get_all_page_urls(self, sitemap_urls: List[str]) -> List[str]:
-        """Recursively fetches sitemaps and extracts all page URLs."""
-        all_locs: List[str] = []
-        queue = sitemap_urls[:]
+        # 取りこぼしがあった回は次回に再取得できるよう、基準時刻を進めない。
+        # 書き込むのはレコードの確定後（run_pipeline が save_watermarks を呼ぶ）
+        if self.config.get("incremental") and state is not None and not progress["failed"] \
+                and progress["newest"] is not None:
+            state.stage_watermark(wm_key, progress["newest"].isoformat())
+
+    def _iter_page_urls(self, sitemap_urls: List[str], since: Optional[datetime] = None,
+                        progress: Optional[dict] = None) -> Iterator[Tuple[str, Optional[str]]]:
+        """Follows sitemap indexes level by level (each level fetched concurrently) and
+        streams (page_url, lastmod). With `since`, entries whose lastmod is not newer are
+        skipped, and child sitemaps that have not changed are not fetched at all.
+        Each sitemap is downloaded to disk and parsed from the file, so memory does not
+        grow with its size; files over `max_mb` are skipped."""
+        progress = progress if progress is not None else {}
+        max_mb = float(self.config.get("max_mb", DEFAULT_MAX_MB))
+        max_bytes = int(max_mb * 1024 * 1024)
+        level = list(sitemap_urls)
         processed_sitemaps = set()
+        found = 0
+
+        while level:
+            batch = []
+            for sitemap_url in level:
+                if sitemap_url in processed_sitemaps:
+                    continue
+                print(f"[INFO] Processing sitemap: {sitemap_url}")
+                processed_sitemaps.add(sitemap_url)
+                batch.append(sitemap_url)
+            level = []
+
+            for sitemap_url, dl in self.fetcher.download_many(batch, return_exceptions=True,
+                                                              max_bytes=max_bytes):
+                try:
+                    if isinstance(dl, Exception):
+                        raise dl
+                    with dl:
+                        if dl.skipped:
+                            raise ValueError(f"larger than {max_mb:g} MB, skipped")
+                        dl.raise_for_status()
+                        with open_sitemap_stream(dl.path) as stream:
+                            entries = iter_sitemap_entries(stream)
+                            for kind, loc, lastmod in metrics.timed_iter(entries, "parse"):
+                                lm = parse_lastmod(lastmod)
+                                if lm is not None:
+                                    if since is not None and lm <= since:
+                                        continue
+                                    if progress.get("newest") is None or lm > progress["newest"]:
+                                        progress["newest"] = lm
+                                if kind == "sitemap":
+                                    level.append(loc)
+                                else:
+                                    found += 1
+                                    yield loc, lastmod
+                except Exception as e:
+                    progress["failed"] = True
+                    print(f"[WARN] Failed to process sitemap {sitemap_url}: {e}")
 
-        while queue:
-            sitemap_url = queue.pop(0)
-            if sitemap_url in processed_sitemaps:
-                continue
-            
-            print(f"[INFO] Processing sitemap: {sitemap_url}")
-            processed_sitemaps.add(sitemap_url)
-            
-            try:
-                resp = self.fetcher.get(sitemap_url)
-                if resp.status_code == 304: continue
-                resp.raise_for_status()
-                xml = ET.fromstring(resp.content)
-                
-                # Check if it's a sitemap index file
-                if xml.tag.endswith("sitemapindex"):
-                    sitemap_locs = [e.text for e in xml.findall(".//{*}sitemap/{*}loc") if e.text]
-                    queue.extend(sitemap_locs)
-                # Or a regular sitemap file
-                elif xml.tag.endswith("urlset"):
-                    page_locs = [e.text for e in xml.findall(".//{*}url/{*}loc") if e.text]
-                    all_locs.extend(page_locs)
-            except Exception as e:
-                print(f"[WARN] Failed to process sitemap {sitemap_url}: {e}")
-        
-        print(f"[INFO] Found {len(all_locs)} page URLs from sitemaps.")
-        return all_locs
+        print(f"[INFO] Found {found} page URLs from sitemaps.")
@@ -1,128 +1,467 @@
 
-import json, os
-from typing import Dict, Any, List
+import os, queue, shutil, threading, time
+from collections import deque
+from typing import Dict, Any, List, Iterable, Iterator, Callable, Optional, Tuple
 from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 from .schema import GrantOpportunity
-from .util.fetch import HttpFetcher
-from .util.classify import choose_category
-
-from .harvesters.rss import RssHarvester
-from .harvesters.sitemap import SitemapHarvester
-from .harvesters.html import HtmlHarvester
-from .harvesters.pdf import PdfHarvester
-
-HARVESTER_REGISTRY = {
-    "rss": RssHarvester,
-    "sitemap": SitemapHarvester,
-    "html": HtmlHarvester,
-    "pdf": PdfHarvester,
-}
-
-def make_classifier(keywords_conf: Dict[str, Dict[str, float]]):
-    from .util.classify import choose_category as _choose
-    def _clf(text: str) -> str:
-        return _choose(text or "", keywords_conf, default="other")
-    return _clf
+from .util.fetch import HttpFetcher, CACHE_DIR, BODY_CACHE_DIR, RECORD_DB, STATE_DB, open_state_store
+from .util.cache import BodyCache
+from .util.state import FetchStateStore
+from .util.archive import ArchiveReader, ArchiveWriter
+from .util.classify import KeywordClassifier
+from .util import metrics, pdftext, htmlparse, profiling
+from .sink import OutputSink
+from .enrich import Enricher, is_candidate
+from .store import RecordStore, DeltaWriter, richness
+from .schedule import RefreshScheduler
+from . import shard as sharding
+# ハーベスタ本体は該当 type のソースを実行するときに読み込む（entry points でも追加できる）
+from .registry import HARVESTER_REGISTRY
+
+# --replay の作業領域（実行のたびに空から作り直す。通常の実行のストアには触れない）
+REPLAY_DIR = os.path.join(CACHE_DIR, "replay")
+
+def make_classifier(keywords_conf: Dict[str, Dict[str, float]]) -> KeywordClassifier:
+    # 設定読み込み時に一度だけコンパイルする。呼び出しは従来どおり clf(text) -> category
+    return KeywordClassifier(keywords_conf, default="other")
 
 def load_yaml(path: str) -> Dict[str, Any]:
     import yaml  # requires pyyaml (install locally)
     with open(path, "r", encoding="utf-8") as f:
         return yaml.safe_load(f)
 
-def run_pipeline(config_path: str, keywords_path: str, out_dir: str) -> str:
+def source_key(src: Dict[str, Any]) -> str:
+    """Stable identifier of a source entry in sources.yaml."""
+    if src.get("name"):
+        return src["name"]
+    first = src.get("url") or (src.get("urls") or [""])[0]
+    return f"{src.get('type')}:{first}"
+
+def _pdf_options(config: Dict[str, Any]) -> Dict[str, Any]:
+    pdf_conf = config.get("pdf") or {}
+    return {"workers": pdf_conf.get("workers"),
+            "timeout_sec": float(pdf_conf.get("timeout_sec", 60)),
+            "max_pages": int(pdf_conf.get("max_pages", 50)),
+            "max_bytes": int(float(pdf_conf.get("max_mb", 30)) * 1024 * 1024)}
+
+def _harvest_source(fetcher: HttpFetcher, classifier: KeywordClassifier, src: Dict[str, Any],
+                    finished: List[str]) -> Iterator[Tuple[str, GrantOpportunity]]:
+    """Yields (source key, record) of one source; appends the key to `finished`
+    when the source was harvested to the end."""
+    typ = src.get("type")
+    try:
+        Harv = HARVESTER_REGISTRY.get(typ)
+    except Exception as e:  # プラグインの import 失敗（依存パッケージ不足など）
+        print(f"[WARN] harvester unavailable: {typ}: {e}")
+        return
+    if not Harv:
+        print(f"[WARN] unknown harvester type: {typ}")
+        return
+
+    print(f"[INFO] Harvesting from source: {src.get('issuer_name', typ)}")
+    key = source_key(src)
+    # このソースの取得・解析で計測した値はすべて key に帰属させる（ソースごとに別コンテキスト）
+    metrics.set_source(key)
+    harvester = Harv(fetcher, classifier, src)
+    t0 = time.perf_counter()
+    n = 0
+    try:
+        with profiling.scope(key):
+            for opp in harvester.harvest():
+                n += 1
+                yield key, opp
+    except Exception as e:
+        print(f"[WARN] source failed: {src.get('name') or src.get('issuer_name', typ)}: {e}")
+        metrics.incr("failed")
+        return
+    finally:
+        metrics.incr("records", n)
+        metrics.add_time("harvest", time.perf_counter() - t0)
+    finished.append(key)
+
+def run_pipeline(config_path: str, keywords_path: str, out_dir: str, snapshot: bool = False,
+                 parquet: bool = False, shard: Optional[Tuple[int, int]] = None,
+                 all_sources: bool = False, profile_dir: Optional[str] = None,
+                 record_dir: Optional[str] = None, replay_dir: Optional[str] = None,
+                 as_of: Optional[str] = None, workers: Optional[int] = None) -> str:
+    """Harvests the sources that are due for a refresh (all of them with
+    `all_sources=True`; see `schedule.RefreshScheduler`), or with `shard=(i, N)` the
+    due ones of the i-th of N host-partitioned subsets, into the record store and
+    returns the path of `grants_latest.jsonl`. Sources not fetched keep their records.
+
+    A shard run keeps its own record and fetch-state stores (seeded from the merged
+    ones), writes its delta under `out_dir/shards/i-of-N/` and returns that path;
+    `merge_shards` then folds the shards into the merged stores and `grants_latest.*`.
+
+    With `profile_dir`, each source's harvest and the output stage are profiled
+    (see `util.profiling.Profiler`) and the report is written there.
+
+    With `record_dir`, every response is also appended to the HTTP archive there
+    (`util.archive.ArchiveWriter`). With `replay_dir`, all sources are harvested
+    from that archive instead of the network (the latest record of each URL, or
+    the latest at or before `as_of`) into fresh stores under `REPLAY_DIR`, so the
+    output in `out_dir` shows what the current parsers make of the recorded crawl.
+    Replayed sources are parsed on `workers` processes (default: CPU count).
+    """
     config = load_yaml(config_path)
     keywords_conf = load_yaml(keywords_path)
+    run_metrics = metrics.start_run()
+    if profile_dir:
+        profiling.start(profile_dir)
+    sources = config.get("sources", [])
+    record_db, state_db, metrics_conf = RECORD_DB, STATE_DB, dict(config.get("metrics") or {})
+    body_dir = BODY_CACHE_DIR
+    replay = ArchiveReader(replay_dir, as_of=as_of) if replay_dir else None
+    if replay is not None:
+        shutil.rmtree(REPLAY_DIR, ignore_errors=True)
+        record_db, state_db = os.path.join(REPLAY_DIR, "records.sqlite"), os.path.join(REPLAY_DIR, "fetch_state.sqlite")
+        body_dir = os.path.join(REPLAY_DIR, "bodies")
+        # 監視用のメトリクスは上書きしない
+        metrics_conf = {"summary": os.path.join(REPLAY_DIR, "run_summary.json")}
+        workers = max(1, workers or os.cpu_count() or 1)
+        if profile_dir and workers > 1:
+            print("[INFO] Profiling replays sources in this process (--workers 1)")
+            workers = 1
+        print(f"[INFO] Replay: {replay.urls()} URLs from {replay_dir}"
+              + (f" as of {as_of}" if as_of else "") + f", {workers} worker(s)")
+    if shard is not None:
+        i, n = shard
+        total = len(sources)
+        sources = sharding.select_sources(sources, i, n)
+        record_db, state_db = sharding.shard_path(RECORD_DB, i, n), sharding.shard_path(STATE_DB, i, n)
+        for main, path in ((RECORD_DB, record_db), (STATE_DB, state_db)):
+            if sharding.seed(main, path):
+                print(f"[INFO] Shard {i}/{n}: started {os.path.basename(path)} from the merged store")
+        out_dir = os.path.join(out_dir, "shards", f"{i}-of-{n}")
+        metrics_conf["summary"] = sharding.shard_path(
+            metrics_conf.get("summary") or os.path.join(CACHE_DIR, "run_summary.json"), i, n)
+        if metrics_conf.get("prometheus_textfile"):
+            metrics_conf["prometheus_textfile"] = sharding.shard_path(metrics_conf["prometheus_textfile"], i, n)
+        print(f"[INFO] Shard {i}/{n}: {len(sources)} of {total} sources")
 
-    fetcher = HttpFetcher(min_interval_sec=config.get("min_interval_sec", 1.0))
+    state = open_state_store(state_db)
+    # 再処理ではアーカイブの全ソースを対象にし、変化履歴も残さない
+    scheduler = RefreshScheduler(state, {"enabled": False} if replay is not None else config.get("refresh"))
+    # all_sources でも変化履歴は記録する
+    if scheduler.enabled and not all_sources:
+        sources, skipped = scheduler.select(sources, source_key)
+        run_metrics.extra["refresh"] = {"due": len(sources), "skipped": len(skipped)}
+        print(f"[INFO] Refresh: {len(sources)} sources due, {len(skipped)} skipped "
+              f"(not due yet or over the request budget)")
+
+    max_concurrency = int(config.get("max_concurrency", 8))
+    throttle = config.get("throttle") or {}
+    archive = ArchiveWriter(record_dir) if record_dir else None
+    fetcher = HttpFetcher(min_interval_sec=config.get("min_interval_sec", 1.0),
+                          timeout=float(throttle.get("timeout_sec", 20)),
+                          max_concurrency=max_concurrency,
+                          state=state,
+                          per_host_concurrency=int(config.get("per_host_concurrency", 1)),
+                          body_cache=BodyCache(body_dir,
+                                               int(float(config.get("body_cache_max_mb", 512)) * 1024 * 1024)),
+                          min_interval_floor_sec=throttle.get("min_interval_sec"),
+                          max_interval_sec=float(throttle.get("max_interval_sec", 60)),
+                          retries=int(throttle.get("retries", 3)),
+                          backoff_base_sec=float(throttle.get("backoff_base_sec", 1.0)),
+                          max_retry_after_sec=float(throttle.get("max_retry_after_sec", 120)),
+                          respect_robots=throttle.get("respect_robots", True),
+                          record=archive, replay=replay)
     classifier = make_classifier(keywords_conf.get("categories", {}))
+    pdf_options = _pdf_options(config)
+    pdf_extractor = pdftext.configure(**pdf_options)
+    html_parser = htmlparse.set_default_backend(config.get("html_parser", "auto"))
+    print(f"[INFO] HTML parser: {html_parser}")
+    completed: List[str] = []  # 最後まで収集できたソース（未出現レコードを期限切れにしてよい）
+    checked: List[str] = []    # 最後まで収集できたソース（incremental を含む。変化履歴に記録する）
+
+    def _finished(src: Dict[str, Any], key: str):
+        checked.append(key)
+        # incremental なソースは変化分しか出さないので、出なかったレコードを期限切れにしない
+        if not src.get("incremental"):
+            completed.append(key)
+
+    def _harvest(src: Dict[str, Any]) -> Iterator[Tuple[str, GrantOpportunity]]:
+        finished: List[str] = []
+        yield from _harvest_source(fetcher, classifier, src, finished)
+        for key in finished:
+            _finished(src, key)
 
-    results: List[GrantOpportunity] = []
-    for src in config.get("sources", []):
-        typ = src.get("type")
-        Harv = HARVESTER_REGISTRY.get(typ)
-        if not Harv:
-            print(f"[WARN] unknown harvester type: {typ}")
-            continue
-
-        print(f"[INFO] Harvesting from source: {src.get('issuer_name', typ)}")
-        harvester = Harv(fetcher, classifier, src)
-        for opp in harvester.harvest():
-            results.append(opp)
-
-    # Deduplicate by URL + title
-    seen = set()
-    deduped = []
-    for r in results:
-        key = (r.url or "", r.title or "")
-        if key in seen: 
-            continue
-        seen.add(key)
-        deduped.append(r)
-
-    os.makedirs(out_dir, exist_ok=True)
     ts = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
-    out_jsonl = os.path.join(out_dir, f"grants_{ts}.jsonl")
-    with open(out_jsonl, "w", encoding="utf-8") as f:
-        for r in deduped:
-            f.write(json.dumps(r.to_dict(), ensure_ascii=False) + "\n")
+    dedup_conf = config.get("dedup") or {}
+    store = RecordStore(record_db, near_duplicates=dedup_conf.get("near_duplicates", True),
+                        max_distance=int(dedup_conf.get("max_distance", 3)))
+    store.begin_run()
+    delta = DeltaWriter(out_dir, ts)
+    # 従来のタイムスタンプ付き全件スナップショットは --snapshot 指定時のみ。
+    # latest は最後に compact がストアから1回だけ作る
+    sink = OutputSink(out_dir, ts, parquet=parquet, publish=False) if snapshot else None
+    enrich_conf = config.get("enrich") or {}
+    enricher = None
+    if enrich_conf.get("enabled", True):
+        enricher = Enricher(fetcher, classifier,
+                            max_requests=int(enrich_conf.get("max_requests", 200)),
+                            max_bytes=int(float(enrich_conf.get("max_mb", 50)) * 1024 * 1024),
+                            skip_sources=[source_key(s) for s in sources if s.get("enrich") is False],
+                            max_page_bytes=(int(float(enrich_conf["max_page_mb"]) * 1024 * 1024)
+                                            if enrich_conf.get("max_page_mb") else None))
 
-    # also write CSV (minimal)
+    def _emit(key: str, opp: GrantOpportunity):
+        # 補完しなかった候補（予算外・取得失敗）は、前回補完して保存した内容を消さない
+        store.upsert(opp, key, keep_richer=is_candidate(opp))
+        if sink is not None:
+            sink.add(opp)
 
-    # also write JA CSV matching user's format
     try:
-        out_csv_ja = None
-        import csv
-        out_csv_ja = os.path.join(out_dir, f"grants_{ts}_ja.csv")
-        with open(out_csv_ja, "w", encoding="utf-8-sig", newline="") as f:
-            w = csv.writer(f)
-            # Columns: 補助金名, 補助金上限額, 補助率, 対象地域, 従業員数の上限, 募集期間, 詳細URL, 取得日時
-            w.writerow(["補助金名","補助金上限額","補助率","対象地域","従業員数の上限","募集期間","詳細URL", "取得日時"])
-            for r in deduped:
-                period = None
-                if r.application_start or r.application_end:
-                    s = r.application_start or ""
-                    e = r.application_end or ""
-                    if s or e:
-                        period = f"{s} ～ {e}".strip(" ～ ")
-                w.writerow([
-                    r.title or "",
-                    r.amount or "",
-                    r.subsidy_rate or "",
-                    r.issuer_name or "",
-                    "",  # 従業員数の上限は未取得のため空欄
-                    period or "",
-                    r.url or "",
-                    r.fetched_at or ""
-                ])
-    except Exception as e:
-        out_csv_ja = None
-        print("[WARN] JA CSV export failed:", e)
-    out_csv = None
+        # ソース単位で並行に収集し、届いた順にそのまま処理する（全件をメモリに溜めない）
+        if replay is not None and workers > 1:
+            stream = _replay_sources(sources, workers, run_metrics, _finished,
+                                     (replay_dir, as_of, keywords_conf, pdf_options, html_parser))
+        else:
+            stream = _stream_sources(sources, _harvest, max_workers=max_concurrency)
+        with profiling.scope("(output)"):
+            for key, opp in stream:
+                if enricher is None:
+                    _emit(key, opp)
+                    continue
+                # 詳細ページ候補は優先度上位だけ手元に残し、残りはそのまま流す
+                for k, o in enricher.offer(key, opp):
+                    _emit(k, o)
+        if enricher is not None:
+            # 同じURLでより詳しいレコードが既にあれば取得しない
+            with metrics.source_scope("(enrich)"), profiling.scope("(enrich)"):
+                for k, o in enricher.drain(skip=lambda o: (store.run_richness(o.url) or -1) > richness(o)):
+                    _emit(k, o)
+            run_metrics.extra["enrich"] = dict(enricher.stats)
+            print(f"[INFO] Enrichment: {enricher.summary()}")
+        with profiling.scope("(output)"):
+            for op, key, rec in store.iter_delta():
+                delta.write(op, rec, key)
+            for key, rec in store.expire_missing(completed):
+                delta.write("expired", rec, key)
+        if store.dedup is not None:
+            run_metrics.extra["dedup"] = {"merged": store.merged, **store.dedup.stats}
+            print(f"[INFO] Dedup: {store.merged} records merged into another source's record "
+                  f"({store.dedup.stats['merged']} newly detected)")
+        store.commit()
+        # レコードを確定してから記録する（失敗した実行のソースは次回も期限のまま、
+        # サイトマップの基準時刻も進まない）
+        state.save_watermarks()
+        if scheduler.enabled:
+            for key in checked:
+                c = run_metrics.counters(key)
+                scheduler.record(key, c.get("changed", 0) > 0, c.get("requests", 0))
+            scheduler.save()
+    except BaseException:
+        store.rollback()
+        state.discard_watermarks()
+        _stop_profiling()
+        raise
+    finally:
+        # 取得状態をまとめて書き出す
+        fetcher.close()
+        pdf_extractor.close()
+        if archive is not None:
+            archive.close()
+            print(f"[INFO] Archive: {archive.count} responses ({archive.revisits} unchanged bodies as revisits) "
+                  f"-> {os.path.join(record_dir, archive.segment)}")
+        if replay is not None:
+            replay.close()
+        delta_path = delta.close()
+        if sink is not None:
+            sink.close()
+        run_metrics.extra["delta"] = dict(delta.counts)
+        _write_metrics(metrics.stop_run(), metrics_conf)
+    c = delta.counts
+    print(f"[INFO] Delta: {c['new']} new, {c['changed']} changed, {c['expired']} expired"
+          + (f" -> {delta_path}" if delta_path else ""))
+
+    if shard is not None:
+        # latest はシャードをまとめてから作る（merge_shards）
+        store.close()
+        _stop_profiling()
+        return delta_path or out_dir
     try:
-        import csv
-        out_csv = os.path.join(out_dir, f"grants_{ts}.csv")
-        with open(out_csv, "w", encoding="utf-8", newline="") as f:
-            w = csv.writer(f)
-            w.writerow(["title","url","issuer_name","issuer_level","region_code","category",
-                        "application_start","application_end","amount","subsidy_rate","published_at","fetched_at"])
-            for r in deduped:
-                w.writerow([r.title, r.url, r.issuer_name, r.issuer_level, r.region_code, r.category,
-                            r.application_start, r.application_end, r.amount, r.subsidy_rate, r.published_at, r.fetched_at])
-    except Exception as e:
-        out_csv = None
-        print("[WARN] CSV export failed:", e)
+        with profiling.scope("(output)"):
+            paths = compact(out_dir, store=store, parquet=parquet)
+    finally:
+        _stop_profiling()
+    return paths["jsonl"]
+
+def _stop_profiling():
+    report = profiling.stop()
+    if report:
+        print(f"[INFO] Profile: {report} (flame graph stacks: *.folded, cProfile: *.pstats)")
 
-    # Create 'latest' copies for easy access
+def merge_shards(config_path: str, out_dir: str, shards: int, parquet: bool = False) -> str:
+    """Folds the stores of `--shard i/N` runs into the merged record and fetch-state
+    stores, writes one `delta_<ts>.jsonl` for the round and rebuilds `grants_latest.*`.
+    Shards without a record store (a failed job) are skipped with a warning."""
+    config = load_yaml(config_path)
+    record_paths = []
+    state = open_state_store(STATE_DB)
     try:
-        import shutil
-        shutil.copyfile(out_jsonl, os.path.join(out_dir, "grants_latest.jsonl"))
-        if out_csv_ja:
-            shutil.copyfile(out_csv_ja, os.path.join(out_dir, "grants_latest_ja.csv"))
-        if out_csv:
-            shutil.copyfile(out_csv, os.path.join(out_dir, "grants_latest.csv"))
-        print("Created 'latest' copies of the output files.")
-    except Exception as e:
-        print(f"[WARN] Could not create 'latest' copies: {e}")
+        for i in range(1, shards + 1):
+            path = sharding.shard_path(RECORD_DB, i, shards)
+            if not os.path.exists(path):
+                print(f"[WARN] shard {i}/{shards}: no record store at {path}, skipped")
+                continue
+            record_paths.append(path)
+            state_path = sharding.shard_path(STATE_DB, i, shards)
+            if os.path.exists(state_path):
+                state.merge(state_path)
+    finally:
+        state.close()
+
+    dedup_conf = config.get("dedup") or {}
+    store = RecordStore(RECORD_DB, near_duplicates=dedup_conf.get("near_duplicates", True),
+                        max_distance=int(dedup_conf.get("max_distance", 3)))
+    delta = DeltaWriter(out_dir, datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ"))
+    try:
+        expired = store.merge(record_paths)
+        for op, key, rec in store.iter_delta():
+            delta.write(op, rec, key)
+        for key, rec in expired:
+            delta.write("expired", rec, key)
+        store.commit()
+    except BaseException:
+        store.rollback()
+        raise
+    finally:
+        delta_path = delta.close()
+    c = delta.counts
+    print(f"[INFO] Merged {len(record_paths)} of {shards} shards. Delta: {c['new']} new, "
+          f"{c['changed']} changed, {c['expired']} expired" + (f" -> {delta_path}" if delta_path else ""))
+    paths = compact(out_dir, store=store, parquet=parquet)
+    return paths["jsonl"]
+
+def _write_metrics(run_metrics: metrics.RunMetrics, conf: Dict[str, Any]):
+    """Writes the run summary JSON (and the Prometheus textfile if configured)."""
+    try:
+        summary = run_metrics.write_summary(conf.get("summary") or os.path.join(CACHE_DIR, "run_summary.json"))
+        t = run_metrics.summary()["totals"]
+        print(f"[INFO] Metrics: {t.get('requests', 0)} requests, {t.get('bytes', 0) / 1024 / 1024:.1f} MB, "
+              f"{t.get('errors', 0)} errors, {t.get('failed', 0)} failed sources -> {summary}")
+        if conf.get("prometheus_textfile"):
+            run_metrics.write_prometheus(conf["prometheus_textfile"])
+    except OSError as e:
+        print(f"[WARN] Could not write metrics: {e}")
+
+def compact(out_dir: str, store: Optional[RecordStore] = None, store_path: Optional[str] = None,
+            vacuum: bool = False, parquet: bool = False) -> Dict[str, Optional[str]]:
+    """Rebuilds `grants_latest.*` from the record store (all non-expired records)."""
+    own = store is None
+    if own:
+        store = RecordStore(store_path or RECORD_DB)
+    try:
+        latest = OutputSink(out_dir, dedupe=False, parquet=parquet)
+        # JSONL には保存済みの JSON をそのまま書く
+        for line, opp in store.iter_current_json():
+            latest.add(opp, line)
+        paths = latest.close()
+        total, expired = store.counts()
+        print(f"[INFO] Latest view: {latest.count} records ({expired} expired kept in store).")
+    finally:
+        store.close(vacuum=vacuum)
+    return paths
+
+def _stream_sources(sources: List[Dict[str, Any]], harvest_fn: Callable[[Dict[str, Any]], Iterable[Any]],
+                    max_workers: int, buffer: int = 1000) -> Iterator[Any]:
+    """Runs `harvest_fn` for every source on a thread pool and yields the records in
+    source order (same order as a serial run). Each source has a bounded queue, so a
+    fast source waits for the consumer instead of piling its records up in memory."""
+    if not sources:
+        return
+    done = object()
+    stop = threading.Event()
+    queues = [queue.Queue(maxsize=buffer) for _ in sources]
+
+    def _put(q: "queue.Queue", item) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run(i: int):
+        q = queues[i]
+        try:
+            for opp in harvest_fn(sources[i]):
+                if not _put(q, opp):
+                    return
+        finally:
+            _put(q, done)
+
+    # 投入順に実行されるため、i 番目を待っている間に i 番目が未着手のままになることはない
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(sources))),
+                            thread_name_prefix="source") as pool:
+        for i in range(len(sources)):
+            # ソースごとにコンテキストを分け、計測値の帰属先が混ざらないようにする
+            pool.submit(metrics.bind(_run), i)
+        try:
+            for q in queues:
+                while True:
+                    item = q.get()
+                    if item is done:
+                        break
+                    yield item
+        finally:
+            stop.set()
+
+# --- 再処理（--replay）: ソースごとに別プロセスで解析する ---
+
+_replay_worker: Dict[str, Any] = {}
+
+def _init_replay_worker(replay_dir: str, as_of: Optional[str], keywords_conf: Dict[str, Any],
+                        pdf_options: Dict[str, Any], html_parser: str):
+    # 取得状態は使わない（再処理の応答は常に記録どおりの全体）
+    _replay_worker["fetcher"] = HttpFetcher(state=FetchStateStore(":memory:"),
+                                            body_cache=BodyCache(os.path.join(REPLAY_DIR, "bodies")),
+                                            respect_robots=False, replay=ArchiveReader(replay_dir, as_of=as_of))
+    _replay_worker["classifier"] = make_classifier(keywords_conf.get("categories", {}))
+    # プロセスごとに PDF の抽出プロセスを持つので、同時に動かすのは1つずつにする
+    pdftext.configure(**{**pdf_options, "workers": 1})
+    htmlparse.set_default_backend(html_parser)
+
+def _replay_source(src: Dict[str, Any]) -> Tuple[List[Tuple[str, GrantOpportunity]], Dict[str, Any], List[str]]:
+    w = _replay_worker
+    run = metrics.start_run()
+    finished: List[str] = []
+    try:
+        records = list(_harvest_source(w["fetcher"], w["classifier"], src, finished))
+    finally:
+        metrics.stop_run()
+    return records, run.sources, finished
 
-    return out_jsonl
+def _replay_sources(sources: List[Dict[str, Any]], workers: int, run_metrics: metrics.RunMetrics,
+                    on_finished: Callable[[Dict[str, Any], str], None], initargs: Tuple) -> Iterator[Any]:
+    """Harvests the sources on a process pool and yields the records in source
+    order, merging each worker's metrics into `run_metrics`. At most two sources
+    per worker are in flight, so finished sources do not pile up in memory."""
+    if not sources:
+        return
+    with ProcessPoolExecutor(max_workers=min(workers, len(sources)), mp_context=pdftext._mp_context(),
+                             initializer=_init_replay_worker, initargs=initargs) as pool:
+        pending: deque = deque()
+        it = iter(sources)
+        try:
+            while True:
+                while len(pending) < 2 * workers:
+                    src = next(it, None)
+                    if src is None:
+                        break
+                    pending.append((src, pool.submit(_replay_source, src)))
+                if not pending:
+                    break
+                src, future = pending.popleft()
+                records, measured, finished = future.result()
+                run_metrics.merge(measured)
+                for key in finished:
+                    on_finished(src, key)
+                yield from records
+        finally:
+            for _, future in pending:
+                future.cancel()
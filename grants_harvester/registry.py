@@ -0,0 +1,83 @@
+
+import importlib
+import threading
+from collections.abc import Mapping
+from typing import Dict, Iterator, Union
+
+# 組み込みのハーベスタ。モジュールは該当 type のソースを実行するときに初めて import する
+BUILTIN_HARVESTERS = {
+    "rss": "grants_harvester.harvesters.rss:RssHarvester",
+    "sitemap": "grants_harvester.harvesters.sitemap:SitemapHarvester",
+    "html": "grants_harvester.harvesters.html:HtmlHarvester",
+    "pdf": "grants_harvester.harvesters.pdf:PdfHarvester",
+}
+ENTRY_POINT_GROUP = "grants_harvester.harvesters"
+
+def _load(target: str) -> type:
+    module, _, attr = target.partition(":")
+    obj = importlib.import_module(module)
+    for part in attr.split(".") if attr else ():
+        obj = getattr(obj, part)
+    return obj
+
+class HarvesterRegistry(Mapping):
+    """Source `type` -> Harvester class, resolved lazily.
+
+    Entries are "module:Class" strings (or classes) and are imported on first
+    lookup, so a config with only RSS sources never imports the HTML or PDF
+    harvesters. Third-party packages can add types through the
+    `grants_harvester.harvesters` entry point group, e.g. in their pyproject.toml:
+
+        [project.entry-points."grants_harvester.harvesters"]
+        ckan = "my_package.ckan:CkanHarvester"
+
+    Entry points are only scanned when a type is not registered directly (or the
+    registry is iterated); built-in and explicitly registered types win.
+    """
+    def __init__(self, targets: Dict[str, Union[str, type]]):
+        self._targets: Dict[str, Union[str, type]] = dict(targets)
+        self._loaded: Dict[str, type] = {}
+        self._lock = threading.Lock()
+        self._scanned = False
+
+    def register(self, name: str, target: Union[str, type]):
+        """Adds or replaces a type; `target` is a class or a "module:Class" string."""
+        with self._lock:
+            self._targets[name] = target
+            self._loaded.pop(name, None)
+
+    def _scan_entry_points(self):
+        with self._lock:
+            if self._scanned:
+                return
+            self._scanned = True
+            from importlib.metadata import entry_points
+            for ep in entry_points(group=ENTRY_POINT_GROUP):
+                self._targets.setdefault(ep.name, ep.value)
+
+    def __getitem__(self, name: str) -> type:
+        cls = self._loaded.get(name)
+        if cls is not None:
+            return cls
+        if name not in self._targets:
+            self._scan_entry_points()
+        target = self._targets[name]  # KeyError: 未登録の type
+        cls = target if isinstance(target, type) else _load(target)
+        with self._lock:
+            self._loaded[name] = cls
+        return cls
+
+    def __contains__(self, name) -> bool:
+        if name not in self._targets:
+            self._scan_entry_points()
+        return name in self._targets
+
+    def __iter__(self) -> Iterator[str]:
+        self._scan_entry_points()
+        return iter(list(self._targets))
+
+    def __len__(self) -> int:
+        self._scan_entry_points()
+        return len(self._targets)
+
+HARVESTER_REGISTRY = HarvesterRegistry(BUILTIN_HARVESTERS)
@@ -0,0 +1,137 @@
+
+import math
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+HOUR = 3600.0
+DEFAULTS = {
+    "enabled": True,
+    "min_hours": 1.0,      # 変化の多いソースでもこれより短い間隔では取得しない
+    "max_hours": 168.0,    # 変化のないソースも最低この間隔で確認する
+    "factor": 0.5,         # 推定した平均変化間隔に掛ける係数（小さいほど取りこぼしが減る）
+    "decay": 0.9,          # 確認1回ごとに古い履歴へ掛ける重み（季節的な変化に追従する）
+    "max_requests": 0,     # 1回の実行でソースに使うリクエスト数の予算（0 は無制限）
+}
+
+def _parse(ts: Optional[str]) -> Optional[datetime]:
+    try:
+        return datetime.fromisoformat(ts) if ts else None
+    except ValueError:
+        return None
+
+def change_rate(checks: float, changes: float, observed_sec: float) -> Optional[float]:
+    """Changes per second estimated from `checks` observations (each only telling
+    whether the source changed since the previous one) spread over `observed_sec`.
+
+    Counting changed checks underestimates the rate when a source can change
+    several times between checks; this is the bias-reduced estimator for Poisson
+    changes under that kind of incomplete history (Cho & Garcia-Molina)."""
+    if checks <= 0 or observed_sec <= 0:
+        return None
+    interval = observed_sec / checks
+    return -math.log((checks - changes + 0.5) / (checks + 0.5)) / interval
+
+class RefreshScheduler:
+    """Decides which sources a run fetches, from the change history of each source.
+
+    After every check a source records whether any of its URLs returned a new body
+    (ETag/Last-Modified or content hash changed). From the decayed counts of checks,
+    changes and elapsed time it estimates a change rate and sets the next check to
+    `factor / rate`, bounded by `min_hours`/`max_hours` and at most twice the usual
+    check interval, so a quiet source backs off gradually. A run takes the sources
+    that are due, most overdue first, until the request budget (the requests each
+    source used last time) is spent; sources that have never been checked go first.
+
+    Per-source `refresh` in sources.yaml overrides the rule: `always`, a fixed
+    interval in hours, or a dict with any of `min_hours`/`max_hours`/`factor`.
+    """
+    def __init__(self, state, conf: Optional[Dict[str, Any]] = None, now: Optional[datetime] = None):
+        self.state = state
+        self.conf = {**DEFAULTS, **(conf or {})}
+        self.now = now or datetime.now(timezone.utc)
+        self._history = state.get_schedules() if self.enabled else {}
+        self._checked: Dict[str, Tuple[bool, int]] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.conf.get("enabled", True))
+
+    def _conf_for(self, src: Dict[str, Any]) -> Dict[str, Any]:
+        override = src.get("refresh")
+        return {**self.conf, **override} if isinstance(override, dict) else self.conf
+
+    def interval(self, src: Dict[str, Any], key: str) -> Optional[float]:
+        """Seconds between checks of a source (None: every run)."""
+        override = src.get("refresh")
+        if override == "always" or override is False:
+            return None
+        if isinstance(override, (int, float)) and not isinstance(override, bool):
+            return float(override) * HOUR
+        conf = self._conf_for(src)
+        lo, hi = float(conf["min_hours"]) * HOUR, float(conf["max_hours"]) * HOUR
+        h = self._history.get(key)
+        if not h or not h.get("checks"):
+            return lo
+        rate = change_rate(h["checks"], h["changes"] or 0.0, h["observed_sec"] or 0.0)
+        usual = (h["observed_sec"] or 0.0) / h["checks"]
+        wanted = float(conf["factor"]) / rate if rate else hi
+        return max(lo, min(hi, wanted, max(lo, 2 * usual)))
+
+    def select(self, sources: List[Dict[str, Any]], key_fn: Callable[[Dict[str, Any]], str]
+               ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """(sources to fetch in this run, in config order; sources skipped)."""
+        if not self.enabled:
+            return list(sources), []
+        budget = int(self.conf.get("max_requests") or 0)
+        ranked = []
+        for pos, src in enumerate(sources):
+            key = key_fn(src)
+            h = self._history.get(key) or {}
+            last, interval = _parse(h.get("last_checked")), self.interval(src, key)
+            if last is None or interval is None:
+                urgency = math.inf
+            else:
+                # 実行時刻の揺れで1回分遅れないよう、間隔の9割を過ぎたら対象にする
+                urgency = (self.now - last).total_seconds() / interval
+                if urgency < 0.9:
+                    continue
+            cost = h.get("cost") or len(src.get("urls") or [None])
+            ranked.append((-urgency, pos, cost))
+        ranked.sort()
+        chosen, spent = set(), 0
+        for _, pos, cost in ranked:
+            # 予算より大きいソースも、他に何も選んでいなければ取得する（永久に後回しにしない）
+            if budget and spent + cost > budget and chosen:
+                continue
+            chosen.add(pos)
+            spent += cost
+        picked = [s for i, s in enumerate(sources) if i in chosen]
+        skipped = [s for i, s in enumerate(sources) if i not in chosen]
+        return picked, skipped
+
+    def record(self, key: str, changed: bool, requests: int):
+        """Notes one completed check of a source; `save` writes them."""
+        self._checked[key] = (changed, requests)
+
+    def save(self):
+        now = self.now.isoformat()
+        decay = float(self.conf["decay"])
+        rows = {}
+        for key, (changed, requests) in self._checked.items():
+            h = self._history.get(key) or {}
+            last = _parse(h.get("last_checked"))
+            row = {"checks": h.get("checks") or 0.0, "changes": h.get("changes") or 0.0,
+                   "observed_sec": h.get("observed_sec") or 0.0, "cost": max(1, requests),
+                   "last_checked": now, "last_changed": h.get("last_changed")}
+            # 初回の確認は比較対象が無い（すべて新規）ので、履歴の起点にするだけ
+            if last is not None:
+                row["checks"] = row["checks"] * decay + 1
+                row["changes"] = row["changes"] * decay + (1 if changed else 0)
+                row["observed_sec"] = row["observed_sec"] * decay + max(0.0, (self.now - last).total_seconds())
+                if changed:
+                    row["last_changed"] = now
+            rows[key] = row
+        if rows:
+            self.state.set_schedules(rows)
+        self._history.update(rows)
+        self._checked.clear()
@@ -0,0 +1,197 @@
+
+import os, glob, json, sqlite3, unicodedata
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional
+
+from .dedup import canonical_url
+from .schema import json_dumps
+
+# 検索対象のテキスト列
+TEXT_FIELDS = ("title", "summary", "issuer_name")
+_COLUMNS = ("title", "url", "issuer_name", "issuer_level", "region_code", "category", "summary",
+            "application_start", "application_end", "amount", "subsidy_rate", "source_type",
+            "published_at", "fetched_at")
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS grants (
+    id     INTEGER PRIMARY KEY,
+    key    TEXT NOT NULL UNIQUE,
+    {', '.join(f'{c} TEXT' for c in _COLUMNS)},
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS grants_category ON grants (category);
+CREATE INDEX IF NOT EXISTS grants_region ON grants (region_code);
+CREATE INDEX IF NOT EXISTS grants_level ON grants (issuer_level);
+CREATE INDEX IF NOT EXISTS grants_end ON grants (application_end);
+-- 3文字以上の語: trigram。2文字の語（介護・医療・DX など）は trigram では引けないため bigram を別に持つ
+CREATE VIRTUAL TABLE IF NOT EXISTS grants_fts USING fts5 ({', '.join(TEXT_FIELDS)}, tokenize = 'trigram');
+CREATE VIRTUAL TABLE IF NOT EXISTS grants_bigram USING fts5 (grams, tokenize = 'unicode61');
+CREATE TABLE IF NOT EXISTS ingested (
+    name        TEXT PRIMARY KEY,
+    ingested_at TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+def normalize(text: Optional[str]) -> str:
+    # 全角英数・記号を半角にそろえ、大文字小文字を区別しない
+    return unicodedata.normalize("NFKC", text or "").lower()
+
+def bigrams(text: str) -> str:
+    """Distinct 2-character windows of letters/digits, space-separated (one token each)."""
+    seen = dict.fromkeys(a + b for a, b in zip(text, text[1:]) if a.isalnum() and b.isalnum())
+    return " ".join(seen)
+
+def _phrase(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+def _like(term: str) -> str:
+    return "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+class SearchIndex:
+    """Full-text and attribute index over the harvested grants in SQLite.
+
+    `build` loads `grants_latest.jsonl` once and afterwards only applies the
+    `delta_<ts>.jsonl` files it has not seen yet, so keeping the index current
+    costs O(changes). Text is NFKC-normalized and indexed twice: FTS5 trigrams for
+    terms of 3+ characters and a bigram table for 2-character terms, which are
+    common in Japanese (介護, 医療) and for acronyms (DX, AI). Shorter terms fall
+    back to LIKE. `category`, `region_code`, `issuer_level` and `application_end`
+    have ordinary indexes.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self._conn = sqlite3.connect(path, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    # --- 構築 ---
+
+    def build(self, out_dir: str, rebuild: bool = False) -> Dict[str, int]:
+        """Brings the index up to date with `out_dir`. Returns counts per operation."""
+        counts = {"loaded": 0, "new": 0, "changed": 0, "expired": 0, "files": 0}
+        deltas = sorted(glob.glob(os.path.join(out_dir, "delta_*.jsonl")))
+        now = datetime.now(timezone.utc).isoformat()
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            if rebuild or self._conn.execute("SELECT 1 FROM grants LIMIT 1").fetchone() is None:
+                latest = os.path.join(out_dir, "grants_latest.jsonl")
+                if not os.path.exists(latest):
+                    raise FileNotFoundError(f"{latest} not found (run run.py first)")
+                for table in ("grants", "grants_fts", "grants_bigram", "ingested"):
+                    self._conn.execute(f"DELETE FROM {table}")
+                for rec in _read_jsonl(latest):
+                    self._put(canonical_url(rec.get("url")), rec)
+                    counts["loaded"] += 1
+                # latest はそれまでの差分をすべて含んでいる
+                self._conn.executemany("INSERT INTO ingested (name, ingested_at) VALUES (?, ?)",
+                                       [(os.path.basename(p), now) for p in deltas])
+            else:
+                done = {name for (name,) in self._conn.execute("SELECT name FROM ingested")}
+                for path in deltas:
+                    name = os.path.basename(path)
+                    if name in done:
+                        continue
+                    for line in _read_jsonl(path):
+                        op, key, rec = line["op"], line["key"], line["record"]
+                        if op == "expired":
+                            self._drop(key, rec)
+                        else:
+                            self._put(key, rec)
+                        counts[op] = counts.get(op, 0) + 1
+                    self._conn.execute("INSERT INTO ingested (name, ingested_at) VALUES (?, ?)", (name, now))
+                    counts["files"] += 1
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        return counts
+
+    def _ids(self, key: str, rec: Dict[str, Any]) -> List[int]:
+        # latest から読み込んだ行は URL から求めたキーなので、重複排除でまとめたキーとずれることがある
+        keys = {key, canonical_url(rec.get("url"))}
+        return [i for (i,) in self._conn.execute(
+            f"SELECT id FROM grants WHERE key IN ({', '.join('?' * len(keys))})", tuple(keys))]
+
+    def _drop(self, key: str, rec: Dict[str, Any]):
+        for i in self._ids(key, rec):
+            for table, col in (("grants", "id"), ("grants_fts", "rowid"), ("grants_bigram", "rowid")):
+                self._conn.execute(f"DELETE FROM {table} WHERE {col} = ?", (i,))
+
+    def _put(self, key: str, rec: Dict[str, Any]):
+        self._drop(key, rec)
+        cur = self._conn.execute(
+            f"INSERT INTO grants (key, {', '.join(_COLUMNS)}, record) "
+            f"VALUES (?, {', '.join('?' * len(_COLUMNS))}, ?)",
+            (key,) + tuple(rec.get(c) for c in _COLUMNS) + (json_dumps(rec),))
+        texts = [normalize(rec.get(f)) for f in TEXT_FIELDS]
+        self._conn.execute(f"INSERT INTO grants_fts (rowid, {', '.join(TEXT_FIELDS)}) VALUES (?, ?, ?, ?)",
+                           (cur.lastrowid, *texts))
+        self._conn.execute("INSERT INTO grants_bigram (rowid, grams) VALUES (?, ?)",
+                           (cur.lastrowid, bigrams(" ".join(texts))))
+
+    # --- 検索 ---
+
+    def search(self, text: str = "", category: Optional[str] = None, region: Optional[str] = None,
+               level: Optional[str] = None, open_only: bool = False, closing_within: Optional[int] = None,
+               today: Optional[date] = None, sort: Optional[str] = None,
+               limit: Optional[int] = 50) -> List[Dict[str, Any]]:
+        """Records matching every whitespace-separated term of `text` (in title, summary
+        or issuer) and the given filters. `region` is a prefix of the region code
+        ("13" matches "13" and "13-001"); `open_only` drops records whose deadline has
+        passed; `closing_within` keeps records with a deadline in the next N days.
+        `sort` is "end" (deadline first) or "recent" (last added or changed first);
+        by default "end" when filtering by deadline."""
+        where: List[str] = []
+        params: List[Any] = []
+        for term in normalize(text).split():
+            if len(term) >= 3:
+                where.append("g.id IN (SELECT rowid FROM grants_fts WHERE grants_fts MATCH ?)")
+                params.append(_phrase(term))
+            elif len(term) == 2 and term.isalnum():
+                where.append("g.id IN (SELECT rowid FROM grants_bigram WHERE grants_bigram MATCH ?)")
+                params.append(_phrase(term))
+            else:
+                where.append("g.id IN (SELECT rowid FROM grants_fts WHERE "
+                             + " OR ".join(f"{f} LIKE ? ESCAPE '\\'" for f in TEXT_FIELDS) + ")")
+                params.extend([_like(term)] * len(TEXT_FIELDS))
+        if category:
+            where.append("g.category = ?")
+            params.append(category)
+        if region:
+            # 前方一致（"13" は "13" と "13-001" の両方）。GLOB の前方一致はインデックスを使える
+            where.append("g.region_code GLOB ?")
+            params.append(region.replace("[", "[[]").replace("*", "[*]").replace("?", "[?]") + "*")
+        if level:
+            where.append("g.issuer_level = ?")
+            params.append(level)
+        today = today or date.today()
+        if closing_within is not None:
+            where.append("g.application_end BETWEEN ? AND ?")
+            params.extend([today.isoformat(), (today + timedelta(days=closing_within)).isoformat()])
+        elif open_only:
+            where.append("(g.application_end IS NULL OR g.application_end >= ?)")
+            params.append(today.isoformat())
+        sort = sort or ("end" if closing_within is not None or open_only else "recent")
+        order = ("g.application_end IS NULL, g.application_end, g.id DESC" if sort == "end" else "g.id DESC")
+        sql = (f"SELECT g.record FROM grants g" + (f" WHERE {' AND '.join(where)}" if where else "")
+               + f" ORDER BY {order}" + (" LIMIT ?" if limit else ""))
+        if limit:
+            params.append(limit)
+        return [json.loads(rec) for (rec,) in self._conn.execute(sql, params)]
+
+    def count(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM grants").fetchone()[0]
+
+    def close(self):
+        self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self._conn.close()
+
+def _read_jsonl(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
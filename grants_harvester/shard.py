@@ -0,0 +1,61 @@
+
+import os, hashlib, sqlite3
+from typing import Any, Dict, List, Tuple
+
+from .util.fetch import host_of
+
+def parse_shard(spec: str) -> Tuple[int, int]:
+    """'i/N' (1-based, as in `--shard 2/4`) -> (i, N)."""
+    try:
+        i, n = (int(x) for x in spec.split("/"))
+    except ValueError:
+        raise ValueError(f"shard must look like i/N (e.g. 2/4): {spec!r}") from None
+    if n < 1 or not 1 <= i <= n:
+        raise ValueError(f"shard index must be between 1 and N: {spec!r}")
+    return i, n
+
+def source_host(src: Dict[str, Any]) -> str:
+    """Host of a source's (first) URL; sources without a URL are grouped by name."""
+    first = src.get("url") or (src.get("urls") or [""])[0]
+    return host_of(first) or src.get("name") or ""
+
+def shard_of(src: Dict[str, Any], n: int) -> int:
+    """1-based shard of a source. All sources of one host land in the same shard, so
+    the per-host interval and concurrency limits hold across shards too."""
+    # hash() は実行ごとに変わるため、固定のハッシュで割り振る
+    h = hashlib.blake2b(source_host(src).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(h, "big") % n + 1
+
+def select_sources(sources: List[Dict[str, Any]], i: int, n: int) -> List[Dict[str, Any]]:
+    return [s for s in sources if shard_of(s, n) == i]
+
+def shard_path(path: str, i: int, n: int) -> str:
+    """`records.sqlite` -> `records.shard-2-of-4.sqlite`."""
+    root, ext = os.path.splitext(path)
+    return f"{root}.shard-{i}-of-{n}{ext}"
+
+def _mtime(path: str) -> float:
+    # WAL モードでは本体より -wal の方が新しいことがある
+    return max((os.path.getmtime(p) for p in (path, path + "-wal") if os.path.exists(p)), default=0.0)
+
+def seed(main_path: str, path: str) -> bool:
+    """Starts the shard store at `path` as a copy of the merged store at `main_path`,
+    unless the shard store is newer (it was used since the last merge). Returns
+    True if it copied."""
+    if not os.path.exists(main_path) or (os.path.exists(path) and _mtime(path) >= _mtime(main_path)):
+        return False
+    tmp = path + ".tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    src, dst = sqlite3.connect(main_path, timeout=30), sqlite3.connect(tmp)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+    # 古い -wal が残っていると差し替えた本体と食い違うため、先に消す
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    os.replace(tmp, path)
+    return True
@@ -0,0 +1,228 @@
+
+import csv, os, hashlib, shutil
+from typing import Dict, List, Optional
+
+from .schema import GrantOpportunity, FIELDS, json_dumps
+
+# Columns: 補助金名, 補助金上限額, 補助率, 対象地域, 従業員数の上限, 募集期間, 詳細URL, 取得日時
+JA_HEADER = ["補助金名","補助金上限額","補助率","対象地域","従業員数の上限","募集期間","詳細URL", "取得日時"]
+CSV_HEADER = ["title","url","issuer_name","issuer_level","region_code","category",
+              "application_start","application_end","amount","subsidy_rate","published_at","fetched_at"]
+
+def ja_row(r: GrantOpportunity) -> List[str]:
+    period = None
+    if r.application_start or r.application_end:
+        s = r.application_start or ""
+        e = r.application_end or ""
+        if s or e:
+            period = f"{s} ～ {e}".strip(" ～ ")
+    return [
+        r.title or "",
+        r.amount or "",
+        r.subsidy_rate or "",
+        r.issuer_name or "",
+        "",  # 従業員数の上限は未取得のため空欄
+        period or "",
+        r.url or "",
+        r.fetched_at or ""
+    ]
+
+def csv_row(r: GrantOpportunity) -> list:
+    return [r.title, r.url, r.issuer_name, r.issuer_level, r.region_code, r.category,
+            r.application_start, r.application_end, r.amount, r.subsidy_rate, r.published_at, r.fetched_at]
+
+class _Writer:
+    def __init__(self, path: str):
+        self.path = path
+        self.failed = False
+
+    def write(self, r: GrantOpportunity, line: Optional[str] = None):
+        raise NotImplementedError
+
+    def close(self):
+        self._f.close()
+
+class JsonlWriter(_Writer):
+    def __init__(self, path: str):
+        super().__init__(path)
+        self._f = open(path, "w", encoding="utf-8")
+
+    def write(self, r: GrantOpportunity, line: Optional[str] = None):
+        # line: レコードストアに保存済みの JSON（同じ形式）があれば再エンコードしない
+        self._f.write((line or r.to_json()) + "\n")
+
+class CsvWriter(_Writer):
+    def __init__(self, path: str, header: List[str], row_fn, encoding: str = "utf-8"):
+        super().__init__(path)
+        self._f = open(path, "w", encoding=encoding, newline="")
+        self._w = csv.writer(self._f)
+        self._row = row_fn
+        self._w.writerow(header)
+
+    def write(self, r: GrantOpportunity, line: Optional[str] = None):
+        self._w.writerow(self._row(r))
+
+class ParquetWriter(_Writer):
+    """Columnar export of all fields (requires pyarrow). Rows are buffered and written
+    as one row group per `batch_size` records; `raw` is stored as a JSON string."""
+    def __init__(self, path: str, batch_size: int = 50000):
+        super().__init__(path)
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("pyarrow is not installed (pip install pyarrow)") from None
+        self._pa = pa
+        types = {"attachment_urls": pa.list_(pa.string())}
+        self._schema = pa.schema([(name, types.get(name, pa.string())) for name in FIELDS])
+        self._f = pq.ParquetWriter(path, self._schema, compression="zstd")
+        self._raw = FIELDS.index("raw")
+        self._rows: List[tuple] = []
+        self._batch_size = batch_size
+
+    def write(self, r: GrantOpportunity, line: Optional[str] = None):
+        self._rows.append(r.to_tuple())
+        if len(self._rows) >= self._batch_size:
+            self._flush()
+
+    def _flush(self):
+        if not self._rows:
+            return
+        columns = [list(c) for c in zip(*self._rows)]
+        columns[self._raw] = [json_dumps(v) if v else None for v in columns[self._raw]]
+        self._f.write_table(self._pa.Table.from_arrays(
+            [self._pa.array(c, type=f.type) for c, f in zip(columns, self._schema)], schema=self._schema))
+        self._rows = []
+
+    def close(self):
+        if not self.failed:
+            self._flush()
+        self._f.close()
+
+def publish(src: str, dst: str):
+    """Atomically points `dst` at the contents of `src` (hard link, copy as fallback)."""
+    tmp = dst + ".tmp"
+    if os.path.lexists(tmp):
+        os.remove(tmp)
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+
+LATEST = {"jsonl": "grants_latest.jsonl", "ja": "grants_latest_ja.csv", "csv": "grants_latest.csv",
+          "parquet": "grants_latest.parquet"}
+_LABELS = {"ja": "JA CSV", "csv": "CSV", "parquet": "Parquet"}
+
+class OutputSink:
+    """Single-pass output: dedupes records as they arrive and fans each one out to the
+    JSONL, JA CSV and English CSV writers, so memory does not grow with the record count.
+
+    With `ts`, writes a `grants_<ts>.*` snapshot and, with `publish`, also publishes
+    it as `grants_latest.*` by hard link; without `ts`, writes temporary files that atomically replace
+    `grants_latest.*` on close. With `parquet`, also writes a columnar copy of all
+    fields (skipped with a warning when pyarrow is not installed).
+    """
+
+    def __init__(self, out_dir: str, ts: Optional[str] = None, dedupe: bool = True,
+                 parquet: bool = False, publish: bool = True):
+        os.makedirs(out_dir, exist_ok=True)
+        self.out_dir = out_dir
+        self.ts = ts
+        self.publish = publish
+        self.dedupe = dedupe
+        self.count = 0
+        self.duplicates = 0
+        self._seen = set()
+        names = ({"jsonl": f"grants_{ts}.jsonl", "ja": f"grants_{ts}_ja.csv", "csv": f"grants_{ts}.csv",
+                  "parquet": f"grants_{ts}.parquet"}
+                 if ts else {k: f"{v}.{os.getpid()}.tmp" for k, v in LATEST.items()})
+        self.jsonl = JsonlWriter(os.path.join(out_dir, names["jsonl"]))
+        self._optional: Dict[str, Optional[_Writer]] = {"ja": None, "csv": None}
+        # also write JA CSV matching user's format
+        try:
+            self._optional["ja"] = CsvWriter(os.path.join(out_dir, names["ja"]),
+                                             JA_HEADER, ja_row, encoding="utf-8-sig")
+        except Exception as e:
+            print("[WARN] JA CSV export failed:", e)
+        try:
+            self._optional["csv"] = CsvWriter(os.path.join(out_dir, names["csv"]), CSV_HEADER, csv_row)
+        except Exception as e:
+            print("[WARN] CSV export failed:", e)
+        if parquet:
+            self._optional["parquet"] = None
+            try:
+                self._optional["parquet"] = ParquetWriter(os.path.join(out_dir, names["parquet"]))
+            except Exception as e:
+                print("[WARN] Parquet export failed:", e)
+
+    def _key(self, r: GrantOpportunity) -> bytes:
+        # Deduplicate by URL + title (16 バイトのダイジェストで保持してメモリを抑える)
+        return hashlib.blake2b(f"{r.url or ''}\x00{r.title or ''}".encode("utf-8"), digest_size=16).digest()
+
+    def add(self, r: GrantOpportunity, line: Optional[str] = None) -> bool:
+        """`line` is the record's JSON if the caller already has it (see `to_json`)."""
+        if self.dedupe:
+            key = self._key(r)
+            if key in self._seen:
+                self.duplicates += 1
+                return False
+            self._seen.add(key)
+        self.jsonl.write(r, line)
+        for name, w in self._optional.items():
+            if w is None or w.failed:
+                continue
+            try:
+                w.write(r)
+            except Exception as e:
+                w.failed = True
+                print(f"[WARN] {_LABELS[name]} export failed:", e)
+        self.count += 1
+        return True
+
+    def close(self) -> Dict[str, Optional[str]]:
+        self.jsonl.close()
+        written = {"jsonl": self.jsonl.path}
+        for name, w in self._optional.items():
+            if w is not None:
+                w.close()
+            written[name] = w.path if w is not None and not w.failed else None
+
+        if not self.ts:
+            # 一時ファイルを latest へアトミックに差し替える
+            paths: Dict[str, Optional[str]] = {}
+            for name, tmp in written.items():
+                w = self._optional.get(name)
+                if tmp is None:
+                    if w is not None and os.path.exists(w.path):
+                        os.remove(w.path)
+                    paths[name] = None
+                    continue
+                dst = os.path.join(self.out_dir, LATEST[name])
+                os.replace(tmp, dst)
+                paths[name] = dst
+            self._remove_stale(paths)
+            return paths
+
+        if not self.publish:
+            return written
+
+        # Publish 'latest' files for easy access
+        try:
+            for name, src in written.items():
+                if src:
+                    publish(src, os.path.join(self.out_dir, LATEST[name]))
+            print("Published 'latest' output files.")
+            self._remove_stale(written)
+        except Exception as e:
+            print(f"[WARN] Could not publish 'latest' files: {e}")
+        return written
+
+    def _remove_stale(self, published: Dict[str, Optional[str]]):
+        # 今回書かなかった形式（--parquet なしの回の Parquet など）の前回の latest を残すと、
+        # 内容の違うファイルが並ぶため削除する
+        for name, filename in LATEST.items():
+            path = os.path.join(self.out_dir, filename)
+            if not published.get(name) and os.path.exists(path):
+                os.remove(path)
+                print(f"[INFO] Removed stale {filename} (not written in this run)")
@@ -0,0 +1,337 @@
+
+import os, json, hashlib, sqlite3, threading
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from .schema import GrantOpportunity
+from .dedup import NearDupIndex, canonical_url
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    seq          INTEGER PRIMARY KEY,
+    key          TEXT NOT NULL UNIQUE,
+    source       TEXT,
+    fingerprint  TEXT NOT NULL,
+    record       TEXT NOT NULL,
+    first_seen   TEXT NOT NULL,
+    last_seen    TEXT NOT NULL,
+    last_changed TEXT NOT NULL,
+    expired_at   TEXT
+);
+CREATE INDEX IF NOT EXISTS records_source ON records (source, last_seen);
+"""
+# 1: canonical_url が http/https・index.html・計測用パラメータを同一視するようになった
+_VERSION = 1
+
+# fetched_at と raw は内容の変化とみなさない
+_VOLATILE = ("fetched_at", "raw")
+
+_DETAIL_FIELDS = ("summary", "application_start", "application_end", "amount", "subsidy_rate", "published_at")
+
+def richness(opp: Union[GrantOpportunity, Dict]) -> int:
+    """How much detail a record (or its stored dict) carries; used to pick one record per URL."""
+    rec = opp if isinstance(opp, dict) else {f: getattr(opp, f) for f in _DETAIL_FIELDS + ("title",)}
+    n = sum(1 for f in _DETAIL_FIELDS if rec.get(f))
+    title = rec.get("title")
+    if title and not title.startswith("(ページ候補)"):
+        n += 1
+    return n
+
+_canonical_json = json.JSONEncoder(ensure_ascii=False, sort_keys=True).encode
+
+def fingerprint(rec: Dict) -> str:
+    content = {k: v for k, v in rec.items() if k not in _VOLATILE}
+    return hashlib.sha1(_canonical_json(content).encode("utf-8")).hexdigest()
+
+class RecordStore:
+    """Persistent record store keyed by canonical URL, with a content fingerprint.
+
+    Each run upserts what it harvested and learns whether a record is new, changed or
+    unchanged since the previous run; records of fully harvested sources that were
+    not seen again are marked expired. The `latest` view is every non-expired
+    record, in first-seen order.
+
+    With `near_duplicates`, a record whose URL is new but whose title nearly matches
+    a live record from another source is stored under that record's key instead
+    (see `dedup.NearDupIndex`), so one grant is one record across sources.
+    """
+    def __init__(self, path: str, near_duplicates: bool = False, max_distance: int = 3):
+        self.path = path
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._migrate()
+        self.dedup = NearDupIndex(self._conn, max_distance) if near_duplicates else None
+        self.run_id: Optional[str] = None
+        self._run: Dict[str, list] = {}
+        self._aliases: Dict[str, str] = {}
+
+    def _migrate(self):
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= _VERSION:
+            return
+        # キーを現在の canonical_url で付け直す。衝突したら最後に見た方を残す
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = self._conn.execute("SELECT seq, key, last_seen FROM records ORDER BY seq").fetchall()
+            for seq, key, last_seen in rows:
+                new = canonical_url(key)
+                if new == key:
+                    continue
+                other = self._conn.execute("SELECT seq, last_seen FROM records WHERE key = ?", (new,)).fetchone()
+                if other is not None:
+                    if other[1] >= last_seen:
+                        self._conn.execute("DELETE FROM records WHERE seq = ?", (seq,))
+                        continue
+                    self._conn.execute("DELETE FROM records WHERE seq = ?", (other[0],))
+                self._conn.execute("UPDATE records SET key = ? WHERE seq = ?", (new, seq))
+            self._conn.execute(f"PRAGMA user_version = {_VERSION}")
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def begin_run(self, run_id: Optional[str] = None) -> str:
+        self.run_id = run_id or datetime.now(timezone.utc).isoformat()
+        # key -> [op, richness, previous (fingerprint, record, last_changed) if it may need restoring]
+        self._run: Dict[str, list] = {}
+        # 重複と判定したURL（正規化済み）-> まとめ先のキー
+        self._aliases: Dict[str, str] = {}
+        self._conn.execute("BEGIN IMMEDIATE")
+        return self.run_id
+
+    def upsert(self, opp: GrantOpportunity, source: Optional[str], keep_richer: bool = False) -> Optional[str]:
+        """Returns 'new', 'changed', 'unchanged', or None if a record at least as rich
+        was already stored for this URL in this run. When several sources report the
+        same URL, the one with the most filled-in fields wins. Unchanged records keep
+        their stored JSON (including fetched_at), so the latest view only churns on change.
+
+        With `keep_richer` (a link-only candidate that was not enriched this run), a
+        stored record with more detail is kept as it is and counts as unchanged."""
+        rich = richness(opp)
+        rec = opp.to_dict()
+        fp = fingerprint(rec)
+        now = self.run_id
+        with self._lock:
+            key = self._key_for(opp, source)
+            info = self._run.get(key)
+            if info is None:
+                row = self._conn.execute(
+                    "SELECT fingerprint, record, last_changed, expired_at FROM records WHERE key = ?",
+                    (key,)).fetchone()
+                if row is None or row[3] is not None:
+                    op, prev = "new", None
+                elif row[0] == fp:
+                    op, prev = "unchanged", None
+                elif keep_richer and richness(json.loads(row[1])) > rich:
+                    # 前回補完できた詳細を、今回補完しなかった（予算外など）候補で上書きしない
+                    op, prev, rich = "unchanged", None, richness(json.loads(row[1]))
+                else:
+                    op, prev = "changed", row[:3]
+                info = self._run[key] = [op, rich, prev]
+                if op == "unchanged":
+                    self._conn.execute("UPDATE records SET last_seen = ?, source = ? WHERE key = ?",
+                                       (now, source, key))
+                    if self.dedup is not None:
+                        self.dedup.index(key, opp, only_missing=True)
+                    return op
+            elif rich > info[1]:
+                info[1] = rich
+                prev = info[2]
+                if prev is not None and prev[0] == fp:
+                    # 前回と同じ内容に戻った: 保存済みのレコードをそのまま使う
+                    info[0] = "unchanged"
+                    self._conn.execute(
+                        "UPDATE records SET fingerprint = ?, record = ?, last_changed = ?, last_seen = ?, "
+                        "source = ? WHERE key = ?", (prev[0], prev[1], prev[2], now, source, key))
+                    return info[0]
+                if info[0] == "unchanged":
+                    row = self._conn.execute(
+                        "SELECT fingerprint, record, last_changed FROM records WHERE key = ?", (key,)).fetchone()
+                    info[2] = tuple(row)
+                    info[0] = "changed"
+                op = info[0]
+            else:
+                return None
+            self._conn.execute(
+                "INSERT INTO records (key, source, fingerprint, record, first_seen, last_seen, last_changed) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(key) DO UPDATE SET "
+                "source = excluded.source, fingerprint = excluded.fingerprint, record = excluded.record, "
+                "last_seen = excluded.last_seen, last_changed = excluded.last_changed, expired_at = NULL",
+                (key, source, fp, opp.to_json(), now, now, now))
+            if self.dedup is not None:
+                self.dedup.index(key, opp)
+        return op
+
+    def _key_for(self, opp: GrantOpportunity, source: Optional[str]) -> str:
+        key = canonical_url(opp.url)
+        if self.dedup is None or key in self._run:
+            return key
+        alias = self._aliases.get(key) or self.dedup.alias(key)
+        if alias is None and self._conn.execute(
+                "SELECT 1 FROM records WHERE key = ? AND expired_at IS NULL", (key,)).fetchone() is None:
+            # 初めて見るURL: 他ソースの同じ公募が既にあればそちらにまとめる
+            alias = self.dedup.find(opp, source)
+            if alias is not None:
+                self.dedup.add_alias(key, alias)
+        if alias is None:
+            return key
+        self._aliases[key] = alias
+        return alias
+
+    @property
+    def merged(self) -> int:
+        """URLs stored under another record's key in this run."""
+        return len(self._aliases)
+
+    def run_richness(self, url: str) -> Optional[int]:
+        """Richness of the record stored for `url` in this run, or None if not seen yet."""
+        with self._lock:
+            key = canonical_url(url)
+            info = self._run.get(self._aliases.get(key, key))
+        return info[1] if info is not None else None
+
+    def iter_delta(self) -> Iterator[Tuple[str, str, Dict]]:
+        """(op, key, record) for every record that is new or changed in this run, in arrival order."""
+        for key, (op, _, _) in self._run.items():
+            if op in ("new", "changed"):
+                row = self._conn.execute("SELECT record FROM records WHERE key = ?", (key,)).fetchone()
+                yield op, key, json.loads(row[0])
+
+    def expire_missing(self, sources: Iterable[str]) -> List[Tuple[str, Dict]]:
+        """Marks records of `sources` not seen in this run as expired and returns them as (key, record)."""
+        expired: List[Tuple[str, Dict]] = []
+        with self._lock:
+            for src in sources:
+                rows = self._conn.execute(
+                    "SELECT key, record FROM records WHERE source = ? AND expired_at IS NULL AND last_seen < ?",
+                    (src, self.run_id)).fetchall()
+                for key, rec in rows:
+                    expired.append((key, json.loads(rec)))
+                self._conn.execute(
+                    "UPDATE records SET expired_at = ? WHERE source = ? AND expired_at IS NULL AND last_seen < ?",
+                    (self.run_id, src, self.run_id))
+        return expired
+
+    def merge(self, paths: Iterable[str]) -> List[Tuple[str, Dict]]:
+        """Folds shard stores into this one and begins a run (commit or roll back as usual).
+
+        Each shard store started as a copy of this store and ran a subset of the
+        sources (see `shard.py`). Records a shard saw after this store last did are
+        upserted again here, so URL aliases, near-duplicates across shards and the
+        richer-record rule work as in a single run. A record its shard expired stays
+        live if another shard saw it. Afterwards `iter_delta` yields what is new or
+        changed; the newly expired records are returned as (key, record)."""
+        paths = list(paths)
+        seen: Dict[str, List[int]] = {}  # key -> それを新しく見たシャードの番号
+        expire: Dict[str, str] = {}      # key -> expired_at
+        with self._lock:
+            # DETACH はトランザクション中にできないため、候補の洗い出しは run を始める前に行う
+            for i, path in enumerate(paths):
+                self._conn.execute("ATTACH DATABASE ? AS shard", (path,))
+                try:
+                    for (key,) in self._conn.execute(
+                            "SELECT s.key FROM shard.records s "
+                            "LEFT JOIN main.records m ON m.key = s.key "
+                            "WHERE s.expired_at IS NULL AND (m.key IS NULL OR s.last_seen > m.last_seen) "
+                            "ORDER BY s.seq"):
+                        seen.setdefault(key, []).append(i)
+                    for key, expired_at in self._conn.execute(
+                            "SELECT s.key, s.expired_at FROM shard.records s JOIN main.records m ON m.key = s.key "
+                            "WHERE s.expired_at IS NOT NULL AND m.expired_at IS NULL AND s.last_seen >= m.last_seen"):
+                        expire[key] = expired_at
+                finally:
+                    self._conn.execute("DETACH DATABASE shard")
+        self.begin_run()
+        shards = [sqlite3.connect(p, timeout=30) for p in paths]
+        try:
+            if self.dedup is not None:
+                for conn in shards:
+                    try:
+                        aliases = conn.execute("SELECT alias, key FROM url_alias").fetchall()
+                    except sqlite3.OperationalError:  # 重複排除を使っていないシャード
+                        continue
+                    with self._lock:
+                        self._conn.executemany("INSERT OR IGNORE INTO url_alias (alias, key) VALUES (?, ?)",
+                                               aliases)
+            # 複数のシャードが見たレコードは全員分を入れ、1回の実行と同じく詳しい方を残す
+            for key, found in seen.items():
+                for i in found:
+                    source, rec = shards[i].execute(
+                        "SELECT source, record FROM records WHERE key = ?", (key,)).fetchone()
+                    self.upsert(GrantOpportunity.from_dict(json.loads(rec)), source)
+        finally:
+            for conn in shards:
+                conn.close()
+        expired: List[Tuple[str, Dict]] = []
+        with self._lock:
+            for key, expired_at in expire.items():
+                if key in self._run:
+                    continue
+                row = self._conn.execute(
+                    "SELECT record FROM records WHERE key = ? AND expired_at IS NULL", (key,)).fetchone()
+                if row is not None:
+                    self._conn.execute("UPDATE records SET expired_at = ? WHERE key = ?", (expired_at, key))
+                    expired.append((key, json.loads(row[0])))
+        return expired
+
+    def commit(self):
+        with self._lock:
+            if self._conn.in_transaction:
+                self._conn.execute("COMMIT")
+
+    def rollback(self):
+        with self._lock:
+            if self._conn.in_transaction:
+                self._conn.execute("ROLLBACK")
+
+    def iter_current(self) -> Iterator[GrantOpportunity]:
+        """The `latest` view: all non-expired records in first-seen order."""
+        for _, opp in self.iter_current_json():
+            yield opp
+
+    def iter_current_json(self) -> Iterator[Tuple[str, GrantOpportunity]]:
+        """Like `iter_current`, with each record's stored JSON (the `to_json` form)."""
+        cur = self._conn.execute("SELECT record FROM records WHERE expired_at IS NULL ORDER BY seq")
+        for (rec,) in cur:
+            yield rec, GrantOpportunity.from_dict(json.loads(rec))
+
+    def counts(self) -> Tuple[int, int]:
+        row = self._conn.execute(
+            "SELECT COUNT(*), SUM(expired_at IS NOT NULL) FROM records").fetchone()
+        return row[0] or 0, row[1] or 0
+
+    def close(self, vacuum: bool = False):
+        self.commit()
+        with self._lock:
+            if vacuum:
+                self._conn.execute("VACUUM")
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._conn.close()
+
+class DeltaWriter:
+    """Writes `delta_<ts>.jsonl`: one {"op", "key", "record"} line per new, changed or
+    expired record. The file is only created once there is something to write."""
+    def __init__(self, out_dir: str, ts: str):
+        self.path = os.path.join(out_dir, f"delta_{ts}.jsonl")
+        self.counts = {"new": 0, "changed": 0, "expired": 0}
+        self._f = None
+
+    def write(self, op: str, rec: Dict, key: Optional[str] = None):
+        if self._f is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._f = open(self.path, "w", encoding="utf-8")
+        self._f.write(json.dumps({"op": op, "key": key or canonical_url(rec.get("url")), "record": rec},
+                                 ensure_ascii=False) + "\n")
+        self.counts[op] += 1
+
+    def close(self) -> Optional[str]:
+        if self._f is None:
+            return None
+        self._f.close()
+        return self.path
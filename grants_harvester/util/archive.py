@@ -0,0 +1,219 @@
+
+import os, gzip, uuid, hashlib, sqlite3, threading
+from datetime import datetime, timezone
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import requests
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    url     TEXT NOT NULL,
+    date    TEXT NOT NULL,
+    status  INTEGER,
+    digest  TEXT,
+    segment TEXT NOT NULL,
+    offset  INTEGER NOT NULL,
+    length  INTEGER NOT NULL,
+    revisit INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS records_url ON records (url, date);
+CREATE INDEX IF NOT EXISTS records_digest ON records (digest) WHERE revisit = 0;
+"""
+
+# 本文は復号済みで保存するため、転送時の符号化に関するヘッダは外す
+_DROP_HEADERS = {"content-encoding", "transfer-encoding", "content-length", "connection", "keep-alive"}
+INDEX_NAME = "index.sqlite"
+CHUNK_SIZE = 256 * 1024
+
+class Archived(NamedTuple):
+    status: int
+    reason: str
+    headers: Dict[str, str]
+    body: bytes
+    truncated: bool  # 本文を保存していない（大きすぎて取得しなかった）
+
+def _chunks(body: Union[bytes, str]):
+    # 本文はバイト列か、ストリーミング取得で書き出したファイルのパス
+    if not isinstance(body, str):
+        yield body
+        return
+    with open(body, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            yield chunk
+
+def _index(root: str, readonly: bool = False) -> sqlite3.Connection:
+    conn = sqlite3.connect(os.path.join(root, INDEX_NAME), check_same_thread=False,
+                           isolation_level=None, timeout=30)
+    if not readonly:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+    return conn
+
+class ArchiveWriter:
+    """Appends HTTP responses to a WARC/1.1 file with one gzip member per record
+    (`crawl-<ts>.warc.gz` under `root`, one file per run), indexed by URL and time
+    in `root/index.sqlite` so a record can be read without scanning the file.
+
+    A body whose digest is already in the archive is written as a `revisit`
+    record (headers only) pointing at the earlier copy, so recording a crawl that
+    is mostly 304s costs little space. The files can be read by ordinary WARC tools.
+    """
+    def __init__(self, root: str, ts: Optional[str] = None):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        ts = ts or datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        self.segment = f"crawl-{ts}.warc.gz"
+        self._f = open(os.path.join(root, self.segment), "ab")
+        self._conn = _index(root)
+        self._known = {d for (d,) in self._conn.execute("SELECT digest FROM records WHERE revisit = 0")}
+        self._rows: List[Tuple] = []
+        self._lock = threading.Lock()
+        self.count = 0
+        self.revisits = 0
+
+    def write(self, url: str, status: int, reason: str, headers: Dict[str, str], body: Union[bytes, str],
+              truncated: bool = False):
+        """Appends one response; `body` is the (decoded) body or the path of a file holding it.
+        `truncated` records a response whose body was not downloaded (too large)."""
+        h, size = hashlib.sha256(), 0
+        for chunk in _chunks(body):
+            h.update(chunk)
+            size += len(chunk)
+        digest = "sha256:" + h.hexdigest()
+        if truncated:
+            size = int(headers.get("Content-Length") or 0)
+        date = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+        head = [f"HTTP/1.1 {status} {reason or ''}".rstrip()]
+        head += [f"{k}: {v}" for k, v in headers.items() if k.lower() not in _DROP_HEADERS]
+        head.append(f"Content-Length: {size}")
+        http_head = ("\r\n".join(head) + "\r\n\r\n").encode("utf-8", errors="replace")
+        with self._lock:
+            revisit = digest in self._known and not truncated
+            fields = [("WARC-Type", "revisit" if revisit else "response"),
+                      ("WARC-Record-ID", f"<urn:uuid:{uuid.uuid4()}>"),
+                      ("WARC-Date", date),
+                      ("WARC-Target-URI", url),
+                      ("WARC-Payload-Digest", digest)]
+            if revisit:
+                fields.append(("WARC-Profile", "http://netpreserve.org/warc/1.1/revisit/identical-payload-digest"))
+            if truncated:
+                fields.append(("WARC-Truncated", "length"))
+            stored = 0 if revisit or truncated else size
+            fields += [("Content-Type", "application/http;msgtype=response"),
+                       ("Content-Length", str(len(http_head) + stored))]
+            record = ("WARC/1.1\r\n" + "".join(f"{k}: {v}\r\n" for k, v in fields) + "\r\n").encode("utf-8")
+            offset = self._f.tell()
+            # レコードごとに独立した gzip メンバーにする（索引の位置から単独で展開できる）
+            with gzip.GzipFile(fileobj=self._f, mode="wb", compresslevel=6) as gz:
+                gz.write(record)
+                gz.write(http_head)
+                if stored:
+                    for chunk in _chunks(body):
+                        gz.write(chunk)
+                gz.write(b"\r\n\r\n")
+            length = self._f.tell() - offset
+            self._rows.append((url, date, status, None if truncated else digest, self.segment, offset,
+                               length, int(revisit)))
+            if not truncated:
+                self._known.add(digest)
+            self.count += 1
+            self.revisits += revisit
+            if len(self._rows) >= 500:
+                self._flush()
+
+    def _flush(self):
+        self._f.flush()
+        self._conn.execute("BEGIN IMMEDIATE")
+        self._conn.executemany("INSERT INTO records VALUES (?, ?, ?, ?, ?, ?, ?, ?)", self._rows)
+        self._conn.execute("COMMIT")
+        self._rows.clear()
+
+    def close(self):
+        with self._lock:
+            if self._rows:
+                self._flush()
+            self._f.close()
+            self._conn.close()
+
+class ArchiveReader:
+    """Serves recorded responses from an archive written by `ArchiveWriter`: the
+    latest record of each URL, or the latest at or before `as_of` (an ISO time,
+    e.g. to replay the crawl of a given day). Safe to share between threads."""
+    def __init__(self, root: str, as_of: Optional[str] = None):
+        if not os.path.exists(os.path.join(root, INDEX_NAME)):
+            raise FileNotFoundError(f"no archive index in {root}")
+        self.root = root
+        # 日付だけならその日の終わりまで
+        self.as_of = as_of + "T23:59:59.999999Z" if as_of and len(as_of) == 10 else as_of
+        self._conn = _index(root, readonly=True)
+        self._lock = threading.Lock()
+
+    def _locate(self, url: str) -> Optional[Tuple[str, int, int, Optional[Tuple[str, int, int]]]]:
+        sql = "SELECT segment, offset, length, revisit, digest FROM records WHERE url = ?"
+        params: list = [url]
+        if self.as_of:
+            sql += " AND date <= ?"
+            params.append(self.as_of)
+        with self._lock:
+            row = self._conn.execute(sql + " ORDER BY date DESC LIMIT 1", params).fetchone()
+            if row is None:
+                return None
+            if row[3]:
+                # revisit: 本文は同じダイジェストの最初の記録にある
+                orig = self._conn.execute("SELECT segment, offset, length FROM records "
+                                          "WHERE digest = ? AND revisit = 0 LIMIT 1", (row[4],)).fetchone()
+                return (row[0], row[1], row[2], orig) if orig else None
+        return row[0], row[1], row[2], None
+
+    def _read(self, segment: str, offset: int, length: int) -> Archived:
+        with open(os.path.join(self.root, segment), "rb") as f:
+            f.seek(offset)
+            data = gzip.decompress(f.read(length))
+        warc_head, _, rest = data.partition(b"\r\n\r\n")
+        http_head, _, body = rest.partition(b"\r\n\r\n")
+        lines = http_head.decode("utf-8", errors="replace").split("\r\n")
+        _, status, *reason = lines[0].split(" ", 2)
+        headers = {}
+        for line in lines[1:]:
+            k, _, v = line.partition(":")
+            headers[k.strip()] = v.strip()
+        truncated = b"\r\nWARC-Truncated:" in warc_head
+        n = 0 if truncated else int(headers.get("Content-Length", len(body) - 4))
+        return Archived(int(status), (reason or [""])[0], headers, body[:n], truncated)
+
+    def lookup(self, url: str) -> Optional[Archived]:
+        """The recorded response of `url`, or None."""
+        loc = self._locate(url)
+        if loc is None:
+            return None
+        segment, offset, length, orig = loc
+        found = self._read(segment, offset, length)
+        if orig is not None:
+            found = found._replace(body=self._read(*orig).body)
+        return found
+
+    def response(self, url: str) -> "requests.Response":
+        """The recorded response as a `requests.Response` (a 404 "Not in archive" if missing)."""
+        import requests
+        from requests.structures import CaseInsensitiveDict
+        from requests.utils import get_encoding_from_headers
+        found = self.lookup(url)
+        resp = requests.Response()
+        resp.url = url
+        if found is None:
+            resp.status_code, resp.reason, resp._content = 404, "Not in archive", b""
+            resp.headers = CaseInsensitiveDict()
+        else:
+            resp.status_code, resp.reason, resp._content = found.status, found.reason, found.body
+            resp.headers = CaseInsensitiveDict(found.headers)
+        resp.encoding = get_encoding_from_headers(resp.headers)
+        resp.from_cache = False
+        return resp
+
+    def urls(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(DISTINCT url) FROM records").fetchone()[0]
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,123 @@
+
+import os, hashlib, threading
+from typing import Optional
+
+class BodyCache:
+    """Content-addressed on-disk store for response bodies.
+
+    Bodies are stored under `root/<ab>/<sha256>` and evicted oldest-first
+    (by last use) once the total size exceeds `max_bytes`.
+    """
+    def __init__(self, root: str, max_bytes: int = 512 * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total: Optional[int] = None
+
+    @staticmethod
+    def key_for(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key)
+
+    def has(self, key: Optional[str]) -> bool:
+        return bool(key) and os.path.exists(self._path(key))
+
+    def get(self, key: Optional[str]) -> Optional[bytes]:
+        if not key:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        try:
+            os.utime(path)  # LRU 用に最終利用時刻を更新
+        except OSError:
+            pass
+        return data
+
+    def path(self, key: Optional[str]) -> Optional[str]:
+        """On-disk path of a cached body (marked as used), or None."""
+        if not self.has(key):
+            return None
+        path = self._path(key)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def put_file(self, src: str, key: str) -> str:
+        """Moves a spooled body (whose SHA-256 is `key`) into the cache without
+        reading it into memory. `src` must be on the same filesystem."""
+        path = self._path(key)
+        if os.path.exists(path):
+            os.remove(src)
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            return path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        size = os.path.getsize(src)
+        os.replace(src, path)
+        self._added(size)
+        return path
+
+    def put(self, data: bytes) -> str:
+        key = self.key_for(data)
+        path = self._path(key)
+        if os.path.exists(path):
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            return key
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        self._added(len(data))
+        return key
+
+    def _added(self, size: int):
+        with self._lock:
+            if self._total is None:
+                self._total = self._scan_size()
+            else:
+                self._total += size
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        if not os.path.isdir(self.root):
+            return
+        for sub in os.scandir(self.root):
+            if not sub.is_dir():
+                continue
+            for e in os.scandir(sub.path):
+                if e.is_file() and not e.name.endswith(".tmp"):
+                    st = e.stat()
+                    yield e.path, st.st_size, st.st_mtime
+
+    def _scan_size(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self):
+        # 上限の 90% まで古いものから削除する（頻繁な再スキャンを避ける）
+        target = int(self.max_bytes * 0.9)
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._total = total
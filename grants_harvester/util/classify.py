@@ -1,5 +1,6 @@
 
-from typing import Dict
+from bisect import bisect_right
+from typing import Dict, List, Iterable, Optional, Tuple
 import re
 
 def score_text(text: str, weights: Dict[str, float]) -> float:
@@ -19,3 +20,140 @@ def choose_category(text: str, cat_weights: Dict[str, Dict[str, float]], default
             best_score = sc
             best_cat = cat
     return best_cat
+
+_META = set(".^$*+?{}[]\\|()")
+_SEP = "\x00"  # classify_many で本文同士を区切る文字（キーワードには現れない）
+
+def _literal_terms(pattern: str) -> Optional[List[str]]:
+    """Returns the alternatives of a pattern like '(医療|病院|DX)' if it is a plain
+    alternation of literal words, else None."""
+    body = pattern
+    if body.startswith("(") and body.endswith(")") and not body.startswith("(?"):
+        body = body[1:-1]
+    terms = body.split("|")
+    if any(not t or _SEP in t or any(c in _META for c in t) for t in terms):
+        return None
+    return terms
+
+class KeywordClassifier:
+    """Keyword-weight classifier compiled once from the `categories` config.
+
+    Equivalent to `choose_category`, but every literal keyword alternative of every
+    category is merged into one regex, so a text is scanned once instead of once
+    per pattern. Case-insensitivity is done by lower-casing the text, which keeps
+    the merged regex eligible for the engine's first-character fast skip (a
+    re.IGNORECASE pattern is not). Patterns that are not plain alternations fall
+    back to their own precompiled regex; zero-weight patterns are dropped since
+    they cannot change a score.
+    """
+    def __init__(self, categories: Dict[str, Dict[str, float]], default: str = "other"):
+        self.default = default
+        self.categories = list(categories or {})
+        # keyword id -> (category, weight)
+        self._keywords: List[Tuple[str, float]] = []
+        self._regex_keywords: List[Tuple[int, "re.Pattern"]] = []
+        term_ids: Dict[str, set] = {}
+        for cat, weights in (categories or {}).items():
+            for kw, w in (weights or {}).items():
+                w = float(w)
+                if w == 0.0:
+                    continue
+                kid = len(self._keywords)
+                self._keywords.append((cat, w))
+                terms = _literal_terms(kw)
+                if terms is None:
+                    self._regex_keywords.append((kid, re.compile(kw, re.IGNORECASE)))
+                    continue
+                for t in terms:
+                    term_ids.setdefault(t.lower(), set()).add(kid)
+
+        terms = sorted(term_ids, key=len, reverse=True)
+        # 一致した語に含まれる短い語も一致したものとみなす（例: 「医療DX」→「医療」）
+        self._implied: Dict[str, frozenset] = {}
+        self._rescan: Dict[str, bool] = {}
+        for t in terms:
+            ids = set()
+            for u in terms:
+                if u in t:
+                    ids |= term_ids[u]
+            self._implied[t] = frozenset(ids)
+            # 語の末尾にまたがって別の語が始まり得る場合は、次の位置から再走査する
+            self._rescan[t] = any(
+                len(u) > len(t) - k and u.startswith(t[k:])
+                for k in range(1, len(t)) for u in terms)
+        self._literal_ids = frozenset(i for ids in term_ids.values() for i in ids)
+        self._matcher = re.compile("|".join(re.escape(t) for t in terms)) if terms else None
+
+    def _literal_hits(self, lowered: str):
+        """Yields (start, matched_term) for the literal matcher over lower-cased text."""
+        if self._matcher is None:
+            return
+        search = self._matcher.search
+        m = search(lowered)
+        while m:
+            t = m.group()
+            yield m.start(), t
+            m = search(lowered, m.start() + 1 if self._rescan[t] else m.end())
+
+    def _scores_from_ids(self, ids: Iterable[int]) -> Dict[str, float]:
+        scores = {cat: 0.0 for cat in self.categories}
+        for kid in ids:
+            cat, w = self._keywords[kid]
+            scores[cat] += w
+        return scores
+
+    def _choose(self, scores: Dict[str, float]) -> str:
+        best_cat = self.default
+        best_score = 0.0
+        for cat in self.categories:
+            if scores[cat] > best_score:
+                best_score = scores[cat]
+                best_cat = cat
+        return best_cat
+
+    def _matched_ids(self, text: str) -> set:
+        ids = set()
+        for _, t in self._literal_hits(text.lower()):
+            ids |= self._implied[t]
+            if len(ids) == len(self._literal_ids):
+                break  # 全キーワードが一致済みなら残りは走査しない
+        for kid, rx in self._regex_keywords:
+            if rx.search(text):
+                ids.add(kid)
+        return ids
+
+    def scores(self, text: str) -> Dict[str, float]:
+        """Per-category scores, as `score_text` would compute them."""
+        if not text:
+            return {cat: 0.0 for cat in self.categories}
+        return self._scores_from_ids(self._matched_ids(text))
+
+    def classify(self, text: str) -> str:
+        if not text:
+            return self.default
+        return self._choose(self.scores(text))
+
+    __call__ = classify
+
+    def scores_many(self, texts: Iterable[str]) -> List[Dict[str, float]]:
+        texts = [t or "" for t in texts]
+        matched: List[set] = [set() for _ in texts]
+        if self._matcher is not None and texts:
+            # 全文を区切り文字で連結して一度に走査し、一致位置から元の本文を引く
+            starts, pos = [], 0
+            lowered = [t.lower() for t in texts]
+            for t in lowered:
+                starts.append(pos)
+                pos += len(t) + 1
+            for start, t in self._literal_hits(_SEP.join(lowered)):
+                matched[bisect_right(starts, start) - 1] |= self._implied[t]
+        if self._regex_keywords:
+            for i, text in enumerate(texts):
+                if text:
+                    for kid, rx in self._regex_keywords:
+                        if rx.search(text):
+                            matched[i].add(kid)
+        return [self._scores_from_ids(ids) for ids in matched]
+
+    def classify_many(self, texts: Iterable[str]) -> List[str]:
+        return [self._choose(sc) for sc in self.scores_many(texts)]
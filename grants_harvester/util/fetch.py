@@ -1,7 +1,19 @@
 
-import time, os, json
-from typing import Optional, Dict
-import requests
+import time, os, hashlib, tempfile, threading
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, Dict, Iterable, Iterator, Tuple, TYPE_CHECKING
+from urllib.parse import urlsplit
+from .cache import BodyCache
+from .state import FetchStateStore
+from .archive import ArchiveReader, ArchiveWriter
+from . import metrics
+from .throttle import (HostThrottle, RETRY_STATUSES, backoff_delay, crawl_delay_from_robots,
+                       parse_retry_after)
+
+if TYPE_CHECKING:
+    import requests
 
 # 環境変数 HARVESTER_UA が設定されていればそれを使い、なければ汎用的なUAを使う
 # 運用時は環境変数で連絡先を設定することを推奨
@@ -9,57 +21,546 @@ DEFAULT_UA = os.environ.get(
     "HARVESTER_UA",
     "GrantsHarvester/1.0 (+https://github.com/KazuhisaShimmura/jichitai)")
 CACHE_DIR = os.environ.get("GRANTS_CACHE_DIR", ".cache/harvester")
-os.makedirs(CACHE_DIR, exist_ok=True)
-ETAG_DB = os.path.join(CACHE_DIR, "etag_index.json")
+# ディレクトリは書き込む側（状態DB・本文キャッシュ・レコードDB）がそれぞれ作る。import 時には何も作らない
+STATE_DB = os.path.join(CACHE_DIR, "fetch_state.sqlite")
+LEGACY_ETAG_DB = os.path.join(CACHE_DIR, "etag_index.json")  # 旧形式（初回のみ移行）
+BODY_CACHE_DIR = os.path.join(CACHE_DIR, "bodies")
+# ストリーミング取得の一時ファイル（本文キャッシュへ os.replace で移すため同じファイルシステムに置く）
+SPOOL_DIR = os.path.join(CACHE_DIR, "spool")
+CHUNK_SIZE = 256 * 1024
+RECORD_DB = os.path.join(CACHE_DIR, "records.sqlite")
 
-def _load_db() -> Dict:
-    if os.path.exists(ETAG_DB):
-        try:
-            return json.load(open(ETAG_DB, "r", encoding="utf-8"))
-        except (json.JSONDecodeError, IOError):
-            return {}
-    return {}
+def open_state_store(path: str = STATE_DB) -> FetchStateStore:
+    store = FetchStateStore(path)
+    if store.is_empty() and os.path.exists(LEGACY_ETAG_DB):
+        n = store.import_etag_json(LEGACY_ETAG_DB)
+        print(f"[INFO] Migrated {n} entries from {LEGACY_ETAG_DB}")
+    return store
+
+def host_of(url: str) -> str:
+    return urlsplit(url).netloc.lower()
+
+# robots.txt を再取得するまでの期間（それまでは保存済みの本文を使う）
+ROBOTS_TTL = timedelta(hours=24)
+
+def _content_length(resp: "requests.Response") -> Optional[int]:
+    try:
+        return int(resp.headers["Content-Length"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+class Download:
+    """A response body on disk, from `HttpFetcher.download`.
+
+    `path` is the body in the body cache (unchanged, or changed and cacheable) or a
+    spooled temp file that `close()` removes. `skipped` is set instead when the body
+    was not downloaded ("too_large"); `path` is None then and for error statuses.
+    """
+    __slots__ = ("url", "status_code", "path", "size", "content_type", "content_hash",
+                 "from_cache", "skipped", "_temp")
 
-def _save_db(db: Dict):
-    tmp = ETAG_DB + ".tmp"
-    with open(tmp, "w", encoding="utf-8") as f:
-        json.dump(db, f, ensure_ascii=False, indent=2)
-    os.replace(tmp, ETAG_DB)
+    def __init__(self, url: str, status_code: int, path: Optional[str] = None, size: Optional[int] = None,
+                 content_type: Optional[str] = None, content_hash: Optional[str] = None,
+                 from_cache: bool = False, skipped: Optional[str] = None, temp: bool = False):
+        self.url = url
+        self.status_code = status_code
+        self.path = path
+        self.size = size
+        self.content_type = content_type
+        self.content_hash = content_hash
+        self.from_cache = from_cache
+        self.skipped = skipped
+        self._temp = temp
+
+    @property
+    def ok(self) -> bool:
+        return 200 <= self.status_code < 400
+
+    def raise_for_status(self):
+        if not self.ok:
+            import requests
+            raise requests.HTTPError(f"{self.status_code} Error for url: {self.url}")
+
+    def read(self) -> bytes:
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def close(self):
+        if self._temp and self.path:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            self.path = None
+
+    def __enter__(self) -> "Download":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
 class HttpFetcher:
-    def __init__(self, min_interval_sec: float = 0.0, timeout: float = 20.0, ua: str = DEFAULT_UA):
+    """Thread-safe fetcher with per-host politeness, conditional requests and retries.
+
+    Each host gets a `HostThrottle`: `min_interval_sec` is the starting interval
+    between requests to one host, which adapts between `min_interval_floor_sec`
+    (default: `min_interval_sec`, i.e. never faster than configured) and
+    `max_interval_sec`, and never goes below the host's robots.txt Crawl-delay.
+    Connection errors, timeouts and 429/5xx responses are retried up to `retries`
+    times with jittered exponential backoff, honoring Retry-After (a longer
+    Retry-After than `max_retry_after_sec` returns the response instead).
+
+    With `record`, every response a caller receives (including bodies replayed from
+    the body cache on 304) is appended to an `ArchiveWriter`. With `replay`, `get`
+    and `download` serve responses from an `ArchiveReader` instead of the network:
+    no requests, no host intervals, no robots.txt, and the fetch state is neither
+    read nor written (every response is a full one, as recorded).
+    """
+    def __init__(self, min_interval_sec: float = 0.0, timeout: float = 20.0, ua: str = DEFAULT_UA,
+                 max_concurrency: int = 8, per_host_concurrency: int = 1,
+                 body_cache: Optional[BodyCache] = None, state: Optional[FetchStateStore] = None,
+                 min_interval_floor_sec: Optional[float] = None, max_interval_sec: float = 60.0,
+                 retries: int = 3, backoff_base_sec: float = 1.0, max_retry_after_sec: float = 120.0,
+                 respect_robots: bool = True, record: Optional[ArchiveWriter] = None,
+                 replay: Optional[ArchiveReader] = None):
+        # min_interval_sec はホストごとの間隔。別ホストへのリクエストは互いに待たない
         self.min_interval_sec = min_interval_sec
+        self.min_interval_floor_sec = min_interval_sec if min_interval_floor_sec is None else min_interval_floor_sec
+        self.max_interval_sec = max_interval_sec
+        self.retries = max(0, retries)
+        self.backoff_base_sec = backoff_base_sec
+        self.max_retry_after_sec = max_retry_after_sec
+        self.respect_robots = respect_robots
         self.timeout = timeout
-        self.session = requests.Session()
-        self.session.headers.update({"User-Agent": ua})
-        self._last_fetch = 0.0
-        self._db = _load_db()
-
-    def get(self, url: str, use_cache_headers: bool = True) -> requests.Response:
-        # polite spacing
-        now = time.time()
-        if now - self._last_fetch < self.min_interval_sec:
-            time.sleep(self.min_interval_sec - (now - self._last_fetch))
-        self._last_fetch = time.time()
+        self.ua = ua
+        self.max_concurrency = max(1, max_concurrency)
+        self.per_host_concurrency = per_host_concurrency
+        self._local = threading.local()
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._hosts: Dict[str, HostThrottle] = {}
+        self._hosts_lock = threading.Lock()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        self.state = state if state is not None else open_state_store()
+        # 304 のときに前回の本文を返すためのキャッシュ
+        self.body_cache = body_cache if body_cache is not None else BodyCache(BODY_CACHE_DIR)
+        self.record = record
+        self.replay = replay
+
+    @property
+    def session(self) -> "requests.Session":
+        # requests.Session はスレッドセーフではないため、スレッドごとに持つ
+        s = getattr(self._local, "session", None)
+        if s is None:
+            import requests  # import に時間がかかるため、最初のリクエストまで遅らせる
+            s = requests.Session()
+            s.headers.update({"User-Agent": self.ua})
+            self._local.session = s
+        return s
+
+    def _host_slot(self, url: str) -> HostThrottle:
+        host = host_of(url)
+        with self._hosts_lock:
+            slot = self._hosts.get(host)
+            if slot is None:
+                slot = self._hosts[host] = HostThrottle(
+                    self.per_host_concurrency, self.min_interval_sec,
+                    floor=self.min_interval_floor_sec, ceiling=self.max_interval_sec)
+        if self.respect_robots and not slot.robots_checked:
+            self._check_robots(url, slot)
+        return slot
+
+    def _check_robots(self, url: str, slot: HostThrottle):
+        # ホストごとに最初の1回だけ。同じホストの他スレッドは読み込みが終わるまで待つ
+        # （robots_lock は RLock: robots.txt 自体の取得で同じスレッドがここへ戻ってくる）
+        with slot.robots_lock:
+            if slot.robots_checked:
+                return
+            parts = urlsplit(url)
+            robots_url = f"{parts.scheme}://{parts.netloc}/robots.txt"
+            if url == robots_url:
+                return
+            try:
+                # 最初にそのホストへ行ったソースの計測値（変化の履歴に使う）に含めない
+                with metrics.source_scope("(robots)"):
+                    text = self._robots_text(robots_url)
+                delay = crawl_delay_from_robots(text, self.ua) if text else None
+            except Exception as e:
+                print(f"[WARN] robots.txt unavailable for {parts.netloc}: {e}")
+                delay = None
+            slot.robots_checked = True
+            if delay is not None:
+                print(f"[INFO] {parts.netloc}: Crawl-delay {delay:g}s (robots.txt)")
+                slot.set_crawl_delay(delay)
 
+    def _robots_text(self, robots_url: str) -> Optional[str]:
+        meta = self.state.get(robots_url)
+        fetched_at = meta.get("fetched_at")
+        if fetched_at and self.body_cache is not None and meta.get("status") in (200, 304):
+            age = datetime.now(timezone.utc) - datetime.fromisoformat(fetched_at)
+            body = self.body_cache.get(meta.get("content_hash")) if age < ROBOTS_TTL else None
+            if body is not None:
+                return body.decode("utf-8", errors="replace")
+        resp = self.get(robots_url)
+        if resp.status_code != 200:
+            return None
+        if self.body_cache is not None and not resp.from_cache:
+            self.body_cache.put(resp.content)  # 検証子が無くても TTL の間は再利用する
+        return resp.content.decode("utf-8", errors="replace")
+
+    def get(self, url: str, use_cache_headers: bool = True,
+            max_bytes: Optional[int] = None) -> "requests.Response":
+        """GET with conditional headers. On 304 the cached body is replayed, so the
+        caller receives a normal 200 response (with `from_cache = True`).
+
+        With `max_bytes`, a body larger than that (by Content-Length, or once that
+        many bytes have arrived) is not read into memory: the response comes back
+        with an empty body and `skipped = "too_large"`, like `download`.
+        """
+        if self.replay is not None:
+            resp = self.replay.response(url)
+            metrics.record_request(resp.status_code, len(resp.content), 0.0)
+            if max_bytes and len(resp.content) > max_bytes:
+                metrics.incr("too_large")
+                resp._content, resp.skipped = b"", "too_large"
+            return resp
         headers = {}
-        if use_cache_headers and url in self._db:
-            meta = self._db[url]
-            if "etag" in meta:
-                headers["If-None-Match"] = meta["etag"]
-            if "last_modified" in meta:
-                headers["If-Modified-Since"] = meta["last_modified"]
+        meta = {}
+        if use_cache_headers:
+            meta = self.state.get(url)
+            # 本文がキャッシュに無い場合は 304 を受けても再現できないので条件付きにしない
+            if self.body_cache is None or self.body_cache.has(meta.get("content_hash")):
+                if "etag" in meta:
+                    headers["If-None-Match"] = meta["etag"]
+                if "last_modified" in meta:
+                    headers["If-Modified-Since"] = meta["last_modified"]
 
-        resp = self.session.get(url, headers=headers, timeout=self.timeout, allow_redirects=True)
+        stream = bool(max_bytes)
+        resp, latency_ms = self._send(url, headers, stream=stream)
         if resp.status_code == 304:
-            # Return a minimal Response-like object with 304
-            return resp
+            if stream:
+                resp.close()  # 本文は無い。接続をプールへ戻す
+            body = self.body_cache.get(meta.get("content_hash")) if self.body_cache is not None else None
+            if body is not None or self.body_cache is None:
+                self.state.record(url, 304, etag=resp.headers.get("ETag"),
+                                  last_modified=resp.headers.get("Last-Modified"),
+                                  latency_ms=latency_ms)
+                if body is None:
+                    # Return a minimal Response-like object with 304
+                    return resp
+                return self._archived(url, self._replay(resp, body, meta))
+            # evicted between the check and the request; fetch unconditionally
+            resp, latency_ms = self._send(url, {}, stream=stream)
 
+        resp.from_cache = False
+        if stream and not self._read_capped(resp, max_bytes):
+            # 取得状態は更新しない（次回も条件なしで確認する）
+            metrics.incr("too_large")
+            if self.record is not None:
+                self.record.write(url, resp.status_code, resp.reason, dict(resp.headers), b"", truncated=True)
+            return resp
         # update cache headers
         etag = resp.headers.get("ETag")
         lm = resp.headers.get("Last-Modified")
-        self._db[url] = {}
-        if etag: self._db[url]["etag"] = etag
-        if lm: self._db[url]["last_modified"] = lm
-        _save_db(self._db)
+        content_hash = None
+        if resp.ok:
+            if (etag or lm) and self.body_cache is not None:
+                content_hash = self.body_cache.put(resp.content)
+            else:
+                content_hash = BodyCache.key_for(resp.content)
+        if self.state.record(url, resp.status_code,
+                             etag=etag if resp.ok else None,
+                             last_modified=lm if resp.ok else None,
+                             content_type=resp.headers.get("Content-Type"),
+                             content_hash=content_hash, latency_ms=latency_ms):
+            # 本文が前回から変わった（ソースの再取得間隔の学習に使う）
+            metrics.incr("changed")
+        return self._archived(url, resp)
+
+    @staticmethod
+    def _read_capped(resp: "requests.Response", max_bytes: int) -> bool:
+        """Reads a streamed body into `resp.content` unless it is larger than
+        `max_bytes`; then the body is left empty, `resp.skipped` is set and False
+        is returned."""
+        size = _content_length(resp)
+        chunks, n = [], 0
+        try:
+            if size is None or size <= max_bytes:
+                for chunk in resp.iter_content(CHUNK_SIZE):
+                    n += len(chunk)
+                    if n > max_bytes:
+                        break
+                    chunks.append(chunk)
+        finally:
+            resp.close()
+            metrics.incr("bytes", n)
+        too_large = n > max_bytes or (size is not None and size > max_bytes)
+        resp._content = b"" if too_large else b"".join(chunks)
+        resp.skipped = "too_large" if too_large else None
+        return not too_large
+
+    def _archived(self, url: str, resp, body=None):
+        if self.record is not None:
+            self.record.write(url, resp.status_code, resp.reason, dict(resp.headers),
+                              resp.content if body is None else body)
+        return resp
+
+    def download(self, url: str, max_bytes: Optional[int] = None, precheck: bool = False) -> Download:
+        """GET that streams the body to disk instead of memory, for large attachments.
+
+        Conditional like `get`: an unchanged body is served from the body cache
+        without being transferred. A body larger than `max_bytes` (by Content-Length,
+        or once that many bytes have arrived) is not downloaded and comes back with
+        `skipped = "too_large"`. With `precheck`, a HEAD request first checks the
+        size and the validators, so an oversized or unchanged file is never
+        requested with GET (useful for servers that ignore conditional headers).
+        """
+        import requests
+        if self.replay is not None:
+            return self._download_replayed(url, max_bytes)
+        meta = self.state.get(url)
+        cached = self.body_cache.path(meta.get("content_hash")) if self.body_cache is not None else None
+        headers = {}
+        if cached:
+            if "etag" in meta:
+                headers["If-None-Match"] = meta["etag"]
+            if "last_modified" in meta:
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        def unchanged(resp, latency_ms) -> Download:
+            self.state.record(url, 304, etag=resp.headers.get("ETag"),
+                              last_modified=resp.headers.get("Last-Modified"), latency_ms=latency_ms)
+            if self.record is not None:
+                self.record.write(url, 200, "OK (cached)",
+                                  {**resp.headers, "Content-Type": meta.get("content_type") or ""}, cached)
+            return Download(url, 200, cached, os.path.getsize(cached), meta.get("content_type"),
+                            meta.get("content_hash"), from_cache=True)
+
+        def too_large(resp, size) -> Download:
+            metrics.incr("too_large")
+            if self.record is not None:
+                self.record.write(url, resp.status_code, resp.reason, dict(resp.headers), b"", truncated=True)
+            return Download(url, resp.status_code, size=size, content_type=resp.headers.get("Content-Type"),
+                            skipped="too_large")
+
+        if precheck:
+            try:
+                head, latency_ms = self._send(url, headers, method="HEAD")
+            except requests.RequestException:
+                head = None  # HEAD に対応しないサーバもあるので GET で続ける
+            if head is not None:
+                etag = head.headers.get("ETag")
+                if cached and (head.status_code == 304 or (head.ok and etag and etag == meta.get("etag"))):
+                    return unchanged(head, latency_ms)
+                size = _content_length(head) if head.ok else None
+                if max_bytes and size is not None and size > max_bytes:
+                    return too_large(head, size)
+
+        resp, latency_ms = self._send(url, headers, stream=True)
+        try:
+            if resp.status_code == 304:
+                if cached and os.path.exists(cached):
+                    return unchanged(resp, latency_ms)
+                # 確認の後で本文キャッシュから消えた
+                resp.close()
+                resp, latency_ms = self._send(url, {}, stream=True)
+            ctype = resp.headers.get("Content-Type")
+            if not resp.ok:
+                self.state.record(url, resp.status_code, content_type=ctype, latency_ms=latency_ms)
+                if self.record is not None:
+                    self.record.write(url, resp.status_code, resp.reason, dict(resp.headers), b"")
+                return Download(url, resp.status_code, content_type=ctype)
+            size = _content_length(resp)
+            if max_bytes and size is not None and size > max_bytes:
+                return too_large(resp, size)
+            path, size, content_hash = self._spool(resp, max_bytes)
+        finally:
+            resp.close()
+        if path is None:
+            return too_large(resp, size)
+
+        etag, lm = resp.headers.get("ETag"), resp.headers.get("Last-Modified")
+        temp = True
+        if (etag or lm) and self.body_cache is not None:
+            path, temp = self.body_cache.put_file(path, content_hash), False
+        if self.state.record(url, resp.status_code, etag=etag, last_modified=lm, content_type=ctype,
+                             content_hash=content_hash, latency_ms=latency_ms):
+            metrics.incr("changed")
+        if self.record is not None:
+            self.record.write(url, resp.status_code, resp.reason, dict(resp.headers), path)
+        return Download(url, resp.status_code, path, size, ctype, content_hash, temp=temp)
+
+    def _download_replayed(self, url: str, max_bytes: Optional[int]) -> Download:
+        found = self.replay.lookup(url)
+        if found is None:
+            return Download(url, 404)
+        ctype = found.headers.get("Content-Type")
+        metrics.record_request(found.status, len(found.body), 0.0)
+        if found.truncated or (max_bytes and len(found.body) > max_bytes):
+            metrics.incr("too_large")
+            return Download(url, found.status, size=int(found.headers.get("Content-Length") or 0),
+                            content_type=ctype, skipped="too_large")
+        if not 200 <= found.status < 400:
+            return Download(url, found.status, content_type=ctype)
+        # 抽出プロセスはパスから読むため、記録の本文も一時ファイルに書き出す
+        os.makedirs(SPOOL_DIR, exist_ok=True)
+        fd, path = tempfile.mkstemp(dir=SPOOL_DIR, suffix=".part")
+        with os.fdopen(fd, "wb") as f:
+            f.write(found.body)
+        return Download(url, found.status, path, len(found.body), ctype,
+                        hashlib.sha256(found.body).hexdigest(), temp=True)
+
+    @staticmethod
+    def _spool(resp: "requests.Response", max_bytes: Optional[int]) -> Tuple[Optional[str], int, Optional[str]]:
+        """Writes the body to a temp file while hashing it. Returns (path, size, sha256),
+        or (None, bytes read, None) once the body exceeds `max_bytes`."""
+        os.makedirs(SPOOL_DIR, exist_ok=True)
+        fd, path = tempfile.mkstemp(dir=SPOOL_DIR, suffix=".part")
+        h, size = hashlib.sha256(), 0
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in resp.iter_content(CHUNK_SIZE):
+                    size += len(chunk)
+                    if max_bytes and size > max_bytes:
+                        break
+                    h.update(chunk)
+                    f.write(chunk)
+        except BaseException:
+            os.remove(path)
+            raise
+        finally:
+            metrics.incr("bytes", size)
+        if max_bytes and size > max_bytes:
+            os.remove(path)
+            return None, size, None
+        return path, size, h.hexdigest()
+
+    def _send(self, url: str, headers: Dict[str, str], method: str = "GET",
+              stream: bool = False) -> Tuple["requests.Response", float]:
+        """One request with retries on connection errors, timeouts and 429/5xx.
+        With `stream` the body is left unread (the caller must close the response)."""
+        import requests
+        slot = self._host_slot(url)
+        attempt = 0
+        while True:
+            try:
+                resp, latency = self._attempt(slot, url, headers, method, stream)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self.retries:
+                    raise
+            else:
+                if resp.status_code not in RETRY_STATUSES or attempt >= self.retries:
+                    return resp, latency * 1000
+                retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+                if retry_after is not None and retry_after > self.max_retry_after_sec:
+                    return resp, latency * 1000
+                resp.close()
+            # 待つのはスロットの外で（Retry-After はホスト側の next_at にも反映済み）
+            time.sleep(backoff_delay(attempt, self.backoff_base_sec, self.max_interval_sec))
+            attempt += 1
+            metrics.incr("retries")
+
+    def _attempt(self, slot: HostThrottle, url: str, headers: Dict[str, str], method: str = "GET",
+                 stream: bool = False) -> Tuple["requests.Response", float]:
+        queued = time.perf_counter()
+        with slot.sem:
+            slot.wait_turn()
+            with self._slots:
+                t0 = time.perf_counter()
+                metrics.add_time("wait", t0 - queued)
+                try:
+                    resp = self.session.request(method, url, headers=headers, timeout=self.timeout,
+                                                allow_redirects=True, stream=stream)
+                except Exception:
+                    latency = time.perf_counter() - t0
+                    metrics.record_request(None, 0, latency)
+                    slot.observe(None, latency)
+                    raise
+                latency = time.perf_counter() - t0
+                # ストリーミング時の転送量は読み終えた側で数える
+                metrics.record_request(resp.status_code, 0 if stream else len(resp.content), latency)
+                retry_after = None
+                if resp.status_code in RETRY_STATUSES:
+                    retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+                    if retry_after is not None:
+                        retry_after = min(retry_after, self.max_retry_after_sec)
+                slot.observe(resp.status_code, latency, retry_after)
+                return resp, latency
+
+    @staticmethod
+    def _replay(resp: "requests.Response", body: bytes, meta: Dict) -> "requests.Response":
+        from requests.utils import get_encoding_from_headers
+        resp.status_code = 200
+        resp.reason = "OK (cached)"
+        resp._content = body
+        # 304 は検証子を省略できる。前回の 200 と同じヘッダを返す（Last-Modified は公開日の補完に使う）
+        for header, field in (("Content-Type", "content_type"), ("Last-Modified", "last_modified"),
+                              ("ETag", "etag")):
+            if meta.get(field) and header not in resp.headers:
+                resp.headers[header] = meta[field]
+        resp.headers["Content-Length"] = str(len(body))
+        resp.encoding = get_encoding_from_headers(resp.headers)
+        resp.from_cache = True
         return resp
+
+    def _executor(self) -> ThreadPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                # 同一ホストの間隔待ちで塞がるスレッドがあるため、同時接続数より多めに確保する
+                # (実際の同時リクエスト数は self._slots で制限される)
+                self._pool = ThreadPoolExecutor(max_workers=self.max_concurrency * 4,
+                                                thread_name_prefix="fetch")
+            return self._pool
+
+    def get_many(self, urls: Iterable[str], use_cache_headers: bool = True,
+                 return_exceptions: bool = False,
+                 max_bytes: Optional[int] = None) -> Iterator[Tuple[str, "requests.Response"]]:
+        """Fetches `urls` concurrently (subject to the per-host and global limits)
+        and yields (url, response) in input order. A failed fetch re-raises its
+        exception when its turn comes, just like calling get() in a loop, unless
+        `return_exceptions` is set, in which case the exception is yielded instead.
+        `max_bytes` caps each body as in `get`."""
+        return self._ordered(lambda u: self.get(u, use_cache_headers, max_bytes), urls, return_exceptions)
+
+    def download_many(self, urls: Iterable[str], return_exceptions: bool = False,
+                      **kwargs) -> Iterator[Tuple[str, Download]]:
+        """`download` for several URLs, concurrently and in input order like `get_many`.
+        Close each Download when done with it (ones never yielded are closed here)."""
+        return self._ordered(lambda u: self.download(u, **kwargs), urls, return_exceptions,
+                             discard=Download.close)
+
+    def _ordered(self, fn: Callable[[str], Any], urls: Iterable[str], return_exceptions: bool,
+                 discard: Optional[Callable[[Any], None]] = None) -> Iterator[Tuple[str, Any]]:
+        pool = self._executor()
+        window = self.max_concurrency
+        pending = deque()
+        it = iter(urls)
+        for u in it:
+            pending.append((u, pool.submit(metrics.bind(fn), u)))
+            if len(pending) >= window:
+                break
+        try:
+            while pending:
+                u, fut = pending.popleft()
+                nxt = next(it, None)
+                if nxt is not None:
+                    pending.append((nxt, pool.submit(metrics.bind(fn), nxt)))
+                try:
+                    resp = fut.result()
+                except Exception as e:
+                    if not return_exceptions:
+                        raise
+                    resp = e
+                yield u, resp
+        finally:
+            # 途中で打ち切られた場合、取得済み・取得中の結果（一時ファイルなど）を片付ける
+            if discard is not None:
+                for _, fut in pending:
+                    fut.add_done_callback(lambda f: f.exception() is None and discard(f.result()))
+
+    def close(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True)
+                self._pool = None
+        self.state.close()
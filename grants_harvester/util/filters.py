@@ -0,0 +1,91 @@
+
+import re
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, TypeVar
+
+from . import metrics
+
+T = TypeVar("T")
+_BACKREF = re.compile(r"\\[1-9]|\(\?P=")
+
+class _AnyOf:
+    """Fallback for pattern lists that cannot be merged into one regex."""
+    def __init__(self, patterns: Sequence[str]):
+        self._compiled = [re.compile(p) for p in patterns]
+
+    def search(self, s: str):
+        for rx in self._compiled:
+            m = rx.search(s)
+            if m:
+                return m
+        return None
+
+def _merge(patterns: Sequence[str]):
+    """Compiles patterns into one alternation; any(re.search(p, s)) == bool(merged.search(s))."""
+    if not patterns:
+        return None
+    if len(patterns) == 1:
+        return re.compile(patterns[0])
+    if any(_BACKREF.search(p) for p in patterns):
+        # 結合するとグループ番号がずれるため個別に評価する
+        return _AnyOf(patterns)
+    try:
+        return re.compile("|".join(f"(?:{p})" for p in patterns))
+    except re.error:
+        # 後方参照やグローバルフラグなど、結合できないパターンが混在する場合
+        return _AnyOf(patterns)
+
+class PatternFilter:
+    """include_patterns / exclude_patterns compiled once per source.
+
+    A text passes if it matches any include pattern (or there are none) and no
+    exclude pattern, exactly like the former per-item `any(re.search(p, ...))` loops.
+    """
+    __slots__ = ("include", "exclude", "_inc", "_exc")
+
+    def __init__(self, include: Sequence[str] = (), exclude: Sequence[str] = ()):
+        self.include = tuple(include or ())
+        self.exclude = tuple(exclude or ())
+        self._inc = _merge(self.include)
+        self._exc = _merge(self.exclude)
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "PatternFilter":
+        return _cached_filter(tuple(config.get("include_patterns") or ()),
+                              tuple(config.get("exclude_patterns") or ()))
+
+    def matches(self, text: str) -> bool:
+        if (self._inc is not None and not self._inc.search(text)) or \
+                (self._exc is not None and self._exc.search(text)):
+            metrics.incr("filtered")
+            return False
+        return True
+
+    __call__ = matches
+
+    def filter(self, items: Iterable[T], key: Optional[Callable[[T], str]] = None) -> List[T]:
+        """Bulk mode: returns the items (URLs, or (href, text) pairs with `key`) that pass."""
+        return list(self.ifilter(items, key))
+
+    def ifilter(self, items: Iterable[T], key: Optional[Callable[[T], str]] = None) -> Iterator[T]:
+        """Streaming variant of filter()."""
+        inc = self._inc.search if self._inc is not None else None
+        exc = self._exc.search if self._exc is not None else None
+        if inc is None and exc is None:
+            yield from items
+            return
+        rejected = 0
+        try:
+            for it in items:
+                s = key(it) if key is not None else it
+                if (inc is not None and not inc(s)) or (exc is not None and exc(s)):
+                    rejected += 1
+                    continue
+                yield it
+        finally:
+            metrics.incr("filtered", rejected)
+
+@lru_cache(maxsize=256)
+def _cached_filter(include, exclude) -> PatternFilter:
+    # 同じパターンを持つソースでコンパイル済みのフィルタを共有する
+    return PatternFilter(include, exclude)
@@ -0,0 +1,177 @@
+
+import importlib.util
+from functools import lru_cache
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from .text import normalize_whitespace
+
+# 本文テキストから除外する要素（中身ごと読み飛ばす）
+_SKIP_TAGS = frozenset(("script", "style"))
+
+class ParsedPage(NamedTuple):
+    title: Optional[str]
+    text: str
+    links: List[Tuple[str, str]]  # (href, anchor text) — 文書順
+
+class _Collector:
+    """Accumulates the pieces of one traversal: all visible text, the first <title>,
+    the first <h1> (title fallback) and the text of every <a href>."""
+    __slots__ = ("parts", "title", "h1", "links", "_open")
+
+    def __init__(self):
+        self.parts: List[str] = []
+        self.title: Optional[List[str]] = None
+        self.h1: Optional[List[str]] = None
+        self.links: List[Tuple[str, str]] = []
+        self._open: List[list] = []  # 現在開いている title / h1 / a の文字列バッファ
+
+    def text(self, s: str):
+        self.parts.append(s)
+        for buf in self._open:
+            buf.append(s)
+
+    def start(self, tag: str, href: Optional[str]) -> bool:
+        """Returns True if `tag` opened a buffer that end() must close."""
+        if tag == "a":
+            if href is None:
+                return False
+            buf = [href]
+        elif tag == "title" and self.title is None:
+            buf = self.title = []
+        elif tag == "h1" and self.h1 is None:
+            buf = self.h1 = []
+        else:
+            return False
+        self._open.append(buf)
+        return True
+
+    def end(self, tag: str):
+        buf = self._open.pop()
+        if tag == "a" and buf[0]:
+            self.links.append((buf[0], normalize_whitespace("".join(buf[1:]))))
+
+    def result(self) -> ParsedPage:
+        title = normalize_whitespace("".join(self.title)) if self.title else None
+        if not title and self.h1:
+            title = normalize_whitespace("".join(self.h1))
+        return ParsedPage(title or None, normalize_whitespace("".join(self.parts)), self.links)
+
+def _parse_bs4(html: str) -> ParsedPage:
+    from bs4 import BeautifulSoup, CData, NavigableString, Tag
+    soup = BeautifulSoup(html, "html.parser")
+    c = _Collector()
+    # 再帰せずに明示的なスタックで1回だけ走査する（深い入れ子でも再帰上限に当たらない）
+    stack = [(iter(soup.contents), None)]
+    while stack:
+        node = next(stack[-1][0], None)
+        if node is None:
+            _, closing = stack.pop()
+            if closing:
+                c.end(closing)
+            continue
+        if isinstance(node, Tag):
+            name = node.name
+            if name in _SKIP_TAGS:
+                continue
+            opened = c.start(name, node.get("href") if name == "a" else None)
+            stack.append((iter(node.contents), name if opened else None))
+        elif type(node) is NavigableString or type(node) is CData:
+            # Comment / Doctype などは get_text() と同じく含めない
+            c.text(node)
+    return c.result()
+
+def _parse_lxml(html: str) -> ParsedPage:
+    from lxml import etree, html as lxml_html
+    try:
+        try:
+            root = lxml_html.document_fromstring(html)
+        except ValueError:
+            # encoding 宣言付きの XHTML は str のままでは解析できない
+            root = lxml_html.document_fromstring(
+                html.encode("utf-8"), parser=lxml_html.HTMLParser(encoding="utf-8"))
+    except etree.ParserError:  # 空文書
+        return ParsedPage(None, "", [])
+    # コメント・処理命令と script/style は C 側でまとめて取り除く（前後のテキストは残る）。
+    # iterwalk はコメントを通知しないため、先に除去しないと直後のテキストを取りこぼす
+    etree.strip_tags(root, etree.Comment, etree.ProcessingInstruction)
+    etree.strip_elements(root, *_SKIP_TAGS, with_tail=False)
+    c = _Collector()
+    opened: List[bool] = []
+    for event, el in etree.iterwalk(root, events=("start", "end")):
+        tag = el.tag
+        if event == "start":
+            opened.append(c.start(tag, el.get("href") if tag == "a" else None))
+            if el.text:
+                c.text(el.text)
+        else:
+            if opened.pop():
+                c.end(tag)
+            if el.tail:
+                c.text(el.tail)
+    return c.result()
+
+def _parse_selectolax(html: str) -> ParsedPage:
+    try:
+        from selectolax.lexbor import LexborHTMLParser as _Parser
+    except ImportError:
+        from selectolax.parser import HTMLParser as _Parser
+    tree = _Parser(html)
+    # script/style の除去とサブツリーのテキスト化は C 側で行い、Python での走査は1回だけ
+    tree.strip_tags(list(_SKIP_TAGS))
+    if tree.root is None:
+        return ParsedPage(None, "", [])
+    parts: List[str] = []
+    title = h1 = None
+    links: List[Tuple[str, str]] = []
+    for node in tree.root.traverse(include_text=True):
+        tag = node.tag
+        if tag == "-text":
+            parts.append(node.text(deep=False))
+        elif tag == "a":
+            href = node.attributes.get("href")
+            if href:
+                links.append((href, normalize_whitespace(node.text(deep=True))))
+        elif tag == "title" and title is None:
+            title = normalize_whitespace(node.text(deep=True))
+        elif tag == "h1" and h1 is None:
+            h1 = normalize_whitespace(node.text(deep=True))
+    return ParsedPage(title or h1 or None, normalize_whitespace("".join(parts)), links)
+
+# 優先順（auto のとき、インストール済みの最初のものを使う）
+BACKENDS: Dict[str, Tuple[str, Callable[[str], ParsedPage]]] = {
+    "selectolax": ("selectolax", _parse_selectolax),
+    "lxml": ("lxml", _parse_lxml),
+    "bs4": ("bs4", _parse_bs4),
+}
+
+_default_backend = "auto"
+
+def resolve_backend(name: Optional[str] = None) -> str:
+    """Maps 'auto' (or None) to the fastest installed backend; falls back to bs4 with
+    a warning if the requested backend is not installed."""
+    return _resolve((name or _default_backend or "auto").lower())
+
+@lru_cache(maxsize=None)
+def _resolve(name: str) -> str:
+    if name != "auto":
+        if name not in BACKENDS:
+            raise ValueError(f"Unknown html_parser: {name} (expected auto|{'|'.join(BACKENDS)})")
+        if importlib.util.find_spec(BACKENDS[name][0]) is not None:
+            return name
+        print(f"[WARN] html_parser '{name}' is not installed; falling back to bs4")
+        return "bs4"
+    for key, (module, _) in BACKENDS.items():
+        if importlib.util.find_spec(module) is not None:
+            return key
+    return "bs4"
+
+def set_default_backend(name: Optional[str]) -> str:
+    """Sets the backend used when a source does not choose one (called by run_pipeline)."""
+    global _default_backend
+    _default_backend = name or "auto"
+    return resolve_backend()
+
+def parse_html(html: str, backend: Optional[str] = None) -> ParsedPage:
+    """Parses a page once and returns its title (<title>, else first <h1>), the visible
+    text with script/style removed and whitespace collapsed, and every (href, text) link."""
+    return BACKENDS[resolve_backend(backend)][1](html or "")
@@ -0,0 +1,263 @@
+
+import os, json, time, threading, contextvars
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+# リクエスト時間のヒストグラム境界（秒）
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# 計測値の帰属先ソース。スレッドプールへ渡すときは bind() で引き継ぐ
+_source: contextvars.ContextVar = contextvars.ContextVar("grants_source", default="(none)")
+_active: Optional["RunMetrics"] = None
+_thread_hook: Optional[Callable[..., Any]] = None
+
+class SourceMetrics:
+    __slots__ = ("counters", "seconds", "buckets", "latency_sum", "latency_max")
+
+    def __init__(self):
+        self.counters: Counter = Counter()
+        self.seconds: Dict[str, float] = defaultdict(float)
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+
+    def observe_latency(self, sec: float):
+        for i, le in enumerate(LATENCY_BUCKETS):
+            if sec <= le:
+                break
+        else:
+            i = len(LATENCY_BUCKETS)
+        self.buckets[i] += 1
+        self.latency_sum += sec
+        self.latency_max = max(self.latency_max, sec)
+
+    def to_dict(self) -> Dict[str, Any]:
+        n = sum(self.buckets)
+        labels = [str(le) for le in LATENCY_BUCKETS] + ["+Inf"]
+        return {
+            "counters": dict(sorted(self.counters.items())),
+            "seconds": {k: round(v, 4) for k, v in sorted(self.seconds.items())},
+            "latency": {"count": n, "sum": round(self.latency_sum, 4),
+                        "mean": round(self.latency_sum / n, 4) if n else None,
+                        "max": round(self.latency_max, 4),
+                        "buckets": dict(zip(labels, self.buckets))},
+        }
+
+class RunMetrics:
+    """Per-source counters, stage timings and request-latency histograms for one run.
+
+    Counters: requests, bytes, status_<code>, errors (exceptions), retries, changed
+    (responses whose body differs from the previous fetch), too_large, records,
+    filtered, failed, failed_urls (URLs a source skipped after an error). Stage
+    timings (`seconds`): wait (politeness/concurrency limits), parse, harvest (wall
+    time of the source). robots.txt fetches count under "(robots)". Written as a
+    JSON summary and optionally as a Prometheus textfile for node_exporter's
+    textfile collector.
+    """
+    def __init__(self):
+        self.started_at = datetime.now(timezone.utc)
+        self._t0 = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.sources: Dict[str, SourceMetrics] = {}
+        self.extra: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, source: str) -> SourceMetrics:
+        m = self.sources.get(source)
+        if m is None:
+            m = self.sources[source] = SourceMetrics()
+        return m
+
+    def record_request(self, source: str, status: Optional[int], nbytes: int, latency_sec: float):
+        with self._lock:
+            m = self._get(source)
+            m.counters["requests"] += 1
+            m.counters["bytes"] += nbytes
+            m.counters["errors" if status is None else f"status_{status}"] += 1
+            m.observe_latency(latency_sec)
+
+    def incr(self, source: str, name: str, n: int = 1):
+        with self._lock:
+            self._get(source).counters[name] += n
+
+    def add_time(self, source: str, stage: str, sec: float):
+        with self._lock:
+            self._get(source).seconds[stage] += sec
+
+    def counters(self, source: str) -> Dict[str, int]:
+        with self._lock:
+            m = self.sources.get(source)
+            return dict(m.counters) if m is not None else {}
+
+    def merge(self, sources: Dict[str, SourceMetrics]):
+        """Adds per-source metrics measured elsewhere (e.g. in a worker process)."""
+        with self._lock:
+            for name, other in sources.items():
+                m = self._get(name)
+                m.counters.update(other.counters)
+                for stage, sec in other.seconds.items():
+                    m.seconds[stage] += sec
+                m.buckets = [a + b for a, b in zip(m.buckets, other.buckets)]
+                m.latency_sum += other.latency_sum
+                m.latency_max = max(m.latency_max, other.latency_max)
+
+    def finish(self):
+        self.duration = time.perf_counter() - self._t0
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            sources = {name: m.to_dict() for name, m in sorted(self.sources.items())}
+        totals: Counter = Counter()
+        for s in sources.values():
+            totals.update(s["counters"])
+        duration = self.duration if self.duration is not None else time.perf_counter() - self._t0
+        return {"started_at": self.started_at.isoformat(), "duration_seconds": round(duration, 3),
+                "totals": dict(sorted(totals.items())), "sources": sources, **self.extra}
+
+    def write_summary(self, path: str) -> str:
+        _atomic_write(path, json.dumps(self.summary(), ensure_ascii=False, indent=2) + "\n")
+        return path
+
+    def write_prometheus(self, path: str) -> str:
+        p = "grants_harvester"
+        lines = []
+
+        def metric(name: str, kind: str, help_: str):
+            lines.append(f"# HELP {p}_{name} {help_}")
+            lines.append(f"# TYPE {p}_{name} {kind}")
+
+        with self._lock:
+            items = sorted(self.sources.items())
+            metric("requests_total", "counter", "HTTP requests by source and status (status=\"error\" for exceptions).")
+            for src, m in items:
+                for k, v in sorted(m.counters.items()):
+                    if k.startswith("status_") or k == "errors":
+                        status = k[len("status_"):] if k.startswith("status_") else "error"
+                        lines.append(f'{p}_requests_total{{source="{_esc(src)}",status="{status}"}} {v}')
+            metric("bytes_total", "counter", "Response body bytes received.")
+            for src, m in items:
+                lines.append(f'{p}_bytes_total{{source="{_esc(src)}"}} {m.counters["bytes"]}')
+            metric("records_total", "counter", "Records emitted, filtered out by patterns, or sources failed.")
+            for src, m in items:
+                for outcome in ("records", "filtered", "failed"):
+                    if m.counters[outcome]:
+                        lines.append(f'{p}_records_total{{source="{_esc(src)}",outcome="{outcome}"}} '
+                                     f'{m.counters[outcome]}')
+            metric("stage_seconds_total", "counter", "Time spent per stage (wait, parse, harvest).")
+            for src, m in items:
+                for stage, sec in sorted(m.seconds.items()):
+                    lines.append(f'{p}_stage_seconds_total{{source="{_esc(src)}",stage="{stage}"}} {sec:.6f}')
+            metric("request_duration_seconds", "histogram", "HTTP request latency.")
+            for src, m in items:
+                cum = 0
+                for le, n in zip([str(b) for b in LATENCY_BUCKETS] + ["+Inf"], m.buckets):
+                    cum += n
+                    lines.append(f'{p}_request_duration_seconds_bucket{{source="{_esc(src)}",le="{le}"}} {cum}')
+                lines.append(f'{p}_request_duration_seconds_sum{{source="{_esc(src)}"}} {m.latency_sum:.6f}')
+                lines.append(f'{p}_request_duration_seconds_count{{source="{_esc(src)}"}} {cum}')
+        duration = self.duration if self.duration is not None else time.perf_counter() - self._t0
+        metric("run_duration_seconds", "gauge", "Wall time of the last run.")
+        lines.append(f"{p}_run_duration_seconds {duration:.3f}")
+        metric("last_run_timestamp_seconds", "gauge", "Unix time the last run started.")
+        lines.append(f"{p}_last_run_timestamp_seconds {self.started_at.timestamp():.0f}")
+        _atomic_write(path, "\n".join(lines) + "\n")
+        return path
+
+def _esc(v: str) -> str:
+    return v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _atomic_write(path: str, text: str):
+    # textfile collector が書きかけのファイルを読まないよう、一時ファイルから差し替える
+    d = os.path.dirname(path)
+    if d:
+        os.makedirs(d, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+# --- module-level API（計測が無効なときは何もしない） ---
+
+def start_run() -> RunMetrics:
+    global _active
+    _active = RunMetrics()
+    return _active
+
+def stop_run() -> Optional[RunMetrics]:
+    global _active
+    m, _active = _active, None
+    if m is not None:
+        m.finish()
+    return m
+
+def set_source(name: str):
+    """Attributes everything measured from here on in this context to `name`."""
+    _source.set(name)
+
+def current_source() -> str:
+    return _source.get()
+
+@contextmanager
+def source_scope(name: str):
+    token = _source.set(name)
+    try:
+        yield
+    finally:
+        _source.reset(token)
+
+def set_thread_hook(hook: Optional[Callable[..., Any]]):
+    """Runs pool work started through `bind` as `hook(fn, *args, **kwargs)` (the profiler)."""
+    global _thread_hook
+    _thread_hook = hook
+
+def bind(fn):
+    """Wraps `fn` to run in a copy of the caller's context (for thread/process pools)."""
+    ctx = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        if _thread_hook is not None:
+            return ctx.run(_thread_hook, fn, *args, **kwargs)
+        return ctx.run(fn, *args, **kwargs)
+    return run
+
+def record_request(status: Optional[int], nbytes: int, latency_sec: float):
+    if _active is not None:
+        _active.record_request(_source.get(), status, nbytes, latency_sec)
+
+def incr(name: str, n: int = 1):
+    if _active is not None and n:
+        _active.incr(_source.get(), name, n)
+
+def add_time(stage: str, sec: float):
+    if _active is not None:
+        _active.add_time(_source.get(), stage, sec)
+
+@contextmanager
+def timer(stage: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_time(stage, time.perf_counter() - t0)
+
+def timed_iter(items: Iterable[T], stage: str) -> Iterator[T]:
+    """Yields from `items`, charging only the time spent producing each item to `stage`
+    (time the consumer spends between items is not counted)."""
+    it = iter(items)
+    spent = 0.0
+    try:
+        while True:
+            t0 = time.perf_counter()
+            try:
+                item = next(it)
+            except StopIteration:
+                spent += time.perf_counter() - t0
+                return
+            spent += time.perf_counter() - t0
+            yield item
+    finally:
+        add_time(stage, spent)
@@ -0,0 +1,166 @@
+
+import os, io, gzip, hashlib, threading, time, importlib.util
+import multiprocessing as mp
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional, Union
+
+from .fetch import CACHE_DIR
+from . import metrics
+
+PDF_TEXT_CACHE_DIR = os.path.join(CACHE_DIR, "pdftext")
+
+def _extract_worker(conn, data: Union[bytes, str], max_pages: int):
+    # 子プロセス側: pdfminer で抽出して結果をパイプで返す（パスなら子プロセスがファイルから読む）
+    try:
+        from pdfminer.high_level import extract_text
+        if isinstance(data, str):
+            with open(data, "rb") as f:
+                text = extract_text(f, maxpages=max_pages or 0)
+        else:
+            text = extract_text(io.BytesIO(data), maxpages=max_pages or 0)
+        conn.send(("ok", text))
+    except Exception as e:
+        conn.send(("error", repr(e)))
+    finally:
+        conn.close()
+
+def _mp_context():
+    # スレッドを持つ親プロセスからの fork は子がロックを抱えたまま固まることがあるため避ける
+    methods = mp.get_all_start_methods()
+    ctx = mp.get_context("forkserver" if "forkserver" in methods else "spawn")
+    if ctx.get_start_method() == "forkserver":
+        ctx.set_forkserver_preload(["pdfminer.high_level"])
+    return ctx
+
+class PdfTextExtractor:
+    """Extracts PDF text in separate processes, several documents at once.
+
+    Each document gets its own worker process, so a document that exceeds
+    `timeout_sec` can be killed without affecting the others; at most `workers`
+    run at the same time. Only the first `max_pages` pages are read, documents
+    larger than `max_bytes` are skipped, and results are cached on disk by content
+    hash so an unchanged PDF is never parsed twice. A document can be given as bytes
+    or as a file path (e.g. from `HttpFetcher.download`); a path is read by the
+    worker process itself, so the document is never held in this process's memory.
+    """
+    def __init__(self, workers: Optional[int] = None, timeout_sec: float = 60.0, max_pages: int = 50,
+                 max_bytes: int = 30 * 1024 * 1024, cache_dir: Optional[str] = PDF_TEXT_CACHE_DIR):
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.timeout_sec = timeout_sec
+        self.max_pages = max_pages
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.available = importlib.util.find_spec("pdfminer") is not None
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._ctx = None
+
+    def _cache_path(self, key: str) -> Optional[str]:
+        if not self.cache_dir:
+            return None
+        return os.path.join(self.cache_dir, key[:2], key + ".txt.gz")
+
+    def _cache_get(self, key: str) -> Optional[str]:
+        path = self._cache_path(key)
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _cache_put(self, key: str, text: str):
+        path = self._cache_path(key)
+        if not path:
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp, "wt", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, path)
+
+    def extract(self, data: Union[bytes, str], max_pages: Optional[int] = None, timeout_sec: Optional[float] = None,
+                label: str = "", content_hash: Optional[str] = None) -> Optional[str]:
+        """Returns the document text, "" if it could not be parsed, or None if it was skipped.
+        `data` is the document or its path; `content_hash` (its SHA-256) saves hashing it again."""
+        max_pages = self.max_pages if max_pages is None else max_pages
+        timeout_sec = self.timeout_sec if timeout_sec is None else timeout_sec
+        key = f"{content_hash or _sha256(data)}-p{max_pages}"
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
+        if not self.available:
+            return None
+        size = os.path.getsize(data) if isinstance(data, str) else len(data)
+        if self.max_bytes and size > self.max_bytes:
+            print(f"[WARN] PDF too large ({size} bytes), skipped: {label}")
+            return None
+
+        with self._lock:
+            if self._ctx is None:
+                self._ctx = _mp_context()
+        t0 = time.perf_counter()
+        parent, child = self._ctx.Pipe(duplex=False)
+        proc = self._ctx.Process(target=_extract_worker, args=(child, data, max_pages), daemon=True)
+        proc.start()
+        child.close()
+        try:
+            if not parent.poll(timeout_sec):
+                print(f"[WARN] PDF extraction timed out after {timeout_sec}s: {label}")
+                return None  # タイムアウトはキャッシュしない（次回再試行）
+            status, payload = parent.recv()
+        except EOFError:
+            status, payload = "error", "worker exited"
+        finally:
+            if proc.is_alive():
+                proc.kill()
+            proc.join()
+            parent.close()
+            metrics.add_time("parse", time.perf_counter() - t0)
+        text = payload if status == "ok" else ""
+        if status != "ok":
+            print(f"[WARN] PDF extraction failed: {label}: {payload}")
+        # 解析できなかった文書も空文字としてキャッシュし、毎回の再解析を避ける
+        self._cache_put(key, text or "")
+        return text
+
+    def submit(self, data: Union[bytes, str], **kwargs) -> Future:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="pdf")
+        return self._pool.submit(metrics.bind(self.extract), data, **kwargs)
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True)
+                self._pool = None
+
+def _sha256(data: Union[bytes, str]) -> str:
+    if not isinstance(data, str):
+        return hashlib.sha256(data).hexdigest()
+    h = hashlib.sha256()
+    with open(data, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+_default: Optional[PdfTextExtractor] = None
+_default_lock = threading.Lock()
+
+def configure(**opts) -> PdfTextExtractor:
+    """Sets up the shared extractor used by PdfHarvester (called by run_pipeline)."""
+    global _default
+    with _default_lock:
+        if _default is not None:
+            _default.close()
+        _default = PdfTextExtractor(**opts)
+        return _default
+
+def default_extractor() -> PdfTextExtractor:
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = PdfTextExtractor()
+        return _default
@@ -0,0 +1,269 @@
+import os, re, sys, json, time, hashlib, threading, cProfile, pstats
+from collections import Counter, defaultdict
+from contextlib import contextmanager, nullcontext
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from . import metrics
+
+# 無効なときの scope() はこれを返すだけ（呼び出し側のコストはグローバル変数の参照1回）
+_NULL = nullcontext()
+_active: Optional["Profiler"] = None
+
+def _thread_clock() -> Optional[int]:
+    # 他スレッドの CPU 時間をサンプラから読むためのクロック（Linux 等のみ）
+    try:
+        return time.pthread_getcpuclockid(threading.get_ident())
+    except (AttributeError, OSError):
+        return None
+
+def _label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ",")
+
+def _slug(name: str) -> str:
+    # ソース名は日本語・記号を含むのでファイル名に使える形にし、衝突しないようハッシュを付ける
+    safe = re.sub(r"[^\w.-]+", "_", name).strip("_")[:60]
+    return f"{safe}-{hashlib.blake2b(name.encode('utf-8'), digest_size=3).hexdigest()}"
+
+class _Source:
+    __slots__ = ("profiles", "wall", "cpu", "pool_cpu", "samples")
+
+    def __init__(self):
+        self.profiles: List[cProfile.Profile] = []
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.pool_cpu = 0.0
+        self.samples: Dict[str, Counter] = {"cpu": Counter(), "wait": Counter()}
+
+class Profiler:
+    """Profiles a run per source: deterministic and sampled, wall and CPU time.
+
+    `scope(name)` (each source's harvest, "(enrich)", "(output)") runs cProfile in
+    the calling thread and measures the scope's wall and thread CPU time, so the
+    difference is time spent waiting (network, host intervals, queues, PDF worker
+    processes). Work a scope hands to the fetch/PDF thread pools via `metrics.bind`
+    is charged to the same source. A sampling thread takes the stacks of all those
+    threads every `interval_sec` and files each sample as "cpu" or "wait" by whether
+    the thread's CPU clock advanced since the previous sample; the stacks are written
+    in the folded format of flamegraph.pl / speedscope. `write` produces, under
+    `out_dir`: report.txt (per-source times and the top-N functions), profile.json,
+    <source>.pstats, <source>.{cpu,wait}.folded and all.{cpu,wait}.folded (with the
+    source as the root frame).
+    """
+    def __init__(self, out_dir: str, interval_sec: float = 0.005, top: int = 25):
+        self.out_dir = out_dir
+        self.interval_sec = interval_sec
+        self.top = top
+        self._sources: Dict[str, _Source] = defaultdict(_Source)
+        self._threads: Dict[int, Tuple[str, Optional[int]]] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        self._cprofile = True
+        self._local = threading.local()
+        self.started = time.perf_counter()
+
+    def start(self):
+        self._sampler = threading.Thread(target=self._sample_loop, name="profiler", daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+
+    # --- 計測 ---
+
+    def _enter_thread(self, name: str) -> Tuple[int, Any]:
+        tid = threading.get_ident()
+        with self._lock:
+            prev = self._threads.get(tid)
+            self._threads[tid] = (name, _thread_clock())
+        return tid, prev
+
+    def _leave_thread(self, tid: int, prev):
+        with self._lock:
+            if prev is None:
+                self._threads.pop(tid, None)
+            else:
+                self._threads[tid] = prev
+
+    @contextmanager
+    def scope(self, name: str):
+        tid, prev = self._enter_thread(name)
+        prof = None
+        # 入れ子の scope では外側の cProfile をそのまま使う（同じスレッドで2つは有効にできない）
+        if self._cprofile and not getattr(self._local, "profiling", False):
+            prof = cProfile.Profile()
+            try:
+                prof.enable()
+                self._local.profiling = True
+            except ValueError:
+                # 3.12 以降は同時に1つしか有効にできない。以降はサンプリングだけで続ける
+                self._cprofile, prof = False, None
+        t0, c0 = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - t0, time.thread_time() - c0
+            if prof is not None:
+                prof.disable()
+                self._local.profiling = False
+            self._leave_thread(tid, prev)
+            with self._lock:
+                s = self._sources[name]
+                s.wall += wall
+                s.cpu += cpu
+                if prof is not None:
+                    s.profiles.append(prof)
+
+    def run_bound(self, fn: Callable, *args, **kwargs):
+        """Runs pool work (`metrics.bind`) charged to the caller's source."""
+        name = metrics.current_source()
+        if name == "(none)":
+            # ソースの外から投入された仕事（ソースごとのスレッド自体など）。中の scope が計測する
+            return fn(*args, **kwargs)
+        tid, prev = self._enter_thread(name)
+        c0 = time.thread_time()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            cpu = time.thread_time() - c0
+            self._leave_thread(tid, prev)
+            with self._lock:
+                self._sources[name].pool_cpu += cpu
+
+    def _sample_loop(self):
+        me = threading.get_ident()
+        last: Dict[int, Tuple[float, float]] = {}
+        while not self._stop.wait(self.interval_sec):
+            frames = sys._current_frames()
+            now = time.perf_counter()
+            with self._lock:
+                threads = list(self._threads.items())
+            for tid, (name, clock) in threads:
+                frame = frames.get(tid)
+                if frame is None or tid == me:
+                    continue
+                try:
+                    cpu = time.clock_gettime(clock) if clock is not None else None
+                except OSError:
+                    cpu = None  # スレッドが終了した
+                prev = last.get(tid)
+                if cpu is not None:
+                    last[tid] = (now, cpu)
+                if prev is None and cpu is not None:
+                    continue  # 比較の基準になる最初の1回
+                # 前回のサンプルからの CPU 時間が経過時間の半分以上なら CPU、そうでなければ待ち
+                on_cpu = cpu is not None and cpu - prev[1] >= 0.5 * (now - prev[0])
+                stack = []
+                while frame is not None:
+                    stack.append(_label(frame.f_code))
+                    frame = frame.f_back
+                with self._lock:
+                    self._sources[name].samples["cpu" if on_cpu else "wait"][";".join(reversed(stack))] += 1
+            del frames
+
+    # --- 出力 ---
+
+    def _stats(self, profiles: List[cProfile.Profile]) -> Optional[pstats.Stats]:
+        stats = None
+        for p in profiles:
+            if stats is None:
+                stats = pstats.Stats(p)
+            else:
+                stats.add(p)
+        return stats
+
+    def _top(self, stats: Optional[pstats.Stats]) -> List[Dict[str, Any]]:
+        if stats is None:
+            return []
+        rows = sorted(stats.stats.items(), key=lambda kv: kv[1][2], reverse=True)[:self.top]
+        return [{"function": f"{func} ({os.path.basename(file)}:{line})", "calls": nc,
+                 "tottime": round(tt, 4), "cumtime": round(ct, 4)}
+                for (file, line, func), (cc, nc, tt, ct, _) in rows]
+
+    def write(self) -> str:
+        os.makedirs(self.out_dir, exist_ok=True)
+        total_wall = time.perf_counter() - self.started
+        summary, combined = [], {"cpu": Counter(), "wait": Counter()}
+        everything = []
+        with self._lock:
+            sources = dict(self._sources)
+        for name, s in sorted(sources.items(), key=lambda kv: kv[1].wall, reverse=True):
+            slug = _slug(name)
+            stats = self._stats(s.profiles)
+            if stats is not None:
+                stats.dump_stats(os.path.join(self.out_dir, slug + ".pstats"))
+                everything.extend(s.profiles)
+            for kind, counter in s.samples.items():
+                with open(os.path.join(self.out_dir, f"{slug}.{kind}.folded"), "w", encoding="utf-8") as f:
+                    for stack, n in counter.most_common():
+                        f.write(f"{stack} {n}\n")
+                        combined[kind][f"{name.replace(';', ',')};{stack}"] += n
+            summary.append({"source": name, "files": slug, "wall_sec": round(s.wall, 3),
+                            "cpu_sec": round(s.cpu, 3), "wait_sec": round(max(0.0, s.wall - s.cpu), 3),
+                            "pool_cpu_sec": round(s.pool_cpu, 3),
+                            "samples_cpu": sum(s.samples["cpu"].values()),
+                            "samples_wait": sum(s.samples["wait"].values()),
+                            "top": self._top(stats)})
+        for kind, counter in combined.items():
+            with open(os.path.join(self.out_dir, f"all.{kind}.folded"), "w", encoding="utf-8") as f:
+                for stack, n in counter.most_common():
+                    f.write(f"{stack} {n}\n")
+        overall = self._top(self._stats(everything))
+        with open(os.path.join(self.out_dir, "profile.json"), "w", encoding="utf-8") as f:
+            json.dump({"wall_sec": round(total_wall, 3), "interval_sec": self.interval_sec,
+                       "cprofile": self._cprofile, "sources": summary, "top": overall},
+                      f, ensure_ascii=False, indent=2)
+        report = os.path.join(self.out_dir, "report.txt")
+        with open(report, "w", encoding="utf-8") as f:
+            f.write(_format_report(total_wall, summary, overall, self._cprofile))
+        return report
+
+def _format_report(total_wall: float, summary: List[Dict[str, Any]], overall: List[Dict[str, Any]],
+                   cprofile_on: bool) -> str:
+    out = [f"run wall time {total_wall:.2f}s. wall/cpu/wait: the scope's own thread; pool cpu: fetch/PDF "
+           "threads working for it (PDF text extraction itself runs in child processes and is not included).",
+           "", f"{'wall':>8} {'cpu':>8} {'wait':>8} {'pool cpu':>8}  source"]
+    for s in summary:
+        out.append(f"{s['wall_sec']:8.2f} {s['cpu_sec']:8.2f} {s['wait_sec']:8.2f} {s['pool_cpu_sec']:8.2f}  "
+                   f"{s['source']}  [{s['files']}]")
+
+    def table(rows):
+        out.append(f"{'tottime':>9} {'cumtime':>9} {'calls':>9}  function")
+        out.extend(f"{r['tottime']:9.3f} {r['cumtime']:9.3f} {r['calls']:9d}  {r['function']}" for r in rows)
+
+    if not cprofile_on:
+        out += ["", "(this interpreter runs one cProfile at a time, so the tables below cover only some "
+                    "scopes; the .folded samples cover all of them)"]
+    if overall:
+        out += ["", "== hot functions, all scopes (wall time, own thread) =="]
+        table(overall)
+        for s in summary:
+            if s["top"]:
+                out += ["", f"== {s['source']} =="]
+                table(s["top"][:10])
+    return "\n".join(out) + "\n"
+
+# --- module-level API ---
+
+def start(out_dir: str, interval_sec: float = 0.005, top: int = 25) -> Profiler:
+    global _active
+    _active = Profiler(out_dir, interval_sec=interval_sec, top=top)
+    _active.start()
+    metrics.set_thread_hook(_active.run_bound)
+    return _active
+
+def stop() -> Optional[str]:
+    """Stops profiling and writes the report; returns its path (None if not profiling)."""
+    global _active
+    p, _active = _active, None
+    if p is None:
+        return None
+    metrics.set_thread_hook(None)
+    p.stop()
+    return p.write()
+
+def scope(name: str):
+    """Profiles the enclosed code as `name` when profiling is on; otherwise a no-op."""
+    return _NULL if _active is None else _active.scope(name)
@@ -0,0 +1,252 @@
+
+import os, json, sqlite3, threading, time
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any
+
+_COLUMNS = ("etag", "last_modified", "content_type", "status", "content_hash",
+            "changed_at", "fetched_at", "latency_ms")
+_SCHEDULE_COLUMNS = ("checks", "changes", "observed_sec", "cost", "last_checked", "last_changed")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fetch_state (
+    url           TEXT PRIMARY KEY,
+    etag          TEXT,
+    last_modified TEXT,
+    content_type  TEXT,
+    status        INTEGER,
+    content_hash  TEXT,
+    changed_at    TEXT,
+    fetched_at    TEXT,
+    latency_ms    REAL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS watermarks (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS source_schedule (
+    source       TEXT PRIMARY KEY,
+    checks       REAL,
+    changes      REAL,
+    observed_sec REAL,
+    cost         INTEGER,
+    last_checked TEXT,
+    last_changed TEXT
+) WITHOUT ROWID
+"""
+
+class FetchStateStore:
+    """Per-URL fetch state (validators, last status, content hash, timings) in SQLite.
+
+    Updates are buffered in memory and written in batches with a single UPSERT
+    per URL, so a run costs O(changed URLs) instead of rewriting the whole index.
+    The database runs in WAL mode so several processes can share it.
+    """
+    def __init__(self, path: str, batch_size: int = 500, flush_interval_sec: float = 5.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval_sec = flush_interval_sec
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._last_flush = time.monotonic()
+        self._staged_watermarks: Dict[str, str] = {}
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def get(self, url: str) -> Dict[str, Any]:
+        with self._lock:
+            if url in self._pending:
+                return dict(self._pending[url])
+            row = self._conn.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM fetch_state WHERE url = ?", (url,)).fetchone()
+        if not row:
+            return {}
+        return {k: v for k, v in zip(_COLUMNS, row) if v is not None}
+
+    def record(self, url: str, status: int, etag: Optional[str] = None, last_modified: Optional[str] = None,
+               content_type: Optional[str] = None, content_hash: Optional[str] = None,
+               latency_ms: Optional[float] = None) -> bool:
+        """Records the outcome of one fetch. Returns True if the content changed."""
+        now = datetime.now(timezone.utc).isoformat()
+        prev = self.get(url)
+        if status == 304:
+            # 変化なし: 検証子と本文ハッシュは前回のものを引き継ぐ
+            etag = etag or prev.get("etag")
+            last_modified = last_modified or prev.get("last_modified")
+            content_type = content_type or prev.get("content_type")
+            content_hash = prev.get("content_hash")
+        elif status >= 400:
+            # 一時的なエラー（5xx・429 など）で検証子と本文ハッシュを消すと、次回が無条件の取得になり
+            # 変化なしでも changed と判定されるため、前回のものを残して状態と日時だけ更新する
+            etag, last_modified = prev.get("etag"), prev.get("last_modified")
+            content_type, content_hash = prev.get("content_type"), prev.get("content_hash")
+        changed = content_hash is not None and content_hash != prev.get("content_hash")
+        row = {
+            "etag": etag,
+            "last_modified": last_modified,
+            "content_type": content_type,
+            "status": status,
+            "content_hash": content_hash,
+            "changed_at": now if changed else prev.get("changed_at"),
+            "fetched_at": now,
+            "latency_ms": round(latency_ms, 1) if latency_ms is not None else None,
+        }
+        with self._lock:
+            self._pending[url] = row
+            due = (len(self._pending) >= self.batch_size
+                   or time.monotonic() - self._last_flush >= self.flush_interval_sec)
+        if due:
+            self.flush()
+        return changed
+
+    def flush(self):
+        with self._lock:
+            if not self._pending:
+                self._last_flush = time.monotonic()
+                return
+            rows = [(url,) + tuple(r.get(c) for c in _COLUMNS) for url, r in self._pending.items()]
+            cols = ", ".join(("url",) + _COLUMNS)
+            updates = ", ".join(f"{c} = excluded.{c}" for c in _COLUMNS)
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    f"INSERT INTO fetch_state ({cols}) VALUES ({', '.join('?' * (len(_COLUMNS) + 1))}) "
+                    f"ON CONFLICT(url) DO UPDATE SET {updates}", rows)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._pending.clear()
+            self._last_flush = time.monotonic()
+
+    def get_watermark(self, key: str) -> Optional[str]:
+        """Per-source progress marker (e.g. the newest sitemap <lastmod> seen)."""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM watermarks WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_watermark(self, key: str, value: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO watermarks (key, value) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value", (key, value))
+
+    def stage_watermark(self, key: str, value: str):
+        """Holds a watermark until `save_watermarks` (called once the records the
+        source produced are committed, so a failed run does not skip them next time)."""
+        with self._lock:
+            self._staged_watermarks[key] = value
+
+    def save_watermarks(self):
+        with self._lock:
+            staged, self._staged_watermarks = self._staged_watermarks, {}
+        for key, value in staged.items():
+            self.set_watermark(key, value)
+
+    def discard_watermarks(self):
+        with self._lock:
+            self._staged_watermarks.clear()
+
+    def get_schedules(self) -> Dict[str, Dict[str, Any]]:
+        """Change history per source (see `schedule.RefreshScheduler`)."""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT source, {', '.join(_SCHEDULE_COLUMNS)} FROM source_schedule").fetchall()
+        return {r[0]: dict(zip(_SCHEDULE_COLUMNS, r[1:])) for r in rows}
+
+    def set_schedules(self, rows: Dict[str, Dict[str, Any]]):
+        cols = ", ".join(("source",) + _SCHEDULE_COLUMNS)
+        updates = ", ".join(f"{c} = excluded.{c}" for c in _SCHEDULE_COLUMNS)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    f"INSERT INTO source_schedule ({cols}) VALUES ({', '.join('?' * (len(_SCHEDULE_COLUMNS) + 1))}) "
+                    f"ON CONFLICT(source) DO UPDATE SET {updates}",
+                    [(source,) + tuple(r.get(c) for c in _SCHEDULE_COLUMNS) for source, r in rows.items()])
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def import_etag_json(self, path: str) -> int:
+        """One-time migration from the old etag_index.json format."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                db = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return 0
+        rows = [(url, meta.get("etag"), meta.get("last_modified"), meta.get("content_type"), meta.get("body"))
+                for url, meta in db.items() if isinstance(meta, dict)]
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO fetch_state (url, etag, last_modified, content_type, content_hash) "
+                "VALUES (?, ?, ?, ?, ?)", rows)
+            self._conn.execute("COMMIT")
+        return len(rows)
+
+    def merge(self, path: str) -> int:
+        """Takes the URLs another store (a shard's) fetched more recently than this one,
+        its watermarks where they are further along and the change history of the
+        sources it checked more recently. Returns the URL rows taken."""
+        self.flush()
+        cols = ", ".join(("url",) + _COLUMNS)
+        updates = ", ".join(f"{c} = excluded.{c}" for c in _COLUMNS)
+        with self._lock:
+            self._conn.execute("ATTACH DATABASE ? AS other", (path,))
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    before = self._conn.total_changes
+                    self._conn.execute(
+                        f"INSERT INTO fetch_state ({cols}) SELECT {cols} FROM other.fetch_state WHERE true "
+                        f"ON CONFLICT(url) DO UPDATE SET {updates} "
+                        "WHERE COALESCE(excluded.fetched_at, '') > COALESCE(fetch_state.fetched_at, '')")
+                    taken = self._conn.total_changes - before
+                    # ソースの変化履歴は後から確認した方を採る（同じソースは1つのシャードにしか入らない）
+                    if self._conn.execute("SELECT 1 FROM other.sqlite_master "
+                                          "WHERE name = 'source_schedule'").fetchone():
+                        scols = ", ".join(("source",) + _SCHEDULE_COLUMNS)
+                        self._conn.execute(
+                            f"INSERT INTO source_schedule ({scols}) SELECT {scols} FROM other.source_schedule "
+                            "WHERE true ON CONFLICT(source) DO UPDATE SET "
+                            + ", ".join(f"{c} = excluded.{c}" for c in _SCHEDULE_COLUMNS)
+                            + " WHERE COALESCE(excluded.last_checked, '') > COALESCE(source_schedule.last_checked, '')")
+                    mine = dict(self._conn.execute("SELECT key, value FROM main.watermarks"))
+                    for key, value in self._conn.execute("SELECT key, value FROM other.watermarks").fetchall():
+                        if _later(value, mine.get(key)):
+                            self._conn.execute(
+                                "INSERT INTO watermarks (key, value) VALUES (?, ?) "
+                                "ON CONFLICT(key) DO UPDATE SET value = excluded.value", (key, value))
+                    self._conn.execute("COMMIT")
+                except BaseException:
+                    self._conn.execute("ROLLBACK")
+                    raise
+            finally:
+                self._conn.execute("DETACH DATABASE other")
+        return taken
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM fetch_state LIMIT 1").fetchone() is None
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            # WAL を本体に書き戻し、コミット対象を単一ファイルにする
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._conn.close()
+
+def _later(value: Optional[str], other: Optional[str]) -> bool:
+    # ウォーターマークは ISO 日時。タイムゾーン表記が違っても正しく比べる
+    if value is None or other is None:
+        return other is None and value is not None
+    try:
+        return datetime.fromisoformat(value) > datetime.fromisoformat(other)
+    except (TypeError, ValueError):
+        return value > other
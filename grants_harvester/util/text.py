@@ -1,7 +1,7 @@
 
-import re
+import re, unicodedata
 from datetime import datetime, date
-from typing import Optional
+from typing import Any, List, NamedTuple, Optional, Tuple
 
 ERA = {
     '令和': 2018,  # year offset: Gregorian = base + n (R1=2019 -> base 2018)
@@ -9,8 +9,10 @@ ERA = {
     '昭和': 1925,
 }
 
+_WS = re.compile(r"\s+")
+
 def normalize_whitespace(s: str) -> str:
-    return re.sub(r"\s+", " ", s or "").strip()
+    return _WS.sub(" ", s or "").strip()
 
 def _jp_era_to_year(era: str, y: int) -> int:
     base = ERA.get(era)
@@ -18,6 +20,10 @@ def _jp_era_to_year(era: str, y: int) -> int:
         return y
     return base + y
 
+# parse_jp_date 用（呼び出しごとのコンパイルを避けるため事前にコンパイル）
+_ISO_DATE = re.compile(r"(\d{4})[-/年.](\d{1,2})[-/月.](\d{1,2})日?")
+_ERA_DATE = re.compile(r"(令和|平成|昭和)\s*(\d{1,2}|元)年\s*(\d{1,2})月\s*(\d{1,2})日?")
+
 def parse_jp_date(text: str) -> Optional[date]:
     """
     Accepts: '令和6年4月1日', '令和6年04月01日', '2025年4月1日', '2025/4/1', '2025-04-01'
@@ -28,7 +34,7 @@ def parse_jp_date(text: str) -> Optional[date]:
     text = text.strip()
 
     # ISO-like
-    m = re.search(r"(\d{4})[-/年.](\d{1,2})[-/月.](\d{1,2})日?", text)
+    m = _ISO_DATE.search(text)
     if m:
         y, mo, d = map(int, m.groups())
         try:
@@ -37,7 +43,7 @@ def parse_jp_date(text: str) -> Optional[date]:
             return None
 
     # Japanese era
-    m = re.search(r"(令和|平成|昭和)\s*(\d{1,2}|元)年\s*(\d{1,2})月\s*(\d{1,2})日?", text)
+    m = _ERA_DATE.search(text)
     if m:
         era, yy_str, mo, dd = m.groups()
         yy = 1 if yy_str == '元' else int(yy_str)
@@ -53,57 +59,163 @@ DATE_RANGE_KEYWORDS = [
     "公募期間", "実施期間", "申請受付", "受付開始", "申請開始"
 ]
 
+# かな・漢字・句読点の連続は NFKC で変化しないので、それ以外の部分だけを正規化する
+# （日本語の本文全体を NFKC にかけるより数倍速い）
+_NFKC_VARIANT = re.compile(r"[^\u3041-\u3096\u30a1-\u30fa\u30fc\u4e00-\u9fff\u3001\u3002]+")
+
+def _nfkc(m: "re.Match") -> str:
+    return unicodedata.normalize("NFKC", m.group())
+
+def normalize_text(s: str) -> str:
+    """NFKC: full-width digits/symbols to ASCII ('１，０００万円' -> '1,000万円', '～' -> '~')."""
+    if not s or unicodedata.is_normalized("NFKC", s):
+        return s or ""
+    out = _NFKC_VARIANT.sub(_nfkc, s)
+    # 結合文字の濁点・半濁点（半角の ﾞ ﾟ を含む）は直前のかなと合成されるため、
+    # 部分ごとの正規化では残る。そのときだけ全体をもう一度正規化する（全体の NFKC と同じ結果）
+    if not unicodedata.is_normalized("NFKC", out):
+        out = unicodedata.normalize("NFKC", out)
+    return out
+
+def _date_re(g: str) -> str:
+    # 年月日を名前付きグループで取り出し、一致後に parse_jp_date を再実行しない
+    return (rf"(?P<{g}>(?P<{g}_era>令和|平成|昭和)?\s*(?P<{g}_y>\d{{1,4}}|元)年"
+            rf"\s*(?P<{g}_m>\d{{1,2}})月\s*(?P<{g}_d>\d{{1,2}})日?)")
+
+_KW = "|".join(DATE_RANGE_KEYWORDS)
+# 募集期間の表記（優先度順）。NFKC 後は全角の「～」が「~」になるため区切りに含める
+_PERIOD_PATTERNS = [
+    # 1: 「キーワード 日付1 から 日付2 まで」
+    rf"(?:{_KW})\s*[:：]?\s*{_date_re('p1s')}\s*[～〜~\-から]\s*{_date_re('p1e')}",
+    # 2: 「キーワード 日付 から」
+    rf"(?:{_KW})\s*[:：]?\s*{_date_re('p2s')}\s*(?:から|より|開始)",
+    # 3: 「キーワード ～ 日付 まで」
+    rf"(?:{_KW})?\s*[:：]?\s*[～〜~]\s*{_date_re('p3e')}\s*(?:まで|締切|必着)",
+    # 4: キーワードなしの「日付1 ～ 日付2」
+    rf"{_date_re('p4s')}\s*[～~\-から〜]\s*{_date_re('p4e')}",
+    # 5: キーワードなしの「日付 まで」
+    rf"{_date_re('p5e')}\s*まで",
+]
+_MONEY_RE = r"(?P<m_max>最大)?\s*(?P<m_num>[0-9,\.]+)\s*(?P<m_unit>円|万円|億円)"
+_RATE_RE = r"(?P<rate>\d+\/\d+|\d{1,3}\s*%|\d+分の\d+)"
+
+# 全パターンを先読みの選択肢として1本にまとめる。各位置で一致した最初の選択肢だけが報告される
+# ため、期間は「最も優先度の高いパターンの最左一致」が1回の走査で求まる（re.search を順に
+# 試していた従来の結果と同じ）。金額・補助率は期間の表記と同じ位置からは始まり得ない。
+# 先頭の文字クラスで大半の位置（地の文）を1命令で読み飛ばす
+_FIRST_CHARS = "[" + "".join(sorted({k[0] for k in DATE_RANGE_KEYWORDS})) + r"令平昭元最0-9,.\s:：～〜~]"
+_FIELDS = re.compile(f"(?={_FIRST_CHARS})(?=" + "|".join(
+    [f"(?P<p{i}>{p})" for i, p in enumerate(_PERIOD_PATTERNS, 1)] + [f"(?P<money>{_MONEY_RE})", _RATE_RE]) + ")")
+_MONEY = re.compile(_MONEY_RE)
+_RATE = re.compile(_RATE_RE)
+_PERIOD_GROUPS = {1: ("p1s", "p1e"), 2: ("p2s", None), 3: (None, "p3e"), 4: ("p4s", "p4e"), 5: (None, "p5e")}
+
+class FieldMatch(NamedTuple):
+    kind: str    # 'period' | 'amount' | 'rate'
+    start: int   # 位置は正規化後のテキスト（ExtractedFields.text）上のもの
+    end: int
+    value: Any   # period: (start_iso, end_iso), amount/rate: str
+    rank: int    # period のパターン優先度（1 が最優先）、それ以外は 0
+
+class ExtractedFields(NamedTuple):
+    text: str
+    periods: List[FieldMatch]
+    amounts: List[FieldMatch]
+    rates: List[FieldMatch]
+    best_period: Optional[FieldMatch]  # 優先度が最も高いパターンの最左一致
+
+    @property
+    def period(self) -> Tuple[Optional[str], Optional[str]]:
+        return self.best_period.value if self.best_period else (None, None)
+
+    @property
+    def amount(self) -> Optional[str]:
+        return self.amounts[0].value if self.amounts else None
+
+    @property
+    def rate(self) -> Optional[str]:
+        return self.rates[0].value if self.rates else None
+
+def _iso(m: "re.Match", g: Optional[str]) -> Optional[str]:
+    if g is None:
+        return None
+    y, mo, d = m.group(g + "_y"), int(m.group(g + "_m")), int(m.group(g + "_d"))
+    era = m.group(g + "_era")
+    if len(y) == 4:
+        year = int(y)
+    elif era:
+        year = _jp_era_to_year(era, 1 if y == "元" else int(y))
+    else:
+        return None  # 元号なしの短い年は解釈できない
+    try:
+        return date(year, mo, d).isoformat()
+    except ValueError:
+        return None
+
+def _money_value(m: "re.Match") -> str:
+    return "".join(x for x in (m.group("m_max"), m.group("m_num"), m.group("m_unit")) if x)
+
+def extract_fields(text: str, first_only: bool = False, normalized: bool = False) -> ExtractedFields:
+    """Finds application periods, amounts and rates in one scan of the (NFKC-normalized) text.
+
+    Returns every candidate with its position; `.period`, `.amount` and `.rate` give the
+    values `parse_date_range`, `extract_money` and `extract_rate` would return. With
+    `first_only`, the scan stops as soon as those three answers are settled.
+    """
+    text = text if normalized else normalize_text(text)
+    periods: List[FieldMatch] = []
+    amounts: List[FieldMatch] = []
+    rates: List[FieldMatch] = []
+    best: Optional[FieldMatch] = None
+    if not text:
+        return ExtractedFields(text, periods, amounts, rates, best)
+    ends = {"period": -1, "amount": -1, "rate": -1}  # 候補が重ならないよう、直前の一致の終端
+    for m in _FIELDS.finditer(text):
+        pos = m.start()
+        kind = m.lastgroup
+        if kind == "money":
+            if first_only and amounts or pos < ends["amount"]:
+                continue
+            amounts.append(FieldMatch("amount", pos, m.end("money"), _money_value(m), 0))
+            ends["amount"] = m.end("money")
+        elif kind == "rate":
+            if first_only and rates or pos < ends["rate"]:
+                continue
+            rates.append(FieldMatch("rate", pos, m.end("rate"), m.group("rate"), 0))
+            ends["rate"] = m.end("rate")
+        else:
+            rank = int(kind[1:])
+            is_best = best is None or rank < best.rank
+            if not is_best and (first_only or pos < ends["period"]):
+                continue
+            s_g, e_g = _PERIOD_GROUPS[rank]
+            fm = FieldMatch("period", pos, m.end(kind), (_iso(m, s_g), _iso(m, e_g)), rank)
+            if is_best:
+                best = fm
+            if first_only:
+                periods[:] = [fm]
+            elif pos >= ends["period"]:
+                periods.append(fm)
+                ends["period"] = fm.end
+        if first_only and amounts and rates and best is not None and best.rank == 1:
+            break  # これ以上走査しても結果は変わらない
+    return ExtractedFields(text, periods, amounts, rates, best)
+
 def parse_date_range(text: str):
     """
     Returns (start_iso, end_iso) if found, else (None, None).
     Handles '2025年4月1日～2025年5月31日', '～2025年5月31日まで'.
     """
     if not text: return (None, None)
-
-    keyword_pattern = "|".join(DATE_RANGE_KEYWORDS)
-    date_pattern_text = r"((?:令和|平成|昭和)?\s*(?:\d{1,4}|元)年\s*\d{1,2}月\s*\d{1,2}日?)"
-
-    # パターン1: 「キーワード 日付1 から 日付2 まで」
-    m = re.search(
-        rf"({keyword_pattern})\s*[:：]?\s*(?P<s>{date_pattern_text})\s*[～〜\-から]\s*(?P<e>{date_pattern_text})", text
-    )
-    if m:
-        s = parse_jp_date(m.group("s"))
-        e = parse_jp_date(m.group("e"))
-        return (s.isoformat() if s else None, e.isoformat() if e else None)
-
-    # パターン2: 「キーワード 日付 から」
-    m = re.search(rf"({keyword_pattern})\s*[:：]?\s*(?P<s>{date_pattern_text})\s*(?:から|より|開始)", text)
-    if m:
-        s = parse_jp_date(m.group("s"))
-        return (s.isoformat() if s else None, None)
-
-    # パターン3: 「キーワード ～ 日付 まで」
-    m = re.search(rf"({keyword_pattern})?\s*[:：]?\s*[～〜]\s*(?P<e>{date_pattern_text})\s*(?:まで|締切|必着)", text)
-    if m:
-        e = parse_jp_date(m.group("e"))
-        return (None, e.isoformat() if e else None)
-
-    # 既存のキーワードなしパターンも残す
-    m = re.search(r"(?P<s>" + date_pattern_text + r")\s*[～~\-から〜]\s*(?P<e>" + date_pattern_text + r")", text)
-    if m:
-        s, e = parse_jp_date(m.group('s')), parse_jp_date(m.group('e'))
-        return (s.isoformat() if s else None, e.isoformat() if e else None)
-    m = re.search(r"(?P<e>" + date_pattern_text + r")\s*まで", text)
-    if m:
-        e = parse_jp_date(m.group('e'))
-        return (None, e.isoformat() if e else None)
-    return (None, None)
+    return extract_fields(text, first_only=True).period
 
 def extract_money(text: str) -> Optional[str]:
     if not text: return None
-    m = re.search(r"(最大)?\s*([0-9,\.]+)\s*(円|万円|億円)", text)
-    if m:
-        return "".join([x for x in m.groups() if x])
-    return None
+    m = _MONEY.search(normalize_text(text))
+    return _money_value(m) if m else None
 
 def extract_rate(text: str) -> Optional[str]:
     if not text: return None
     # 1/2, 2/3, 4分の3, 50%
-    m = re.search(r"(\d+\/\d+|\d{1,3}\s*%|\d+分の\d+)", text)
+    m = _RATE.search(normalize_text(text))
     return m.group(0) if m else None
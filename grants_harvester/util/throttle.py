@@ -0,0 +1,109 @@
+
+import time, random, threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+# 再試行する（一時的な）ステータス。429/503 はホストの速度も落とす
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+OVERLOAD_STATUSES = frozenset({429, 503})
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP-date)."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        dt = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return max(0.0, (dt - datetime.now(timezone.utc)).total_seconds())
+
+def crawl_delay_from_robots(text: str, ua: str) -> Optional[float]:
+    """Crawl-delay (or Request-rate as seconds per request) for `ua` in a robots.txt."""
+    from urllib.robotparser import RobotFileParser  # urllib.request ごと読み込まれるため必要時のみ
+    rp = RobotFileParser()
+    rp.modified()  # crawl_delay() は読み込み時刻が無いと常に None を返す
+    rp.parse(text.splitlines())
+    agent = ua.split("/", 1)[0]
+    delay = rp.crawl_delay(agent)
+    if delay is not None:
+        return float(delay)
+    rate = rp.request_rate(agent)
+    if rate is not None and rate.requests:
+        return rate.seconds / rate.requests
+    return None
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Exponential backoff with jitter: uniform in [0.5, 1.5) x base x 2^attempt, capped."""
+    return min(cap, base * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+class HostThrottle:
+    """Politeness state for one host: at most `concurrency` requests in flight, and
+    request starts spaced by an adaptive interval.
+
+    The interval starts at `interval` and moves between `floor` (raised to the
+    robots.txt Crawl-delay when there is one) and `ceiling`: it doubles on 429/503,
+    grows on other server errors, timeouts and latency well above the host's usual
+    level, and shrinks by `speedup` per healthy response. A Retry-After blocks the
+    host until the given time.
+    """
+    # 直近のレイテンシ（EWMA）がこの倍率を超えて普段より遅ければ混雑とみなす
+    SLOW_FACTOR = 2.0
+    # 1秒未満のレイテンシの揺れでは速度を落とさない
+    SLOW_MIN_SEC = 1.0
+
+    def __init__(self, concurrency: int, interval: float, floor: float, ceiling: float,
+                 speedup: float = 0.8):
+        self.sem = threading.BoundedSemaphore(max(1, concurrency))
+        self.lock = threading.Lock()         # 順番待ち（next_at）
+        self._adjust = threading.Lock()      # 間隔の調整
+        self.robots_lock = threading.RLock()
+        self.robots_checked = False
+        self.next_at = 0.0
+        self.blocked_until = 0.0             # Retry-After
+        self.floor = min(floor, interval)
+        self.ceiling = max(ceiling, interval)
+        self.interval = interval
+        self.speedup = speedup
+        self.crawl_delay: Optional[float] = None
+        self.latency: Optional[float] = None   # EWMA
+        self.baseline: Optional[float] = None  # ゆっくり追従する普段のレイテンシ
+
+    def set_crawl_delay(self, delay: Optional[float]):
+        if delay is None:
+            return
+        with self._adjust:
+            self.crawl_delay = delay
+            self.floor = max(self.floor, delay)
+            self.ceiling = max(self.ceiling, delay)
+            self.interval = max(self.interval, delay)
+
+    def wait_turn(self):
+        with self.lock:
+            wait = max(self.next_at, self.blocked_until) - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            self.next_at = time.monotonic() + self.interval
+
+    def observe(self, status: Optional[int], latency_sec: float, retry_after: Optional[float] = None):
+        """Adjusts the interval after a response (`status` None for an exception)."""
+        with self._adjust:
+            if status in OVERLOAD_STATUSES:
+                self.interval = min(self.ceiling, max(self.interval * 2, self.floor, 1.0))
+            elif status is None or status >= 500:
+                self.interval = min(self.ceiling, max(self.interval * 1.5, self.floor, 0.5))
+            else:
+                self.latency = latency_sec if self.latency is None else 0.7 * self.latency + 0.3 * latency_sec
+                self.baseline = latency_sec if self.baseline is None else \
+                    min(self.latency, 0.95 * self.baseline + 0.05 * self.latency)
+                if self.latency > max(self.SLOW_MIN_SEC, self.SLOW_FACTOR * self.baseline):
+                    self.interval = min(self.ceiling, max(self.interval * 1.25, 0.5))
+                else:
+                    self.interval = max(self.floor, self.interval * self.speedup)
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
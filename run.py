@@ -1,16 +1,78 @@
-
 #!/usr/bin/env python3
-import argparse
-from grants_harvester.pipeline import run_pipeline
+import argparse, os
+from grants_harvester.pipeline import run_pipeline, compact, merge_shards
+from grants_harvester.shard import parse_shard
+
+# 定期実行が公開・コミットする出力先
+DEFAULT_OUT = "out"
+
+def _shard_arg(value: str):
+    try:
+        return parse_shard(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
 
 def main():
     ap = argparse.ArgumentParser(description="Grants Harvester")
     ap.add_argument("--sources", default="config/sources.yaml")
     ap.add_argument("--keywords", default="config/keywords.yaml")
-    ap.add_argument("--out", default="out")
+    ap.add_argument("--out", help=f"output directory (default: {DEFAULT_OUT})")
+    ap.add_argument("--snapshot", action="store_true",
+                    help="also write a full timestamped grants_<ts>.* snapshot")
+    ap.add_argument("--parquet", action="store_true",
+                    help="also write grants_latest.parquet (requires pyarrow)")
+    ap.add_argument("--compact", action="store_true",
+                    help="rebuild grants_latest.* from the record store without crawling")
+    ap.add_argument("--shard", type=_shard_arg, metavar="I/N",
+                    help="harvest only the I-th of N host-partitioned subsets of the sources "
+                         "(own stores; combine with --merge-shards N)")
+    ap.add_argument("--all-sources", action="store_true",
+                    help="fetch every source, ignoring the refresh schedule learned from change history")
+    ap.add_argument("--profile", nargs="?", const="", metavar="DIR",
+                    help="profile each source and the output stage (CPU vs wait, hot functions, "
+                         "flame graph stacks); written to DIR (default: <out>/profile)")
+    ap.add_argument("--record", nargs="?", const="", metavar="DIR",
+                    help="also write every HTTP response to a WARC archive in DIR "
+                         "(default: <out>/archive) for --replay")
+    ap.add_argument("--replay", metavar="DIR",
+                    help="harvest all sources from the archive in DIR instead of the network "
+                         "(fresh stores; requires an --out other than the default)")
+    ap.add_argument("--as-of", metavar="TIME",
+                    help="with --replay, use the latest record at or before TIME (ISO date or time, UTC)")
+    ap.add_argument("--workers", type=int, metavar="N",
+                    help="with --replay, parse sources on N processes (default: CPU count)")
+    ap.add_argument("--merge-shards", type=int, metavar="N",
+                    help="merge the stores of --shard 1/N .. N/N runs and rebuild grants_latest.*")
     args = ap.parse_args()
+    if args.replay and (args.record is not None or args.shard):
+        ap.error("--replay cannot be combined with --record or --shard")
+    if (args.as_of or args.workers) and not args.replay:
+        ap.error("--as-of and --workers require --replay")
+    if args.replay and (args.out is None or os.path.realpath(args.out) == os.path.realpath(DEFAULT_OUT)):
+        # 再処理の結果で公開中の grants_latest.* や差分を上書きしない
+        ap.error(f"--replay requires --out with a directory other than {DEFAULT_OUT}/")
+    args.out = args.out or DEFAULT_OUT
+
+    if args.merge_shards:
+        out = merge_shards(args.sources, args.out, args.merge_shards, parquet=args.parquet)
+        print("Wrote:", out)
+        return
+
+    if args.compact:
+        paths = compact(args.out, vacuum=True, parquet=args.parquet)
+        print("Wrote:", paths["jsonl"])
+        return
 
-    out = run_pipeline(args.sources, args.keywords, args.out)
+    profile_dir = None
+    if args.profile is not None:
+        profile_dir = args.profile or os.path.join(args.out, "profile")
+    record_dir = None
+    if args.record is not None:
+        record_dir = args.record or os.path.join(args.out, "archive")
+    out = run_pipeline(args.sources, args.keywords, args.out, snapshot=args.snapshot,
+                       parquet=args.parquet, shard=args.shard, all_sources=args.all_sources,
+                       profile_dir=profile_dir, record_dir=record_dir, replay_dir=args.replay,
+                       as_of=args.as_of, workers=args.workers)
     print("Wrote:", out)
 
 if __name__ == "__main__":
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Search the harvested grants without scanning the output files.
+
+  python search.py build                      # grants_latest.jsonl と未取り込みの delta_*.jsonl を索引に反映
+  python search.py query 介護 DX --region 13 --closing-within 30
+  python search.py query 医療機関 --category medical --open --format jsonl
+"""
+import argparse, csv, json, os, sys
+
+from grants_harvester.search import SearchIndex
+from grants_harvester.sink import CSV_HEADER
+from grants_harvester.util.fetch import CACHE_DIR
+
+DEFAULT_INDEX = os.path.join(CACHE_DIR, "search.sqlite")
+
+def _print_table(rows):
+    for r in rows:
+        print(f"{r.get('application_end') or '----------':10}  {r.get('region_code') or '':6}  "
+              f"{r.get('category') or '':7}  {r.get('title') or ''}\n{'':27}{r.get('url') or ''}")
+
+def main():
+    ap = argparse.ArgumentParser(description="Build and query the grants search index.")
+    ap.add_argument("--index", default=DEFAULT_INDEX, help="Path to the SQLite index.")
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    b = sub.add_parser("build", help="load new output into the index")
+    b.add_argument("--out", default="out", help="run.py output directory")
+    b.add_argument("--rebuild", action="store_true", help="reload grants_latest.jsonl from scratch")
+
+    q = sub.add_parser("query", help="search the index")
+    q.add_argument("text", nargs="*", help="terms (all must match title, summary or issuer)")
+    q.add_argument("--category", help="medical|care|dx|other")
+    q.add_argument("--region", help="region code prefix (13 matches 13 and 13-001)")
+    q.add_argument("--level", help="issuer_level (prefecture|municipality|national|agency)")
+    q.add_argument("--open", action="store_true", help="drop grants whose deadline has passed")
+    q.add_argument("--closing-within", type=int, metavar="DAYS", help="deadline within the next DAYS days")
+    q.add_argument("--sort", choices=["end", "recent"], help="deadline first, or last added/changed first")
+    q.add_argument("--limit", type=int, default=50, help="0 for no limit")
+    q.add_argument("--format", choices=["table", "jsonl", "csv"], default="table")
+    args = ap.parse_args()
+
+    index = SearchIndex(args.index)
+    try:
+        if args.command == "build":
+            try:
+                c = index.build(args.out, rebuild=args.rebuild)
+            except FileNotFoundError as e:
+                print(f"Error: {e}")
+                sys.exit(1)
+            print(f"[INFO] Index: {c['loaded']} loaded, {c['new']} new, {c['changed']} changed, "
+                  f"{c['expired']} expired from {c['files']} delta files -> {index.count()} records in {args.index}")
+            return
+        rows = index.search(" ".join(args.text), category=args.category, region=args.region, level=args.level,
+                            open_only=args.open, closing_within=args.closing_within, sort=args.sort,
+                            limit=args.limit or None)
+    finally:
+        index.close()
+    if args.format == "jsonl":
+        for r in rows:
+            print(json.dumps(r, ensure_ascii=False))
+    elif args.format == "csv":
+        w = csv.writer(sys.stdout)
+        w.writerow(CSV_HEADER)
+        w.writerows([r.get(c) for c in CSV_HEADER] for r in rows)
+    else:
+        _print_table(rows)
+        print(f"({len(rows)} results)", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
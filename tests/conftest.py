@@ -0,0 +1,64 @@
+import os, sys, tempfile, threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# CACHE_DIR は import 時に決まるため、パッケージを読み込む前に一時ディレクトリへ向ける
+os.environ.setdefault("GRANTS_CACHE_DIR", tempfile.mkdtemp(prefix="grants-test-"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    extensions_map = {**SimpleHTTPRequestHandler.extensions_map, ".html": "text/html; charset=utf-8"}
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def site(tmp_path):
+    """A local HTTP server over `site.root` (a temp dir); `site.url(path)` gives URLs."""
+    root = tmp_path / "www"
+    root.mkdir()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(_QuietHandler, directory=str(root)))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    class Site:
+        def url(self, path: str) -> str:
+            return f"http://127.0.0.1:{server.server_port}/{path.lstrip('/')}"
+
+    s = Site()
+    s.root = root
+    try:
+        yield s
+    finally:
+        server.shutdown()
+        server.server_close()
+
+@pytest.fixture
+def harvest_env(tmp_path, monkeypatch):
+    """Points run_pipeline at stores of its own and returns a function writing a
+    sources.yaml (with politeness and scheduling off) for the given sources."""
+    import yaml
+    from grants_harvester import pipeline
+    cache = tmp_path / "cache"
+    monkeypatch.setattr(pipeline, "RECORD_DB", str(cache / "records.sqlite"))
+    monkeypatch.setattr(pipeline, "STATE_DB", str(cache / "fetch_state.sqlite"))
+    monkeypatch.setattr(pipeline, "BODY_CACHE_DIR", str(cache / "bodies"))
+    keywords = tmp_path / "keywords.yaml"
+    keywords.write_text(yaml.safe_dump({"categories": {"care": {"介護": 2.0}}}, allow_unicode=True),
+                        encoding="utf-8")
+
+    def write_config(sources, **overrides) -> str:
+        conf = {"min_interval_sec": 0, "throttle": {"respect_robots": False, "retries": 0},
+                "refresh": {"enabled": False}, "enrich": {"enabled": False},
+                "metrics": {"summary": str(cache / "run_summary.json")}, "sources": sources}
+        conf.update(overrides)
+        path = tmp_path / "sources.yaml"
+        path.write_text(yaml.safe_dump(conf, allow_unicode=True), encoding="utf-8")
+        return str(path)
+
+    write_config.keywords = str(keywords)
+    write_config.state_db = str(cache / "fetch_state.sqlite")
+    write_config.record_db = str(cache / "records.sqlite")
+    return write_config
@@ -0,0 +1,50 @@
+import sqlite3
+from urllib.parse import urlsplit
+
+import pytest
+
+from grants_harvester.dedup import canonical_url
+from grants_harvester.store import RecordStore
+
+@pytest.mark.parametrize("url, expected", [
+    ("http://[::1]:8080/x", "https://[::1]:8080/x"),
+    ("https://[2001:DB8::1]/hojo/index.html", "https://[2001:db8::1]/hojo/"),
+    ("http://[2001:db8::1]:80/a?utm_source=x&b=1", "https://[2001:db8::1]/a?b=1"),
+    ("http://user:pw@[::1]:8443/a#frag", "https://[::1]:8443/a"),
+    ("HTTP://Example.LG.jp:80/Hojo/index.html?b=2&a=1&fbclid=z", "https://example.lg.jp/Hojo/?a=1&b=2"),
+    ("http://127.0.0.1:8765/a.html", "https://127.0.0.1:8765/a.html"),
+])
+def test_canonical_url(url, expected):
+    assert canonical_url(url) == expected
+
+def test_canonical_ipv6_url_round_trips():
+    key = canonical_url("http://[::1]:8080/x")
+    parts = urlsplit(key)
+    assert (parts.hostname, parts.port) == ("::1", 8080)
+    assert canonical_url(key) == key
+
+@pytest.mark.parametrize("url", [
+    "http://[::1/a",              # 閉じていない角括弧
+    "http://[::1]:x/",
+    "http://example.com:port/a",
+    "http://example.com:99999/a",  # 範囲外のポート
+])
+def test_malformed_url_is_kept_as_is(url):
+    assert canonical_url(f" {url} ") == url
+
+def test_store_rekeying_keeps_malformed_keys(tmp_path):
+    path = str(tmp_path / "records.sqlite")
+    RecordStore(path).close()
+    conn = sqlite3.connect(path)
+    for key in ("http://[::1/a", "http://example.lg.jp/hojo/index.html"):
+        conn.execute("INSERT INTO records (key, fingerprint, record, first_seen, last_seen, last_changed) "
+                     "VALUES (?, '', '{}', '', '', '')", (key,))
+    conn.execute("PRAGMA user_version = 0")
+    conn.commit()
+    conn.close()
+
+    RecordStore(path).close()
+    conn = sqlite3.connect(path)
+    keys = {k for (k,) in conn.execute("SELECT key FROM records")}
+    conn.close()
+    assert keys == {"http://[::1/a", "https://example.lg.jp/hojo/"}
@@ -0,0 +1,61 @@
+import glob, json, os
+
+from grants_harvester import pipeline
+
+PAGE = """<html><head><title>{title}</title></head><body><main>
+<p>{title}の募集を行います。介護事業所を対象とします。</p>
+<p>募集期間 令和7年4月1日から令和7年5月30日まで。補助上限額 100万円、補助率 2分の1。</p>
+</main></body></html>"""
+
+def _latest(out_dir):
+    with open(os.path.join(out_dir, "grants_latest.jsonl"), encoding="utf-8") as f:
+        return {r["url"]: r for r in map(json.loads, f) if r}
+
+def test_enriched_record_survives_a_run_with_smaller_budget(site, harvest_env, tmp_path):
+    pages = {"kaigo/a.html": "介護ロボット導入支援事業", "kaigo/b.html": "介護職員処遇改善補助金"}
+    for path, title in pages.items():
+        (site.root / path).parent.mkdir(exist_ok=True)
+        (site.root / path).write_text(PAGE.format(title=title), encoding="utf-8")
+    (site.root / "sitemap.xml").write_text(
+        '<?xml version="1.0"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+        + "".join(f"<url><loc>{site.url(p)}</loc></url>" for p in pages) + "</urlset>", encoding="utf-8")
+    sources = [{"type": "sitemap", "url": site.url("sitemap.xml")}]
+    out = str(tmp_path / "out")
+
+    pipeline.run_pipeline(harvest_env(sources, enrich={"max_requests": 2}), harvest_env.keywords, out)
+    first = _latest(out)
+    assert {first[site.url(p)]["title"] for p in pages} == set(pages.values())
+    assert all(r["summary"] and r["amount"] for r in first.values())
+    deltas = glob.glob(os.path.join(out, "delta_*.jsonl"))
+
+    # 2回目は1件しか補完できない。もう1件は前回の内容のまま、差分も出ない
+    pipeline.run_pipeline(harvest_env(sources, enrich={"max_requests": 1}), harvest_env.keywords, out)
+    assert _latest(out) == first
+    assert glob.glob(os.path.join(out, "delta_*.jsonl")) == deltas
+
+    # 補完しない回が続いても同じ
+    pipeline.run_pipeline(harvest_env(sources, enrich={"enabled": False}), harvest_env.keywords, out)
+    assert _latest(out) == first
+
+def test_detail_page_over_size_cap_is_not_read(site, harvest_env, tmp_path):
+    (site.root / "kaigo").mkdir()
+    (site.root / "kaigo/a.html").write_text(PAGE.format(title="介護ロボット導入支援事業"), encoding="utf-8")
+    # 上限（約2KB）を超える詳細ページ
+    (site.root / "kaigo/b.html").write_text(PAGE.format(title="介護職員処遇改善補助金") + "<!--" + "x" * 8000 + "-->",
+                                            encoding="utf-8")
+    (site.root / "sitemap.xml").write_text(
+        '<?xml version="1.0"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+        + "".join(f"<url><loc>{site.url(p)}</loc></url>" for p in ("kaigo/a.html", "kaigo/b.html"))
+        + "</urlset>", encoding="utf-8")
+    config = harvest_env([{"type": "sitemap", "url": site.url("sitemap.xml")}],
+                         enrich={"max_page_mb": 0.002})
+    out = str(tmp_path / "out")
+    pipeline.run_pipeline(config, harvest_env.keywords, out)
+
+    latest = _latest(out)
+    assert latest[site.url("kaigo/a.html")]["summary"]
+    assert not latest[site.url("kaigo/b.html")]["summary"]
+    with open(tmp_path / "cache" / "run_summary.json", encoding="utf-8") as f:
+        summary = json.load(f)
+    assert summary["enrich"]["too_large"] == 1
+    assert summary["sources"]["(enrich)"]["counters"]["too_large"] == 1
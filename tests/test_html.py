@@ -0,0 +1,27 @@
+import json, os
+
+from grants_harvester import pipeline
+
+def _latest_urls(out_dir) -> set:
+    with open(os.path.join(out_dir, "grants_latest.jsonl"), encoding="utf-8") as f:
+        return {json.loads(line)["url"] for line in f if line.strip()}
+
+def test_malformed_links_do_not_abort_the_run(site, harvest_env, tmp_path, capsys):
+    (site.root / "list.html").write_text(
+        "<html><head><title>補助金一覧</title></head><body>"
+        '<a href="/kaigo/a.html">介護 補助金A</a>'
+        '<a href="http://example.com:port/b">介護 補助金B</a>'
+        '<a href="http://[::1/c">介護 補助金C</a>'
+        '<a href="http://[::1]:x/d">介護 補助金D</a>'
+        "</body></html>", encoding="utf-8")
+    config = harvest_env([{"type": "html", "urls": [site.url("list.html")]}],
+                         enrich={"max_requests": 10})
+    out = str(tmp_path / "out")
+    pipeline.run_pipeline(config, harvest_env.keywords, out)
+
+    # 不正なポートのリンクはそのままのURLをキーに出力し、解釈できないリンクだけ飛ばす
+    assert _latest_urls(out) == {site.url("list.html"), site.url("kaigo/a.html"),
+                                 "http://example.com:port/b", "http://[::1]:x/d"}
+    log = capsys.readouterr().out
+    assert "source failed" not in log
+    assert "'http://[::1/c': Invalid IPv6 URL" in log
@@ -0,0 +1,20 @@
+import json
+
+from grants_harvester import pipeline
+
+def test_robots_fetch_is_not_charged_to_the_source(site, harvest_env, tmp_path):
+    (site.root / "robots.txt").write_text("User-agent: *\nCrawl-delay: 0\n", encoding="utf-8")
+    (site.root / "rss.xml").write_text(
+        '<?xml version="1.0" encoding="utf-8"?><rss version="2.0"><channel><title>t</title>'
+        f"<item><title>介護職員処遇改善補助金の募集</title><link>{site.url('a.html')}</link></item>"
+        "</channel></rss>", encoding="utf-8")
+    config = harvest_env([{"type": "rss", "name": "rss", "url": site.url("rss.xml")}],
+                         throttle={"respect_robots": True, "retries": 0})
+    pipeline.run_pipeline(config, harvest_env.keywords, str(tmp_path / "out"))
+
+    with open(tmp_path / "cache" / "run_summary.json", encoding="utf-8") as f:
+        sources = json.load(f)["sources"]
+    assert sources["rss"]["counters"]["requests"] == 1
+    assert sources["rss"]["counters"]["changed"] == 1
+    assert sources["(robots)"]["counters"]["requests"] == 1
+    assert sources["(robots)"]["counters"]["changed"] == 1
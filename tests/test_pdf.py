@@ -0,0 +1,69 @@
+import json, os
+from concurrent.futures import Future
+
+from grants_harvester import pipeline
+from grants_harvester.harvesters import pdf
+from grants_harvester.util.cache import BodyCache
+from grants_harvester.util.fetch import HttpFetcher
+from grants_harvester.util.state import FetchStateStore
+
+def _summary(tmp_path, key):
+    with open(tmp_path / "cache" / "run_summary.json", encoding="utf-8") as f:
+        return json.load(f)["sources"][key]["counters"]
+
+def _latest_urls(out_dir) -> set:
+    with open(os.path.join(out_dir, "grants_latest.jsonl"), encoding="utf-8") as f:
+        return {json.loads(line)["url"] for line in f if line.strip()}
+
+def test_one_missing_pdf_does_not_fail_the_source(site, harvest_env, tmp_path, capsys):
+    (site.root / "a.pdf").write_bytes(b"%PDF-1.4 not really a PDF")
+    (site.root / "c.pdf").write_bytes(b"%PDF-1.4 not really a PDF either")
+    urls = [site.url("a.pdf"), site.url("missing.pdf"), site.url("c.pdf")]
+    config = harvest_env([{"type": "pdf", "title_hint": "介護職員処遇改善補助金", "urls": urls}])
+    out = str(tmp_path / "out")
+    pipeline.run_pipeline(config, harvest_env.keywords, out)
+
+    assert _latest_urls(out) == {site.url("a.pdf"), site.url("c.pdf")}
+    counters = _summary(tmp_path, f"pdf:{urls[0]}")
+    assert counters["failed_urls"] == 1 and "failed" not in counters
+    assert "missing.pdf: 404" in capsys.readouterr().out
+
+    # すべて失敗したときはソースの失敗になり、前回のレコードは残る
+    for name in ("a.pdf", "c.pdf"):
+        (site.root / name).unlink()
+    pipeline.run_pipeline(config, harvest_env.keywords, out)
+    assert _latest_urls(out) == {site.url("a.pdf"), site.url("c.pdf")}
+    assert _summary(tmp_path, f"pdf:{urls[0]}")["failed"] == 1
+
+class _DoneExtractor:
+    max_bytes = None
+
+    def submit(self, path, **kwargs) -> Future:
+        fut = Future()
+        fut.set_result("募集期間 令和7年4月1日から令和7年5月30日まで。")
+        return fut
+
+def test_records_stream_while_pdfs_are_still_downloading(site, tmp_path, monkeypatch):
+    for i in range(4):
+        (site.root / f"p{i}.pdf").write_bytes(b"%PDF-1.4")
+    urls = [site.url("p0.pdf"), site.url("missing.pdf")] + [site.url(f"p{i}.pdf") for i in range(1, 4)]
+    monkeypatch.setattr(pdf, "default_extractor", _DoneExtractor)
+    fetcher = HttpFetcher(respect_robots=False, retries=0, state=FetchStateStore(str(tmp_path / "state.sqlite")),
+                          body_cache=BodyCache(str(tmp_path / "bodies")))
+    downloaded = []
+    download_many = fetcher.download_many
+
+    def tracking(*args, **kwargs):
+        for u, dl in download_many(*args, **kwargs):
+            downloaded.append(u)
+            yield u, dl
+
+    monkeypatch.setattr(fetcher, "download_many", tracking)
+    try:
+        records = pdf.PdfHarvester(fetcher, lambda text: None, {"urls": urls}).harvest()
+        assert next(records).url == urls[0]
+        assert downloaded == urls[:1]
+        # 失敗したURLはその場で飛ばし、残りは URL の順
+        assert [r.url for r in records] == urls[2:]
+    finally:
+        fetcher.close()
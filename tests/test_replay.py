@@ -0,0 +1,37 @@
+import os, sys
+
+import pytest
+
+import run
+
+def _run(monkeypatch, *argv):
+    monkeypatch.setattr(sys, "argv", ["run.py", *argv])
+    run.main()
+
+def _snapshot(root) -> dict:
+    files = {}
+    for d, _, names in os.walk(root):
+        for name in names:
+            path = os.path.join(d, name)
+            with open(path, "rb") as f:
+                files[os.path.relpath(path, root)] = f.read()
+    return files
+
+def test_replay_leaves_production_out_untouched(site, harvest_env, tmp_path, monkeypatch):
+    (site.root / "rss.xml").write_text(
+        '<?xml version="1.0" encoding="utf-8"?><rss version="2.0"><channel><title>t</title>'
+        f"<item><title>介護職員処遇改善補助金の募集</title><link>{site.url('a.html')}</link></item>"
+        "</channel></rss>", encoding="utf-8")
+    config = harvest_env([{"type": "rss", "url": site.url("rss.xml")}])
+    monkeypatch.chdir(tmp_path)
+    args = ("--sources", config, "--keywords", harvest_env.keywords)
+    _run(monkeypatch, *args, "--record")
+    before = _snapshot("out")
+    assert "grants_latest.jsonl" in before
+
+    for out in ((), ("--out", "out"), ("--out", "./out/")):
+        with pytest.raises(SystemExit):
+            _run(monkeypatch, *args, "--replay", "out/archive", *out)
+    _run(monkeypatch, *args, "--replay", "out/archive", "--out", "out_replay")
+    assert os.path.exists("out_replay/grants_latest.jsonl")
+    assert _snapshot("out") == before
@@ -0,0 +1,47 @@
+import glob, os
+
+import pytest
+
+from grants_harvester import pipeline, sink as sink_module
+from grants_harvester.schema import GrantOpportunity
+from grants_harvester.sink import OutputSink
+
+def _record():
+    return GrantOpportunity(title="介護ロボット導入支援事業", url="https://example.lg.jp/a.html",
+                            issuer_name=None, issuer_level=None, region_code=None, category="care",
+                            summary=None, source_type="RSS", fetched_at="2025-04-01T00:00:00+00:00")
+
+@pytest.mark.parametrize("ts", [None, "20250401T000000Z"])
+def test_stale_parquet_is_removed_when_not_written(tmp_path, ts):
+    stale = tmp_path / "grants_latest.parquet"
+    stale.write_bytes(b"PAR1 from an earlier --parquet run")
+    sink = OutputSink(str(tmp_path), ts=ts, dedupe=False)
+    sink.add(_record())
+    paths = sink.close()
+    assert not stale.exists()
+    assert not paths.get("parquet")
+    for name in ("grants_latest.jsonl", "grants_latest.csv", "grants_latest_ja.csv"):
+        assert (tmp_path / name).exists()
+    assert not [f for f in os.listdir(tmp_path) if f.endswith(".tmp")]
+
+def test_snapshot_run_publishes_latest_once(site, harvest_env, tmp_path, monkeypatch):
+    (site.root / "rss.xml").write_text(
+        '<?xml version="1.0" encoding="utf-8"?><rss version="2.0"><channel><title>t</title>'
+        f"<item><title>介護職員処遇改善補助金の募集</title><link>{site.url('a.html')}</link></item>"
+        "</channel></rss>", encoding="utf-8")
+    # latest への差し替え（compact の os.replace とスナップショットの publish）を数える
+    replaced = []
+
+    def counting(fn):
+        def run(src, dst):
+            replaced.append(os.path.basename(dst))
+            fn(src, dst)
+        return run
+
+    monkeypatch.setattr(sink_module, "publish", counting(sink_module.publish))
+    monkeypatch.setattr(sink_module.os, "replace", counting(os.replace))
+    out = tmp_path / "out"
+    pipeline.run_pipeline(harvest_env([{"type": "rss", "url": site.url("rss.xml")}]),
+                          harvest_env.keywords, str(out), snapshot=True)
+    assert len(glob.glob(str(out / "grants_2*.jsonl"))) == 1
+    assert replaced.count("grants_latest.jsonl") == 1
@@ -0,0 +1,80 @@
+import json, os
+
+import pytest
+
+from grants_harvester import pipeline
+from grants_harvester.store import RecordStore
+from grants_harvester.util.state import FetchStateStore
+
+def _sitemap(site, pages):
+    urls = "".join(f"<url><loc>{site.url(p)}</loc><lastmod>{lm}</lastmod></url>" for p, lm in pages)
+    path = site.root / "sitemap.xml"
+    mtime = path.stat().st_mtime + 10 if path.exists() else None
+    path.write_text(
+        f'<?xml version="1.0"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{urls}</urlset>',
+        encoding="utf-8")
+    if mtime is not None:
+        # Last-Modified は秒単位なので、書き換えたことが条件付き取得で分かるようにする
+        os.utime(path, (mtime, mtime))
+
+def _latest_urls(out_dir) -> set:
+    with open(os.path.join(out_dir, "grants_latest.jsonl"), encoding="utf-8") as f:
+        return {json.loads(line)["url"] for line in f if line.strip()}
+
+def _watermark(env, site):
+    state = FetchStateStore(env.state_db)
+    try:
+        return state.get_watermark(f"sitemap:{site.url('sitemap.xml')}")
+    finally:
+        state.close()
+
+def test_watermark_not_advanced_when_run_is_rolled_back(site, harvest_env, tmp_path, monkeypatch):
+    _sitemap(site, [("kaigo/a.html", "2025-04-01"), ("kaigo/b.html", "2025-04-02")])
+    config = harvest_env([{"type": "sitemap", "url": site.url("sitemap.xml"), "incremental": True}])
+    out = str(tmp_path / "out")
+
+    def fail(self):
+        raise RuntimeError("disk full")
+
+    with monkeypatch.context() as m:
+        m.setattr(RecordStore, "commit", fail)
+        with pytest.raises(RuntimeError):
+            pipeline.run_pipeline(config, harvest_env.keywords, out)
+    assert _watermark(harvest_env, site) is None
+
+    # 次の実行でも同じURLが出て、確定後に基準時刻が進む
+    pipeline.run_pipeline(config, harvest_env.keywords, out)
+    assert _latest_urls(out) == {site.url("kaigo/a.html"), site.url("kaigo/b.html")}
+    assert _watermark(harvest_env, site).startswith("2025-04-02")
+
+    # 以降は新しい <lastmod> のURLだけ
+    _sitemap(site, [("kaigo/a.html", "2025-04-01"), ("kaigo/c.html", "2025-05-01")])
+    pipeline.run_pipeline(config, harvest_env.keywords, out)
+    assert site.url("kaigo/c.html") in _latest_urls(out)
+    assert _watermark(harvest_env, site).startswith("2025-05-01")
+
+def test_child_sitemaps_are_parsed_from_disk_with_size_cap(site, harvest_env, tmp_path, monkeypatch, capsys):
+    import gzip
+    from grants_harvester.util.fetch import HttpFetcher
+
+    def urlset(pages):
+        return ('<?xml version="1.0"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+                + "".join(f"<url><loc>{site.url(p)}</loc></url>" for p in pages) + "</urlset>").encode()
+
+    (site.root / "small.xml.gz").write_bytes(gzip.compress(urlset(["kaigo/a.html", "kaigo/b.html"])))
+    # 圧縮しても 2KB を超える子サイトマップ
+    (site.root / "big.xml").write_bytes(urlset([f"kaigo/x{i:05d}.html" for i in range(200)]))
+    (site.root / "index.xml").write_text(
+        '<?xml version="1.0"?><sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+        f"<sitemap><loc>{site.url('small.xml.gz')}</loc></sitemap>"
+        f"<sitemap><loc>{site.url('big.xml')}</loc></sitemap></sitemapindex>", encoding="utf-8")
+
+    def no_buffered_get(self, *args, **kwargs):
+        raise AssertionError("sitemaps must be downloaded to disk, not buffered")
+
+    monkeypatch.setattr(HttpFetcher, "get_many", no_buffered_get)
+    config = harvest_env([{"type": "sitemap", "url": site.url("index.xml"), "max_mb": 0.002}])
+    out = str(tmp_path / "out")
+    pipeline.run_pipeline(config, harvest_env.keywords, out)
+    assert _latest_urls(out) == {site.url("kaigo/a.html"), site.url("kaigo/b.html")}
+    assert "big.xml: larger than" in capsys.readouterr().out
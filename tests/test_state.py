@@ -0,0 +1,30 @@
+from grants_harvester.util.state import FetchStateStore
+
+URL = "https://example.lg.jp/hojo/index.html"
+
+def _store(tmp_path) -> FetchStateStore:
+    return FetchStateStore(str(tmp_path / "fetch_state.sqlite"))
+
+def test_error_status_keeps_validators_and_hash(tmp_path):
+    state = _store(tmp_path)
+    assert state.record(URL, 200, etag='"v1"', last_modified="Mon, 01 Jan 2024 00:00:00 GMT",
+                        content_type="text/html", content_hash="h1")
+    for status in (503, 429):
+        assert not state.record(URL, status, latency_ms=12.0)
+        meta = state.get(URL)
+        assert meta["status"] == status
+        assert (meta["etag"], meta["last_modified"], meta["content_hash"]) == (
+            '"v1"', "Mon, 01 Jan 2024 00:00:00 GMT", "h1")
+    # 回復後の 304 も、同じ本文の 200 も変化にならない
+    assert not state.record(URL, 304, etag='"v1"')
+    assert not state.record(URL, 200, etag='"v1"', content_hash="h1")
+    assert state.get(URL)["status"] == 200
+
+def test_changed_after_error_only_when_body_differs(tmp_path):
+    state = _store(tmp_path)
+    state.record(URL, 200, etag='"v1"', content_hash="h1")
+    state.record(URL, 500)
+    state.flush()
+    reopened = _store(tmp_path)
+    assert reopened.get(URL)["content_hash"] == "h1"
+    assert reopened.record(URL, 200, etag='"v2"', content_hash="h2")
@@ -0,0 +1,63 @@
+import random, re, unicodedata
+
+import pytest
+
+from grants_harvester.util import text as T
+from grants_harvester.util.text import extract_fields, extract_money, extract_rate, parse_date_range
+
+_PERIODS = [re.compile(p) for p in T._PERIOD_PATTERNS]
+
+def _reference_period(s: str):
+    # 単一走査になる前の実装: パターンを優先度順に re.search し、最初に一致したものを使う
+    s = T.normalize_text(s)
+    for rank, pattern in enumerate(_PERIODS, 1):
+        m = pattern.search(s)
+        if m:
+            start, end = T._PERIOD_GROUPS[rank]
+            return T._iso(m, start), T._iso(m, end)
+    return None, None
+
+SAMPLES = [
+    ".7万円", ",500円", "補助額 .5億円", "上限 1,000.5万円", "最大 ５０万円（補助率 ２／３）",
+    "募集期間 令和7年4月1日から令和7年5月30日まで。補助上限額 100万円、補助率 2分の1。",
+    "申請期間：2025年4月1日～2025年5月31日", "受付開始 令和元年5月1日より", "～令和7年6月30日（必着）",
+    "2025年4月1日 - 2025年4月30日", "令和7年3月31日まで", "50%以内、最大3億円", "期間 ~ 2025年1月31日締切",
+    "補助率は1/2以内。..., 3万円", "", "該当なし",
+]
+
+_TOKENS = ["募集期間", "申請受付", "受付開始", "令和", "平成", "元", "7", "2025", "年", "4", "月", "1", "日",
+           "から", "まで", "より", "～", "~", "-", ":", "：", " ", "、", "。", ".", ",", "5", "万円", "円",
+           "億円", "最大", "/", "3", "分の", "%", "補助率", "必着", "締切", "開始", "１", "，", "．"]
+
+def _fuzz(n: int, seed: int = 12):
+    rnd = random.Random(seed)
+    for _ in range(n):
+        yield "".join(rnd.choice(_TOKENS) for _ in range(rnd.randint(1, 18)))
+
+def _check(s: str):
+    for first_only in (True, False):
+        fields = extract_fields(s, first_only=first_only)
+        assert fields.amount == extract_money(s), s
+        assert fields.rate == extract_rate(s), s
+        assert fields.period == _reference_period(s), s
+    assert parse_date_range(s) == _reference_period(s), s
+
+@pytest.mark.parametrize("s", SAMPLES)
+def test_single_scan_matches_individual_extractors(s):
+    _check(s)
+
+def test_single_scan_matches_individual_extractors_fuzzed():
+    for s in _fuzz(4000):
+        _check(s)
+
+def test_amount_starting_with_separator():
+    assert extract_fields(".7万円").amount == extract_money(".7万円") == ".7万円"
+
+_NFKC_TOKENS = ["か", "は", "ウ", "ｶ", "ﾊ", "ｳ", "゙", "゚", "ﾞ", "ﾟ", "゛", "゜", "ー", "ｰ", "補助",
+                "。", "、", "｡", "１", "Ａ", "é", "́", " ", "～", "㍻", "①", "ﾀﾞ"]
+
+def test_normalize_text_equals_full_nfkc_fuzzed():
+    rnd = random.Random(3)
+    for _ in range(4000):
+        s = "".join(rnd.choice(_NFKC_TOKENS) for _ in range(rnd.randint(1, 12)))
+        assert T.normalize_text(s) == unicodedata.normalize("NFKC", s), ascii(s)